@@ -0,0 +1 @@
+"""Benchmarks for the cross-linking pipeline; see benchmarks.run"""
@@ -0,0 +1,61 @@
+"""Compare two benchmark result files, e.g. from two commits.
+
+    python -m benchmarks.compare before.json after.json --threshold 1.2
+
+Prints the time and peak memory ratio of every stage present in both files
+and exits with status 1 when any stage got slower (or, with peak memory in
+both files, bigger) by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+# Stages faster than this are too noisy to flag
+MIN_SECONDS = 0.05
+
+def _key(result):
+    return result['site_type'], result['size'], result['stage']
+
+def compare(before, after, threshold=1.2, min_seconds=MIN_SECONDS):
+    """Rows of (site_type, size, stage, time ratio, memory ratio, regressed) for stages in both reports"""
+    previous = {_key(result): result for result in before['results']}
+    rows = []
+    for result in after['results']:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        time_ratio = result['seconds'] / old['seconds'] if old['seconds'] else None
+        memory_ratio = None
+        if old.get('peak_bytes') and result.get('peak_bytes') is not None:
+            memory_ratio = result['peak_bytes'] / old['peak_bytes']
+        regressed = bool(
+            (time_ratio is not None and time_ratio > threshold
+             and max(result['seconds'], old['seconds']) >= min_seconds)
+            or (memory_ratio is not None and memory_ratio > threshold)
+        )
+        rows.append(_key(result) + (time_ratio, memory_ratio, regressed))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="Flag stages whose time or memory grew by more than this factor")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    rows = compare(before, after, args.threshold)
+    for site_type, size, stage, time_ratio, memory_ratio, regressed in rows:
+        time_text = f'{time_ratio:6.2f}x' if time_ratio is not None else '      -'
+        memory_text = f'{memory_ratio:6.2f}x' if memory_ratio is not None else '      -'
+        print(f"{'!' if regressed else ' '} {site_type:<15} {size:>9} {stage:<36} time {time_text}  memory {memory_text}")
+    return 1 if any(row[-1] for row in rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Run the title fetcher against a local stand-in server.
+
+    python -m benchmarks.fetcher --pages 2000
+
+Serves pages from an aiohttp web.Application on 127.0.0.1 that cover the
+cases the fetcher handles: titles and <h1> fallbacks, 503s and 429s with a
+Retry-After in seconds or as an HTTP date, pages whose title lies beyond
+MAX_BODY_BYTES, PDFs and conditional requests answered with a 304. Exits
+with status 1 when a result differs from what the server should produce,
+then times fetching --pages plain pages.
+"""
+import argparse
+import asyncio
+import email.utils
+import json
+import sys
+import time
+
+from crosslinker.fetcher import MAX_BODY_BYTES, fetch_pages_async
+from crosslinker.report import RunReport
+
+ETAG = '"v1"'
+
+def make_app():
+    """Stand-in site; each retried route fails on its first request only"""
+    from aiohttp import web
+
+    requests = {}
+    def first_request(request):
+        requests[request.path] = requests.get(request.path, 0) + 1
+        return requests[request.path] == 1
+
+    def page(body):
+        return web.Response(text=f'<html><head>{body}</head><body></body></html>', content_type='text/html')
+
+    async def titled(request):
+        return page(f"<title>Page {request.match_info['number']} &amp; more</title>")
+
+    async def heading(request):
+        return web.Response(text='<html><body><h1> Heading only </h1></body></html>', content_type='text/html')
+
+    async def unavailable(request):
+        if first_request(request):
+            return web.Response(status=503)
+        return page('<title>Back again</title>')
+
+    async def throttled(request):
+        if first_request(request):
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        requests['throttled.retried'] = time.monotonic()
+        return page('<title>Throttled</title>')
+
+    async def throttled_until(request):
+        if first_request(request):
+            retry_at = email.utils.formatdate(time.time() + 2, usegmt=True)
+            return web.Response(status=429, headers={'Retry-After': retry_at})
+        requests['throttled_until.retried'] = time.monotonic()
+        return page('<title>Throttled until</title>')
+
+    async def large(request):
+        # Past the cap, so the fetcher stops reading before the title
+        filler = '<!--' + 'x' * MAX_BODY_BYTES + '-->'
+        return page(filler + '<title>Too far</title>')
+
+    async def pdf(request):
+        return web.Response(body=b'%PDF-1.4 <title>Not a page</title>', content_type='application/pdf')
+
+    async def cached(request):
+        if request.headers.get('If-None-Match') == ETAG:
+            return web.Response(status=304, headers={'ETag': ETAG})
+        return web.Response(text='<title>Cached</title>', content_type='text/html', headers={'ETag': ETAG})
+
+    app = web.Application()
+    app['requests'] = requests
+    app.add_routes([
+        web.get('/pages/{number}', titled),
+        web.get('/heading', heading),
+        web.get('/unavailable', unavailable),
+        web.get('/throttled', throttled),
+        web.get('/throttled-until', throttled_until),
+        web.get('/large', large),
+        web.get('/report.pdf', pdf),
+        web.get('/cached', cached),
+    ])
+    return app
+
+# Path -> (expected title, expected not_modified); None for a failed fetch
+EXPECTED = {
+    '/pages/1': ('Page 1 & more', False),
+    '/heading': ('Heading only', False),
+    '/unavailable': ('Back again', False),
+    '/throttled': ('Throttled', False),
+    '/throttled-until': ('Throttled until', False),
+    '/large': (None, False),
+    '/report.pdf': (None, False),
+    '/cached': (None, True),
+    '/missing': None,
+}
+
+async def check(base, report):
+    """Fetch every EXPECTED path and return a list of mismatches"""
+    started = time.monotonic()
+    urls = [base + path for path in EXPECTED]
+    results = await fetch_pages_async(urls, validators={base + '/cached': (ETAG, None)}, backoff=0.01,
+                                      report=report)
+    errors = []
+    for path, expected in EXPECTED.items():
+        page = results[base + path]
+        found = page and (page['title'], page['not_modified'])
+        if found != expected:
+            errors.append(f"{path}: expected {expected}, got {found}")
+    return errors, started
+
+async def run(pages, concurrency):
+    from aiohttp import web
+
+    app = make_app()
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    base = f'http://127.0.0.1:{port}'
+    try:
+        report = RunReport()
+        errors, started = await check(base, report)
+        requests = app['requests']
+        # Retry-After is 1 second, or an HTTP date 1-2 seconds ahead at whole-second precision
+        for path, least in [('throttled', 0.9), ('throttled_until', 0.9)]:
+            waited = requests.get(f'{path}.retried', started) - started
+            if waited < least:
+                errors.append(f"/{path}: retried after {waited:.2f}s, before its Retry-After")
+        expected_counts = {'fetch.retries': 3, 'fetch.not_html': 1, 'fetch.failed': 1, 'fetch.not_modified': 1}
+        for name, value in expected_counts.items():
+            if report.counters.get(name, 0) != value:
+                errors.append(f"{name}: expected {value}, got {report.counters.get(name, 0)}")
+
+        timing = None
+        if pages:
+            started = time.perf_counter()
+            results = await fetch_pages_async([f'{base}/pages/{i}' for i in range(pages)], concurrency=concurrency,
+                                              per_host=concurrency)
+            seconds = time.perf_counter() - started
+            fetched = sum(page is not None for page in results.values())
+            timing = {'pages': pages, 'fetched': fetched, 'seconds': round(seconds, 3),
+                      'pages_per_second': round(pages / seconds, 1)}
+            if fetched != pages:
+                errors.append(f"timed run: fetched {fetched} of {pages} pages")
+        return errors, report, timing
+    finally:
+        await runner.cleanup()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check and time the title fetcher against a local server")
+    parser.add_argument('--pages', type=int, default=1000, help="Plain pages to time fetching; 0 skips timing")
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    errors, report, timing = asyncio.run(run(args.pages, args.concurrency))
+    for error in errors:
+        print(f"! {error}")
+    print(json.dumps({'counters': report.counters, 'timing': timing}, indent=2))
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
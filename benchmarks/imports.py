@@ -0,0 +1,60 @@
+"""Check that importing the package stays fast and skips heavy dependencies.
+
+    python -m benchmarks.imports --budget 1.0
+
+Imports each module in a fresh interpreter, keeps the fastest of --repeat
+runs and exits with status 1 when a module takes longer than the budget or
+loads any of LAZY_MODULES, which are imported by the features that need
+them (similarity, title fetching, sitemap downloads) rather than up front.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# Only imported when a feature needs them
+LAZY_MODULES = ['nltk', 'sklearn', 'scipy', 'bs4', 'requests', 'aiohttp']
+
+DEFAULT_MODULES = ['crosslinker', 'crosslinker.cli']
+
+# Seconds; pandas alone takes about half of this
+DEFAULT_BUDGET = 1.0
+
+_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - started, 'modules': sorted(sys.modules)}}))
+'''
+
+def measure_import(module, repeat=3):
+    """(fastest import time in seconds, lazy modules loaded) for `module` in fresh interpreters"""
+    times = []
+    loaded = set()
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', _PROBE.format(module=module)],
+                                capture_output=True, text=True, check=True)
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        times.append(probe['seconds'])
+        loaded.update(name.split('.')[0] for name in probe['modules'])
+    return min(times), sorted(loaded.intersection(LAZY_MODULES))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check package import time and lazily imported dependencies")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help="Fail when a module takes longer than this many seconds to import")
+    parser.add_argument('--repeat', type=int, default=3, help="Imports per module; the fastest counts")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        seconds, loaded = measure_import(module, args.repeat)
+        over = seconds > args.budget
+        failed = failed or over or bool(loaded)
+        loaded_text = f"  loads {', '.join(loaded)}" if loaded else ''
+        print(f"{'!' if over or loaded else ' '} {module:<24} {seconds:6.3f}s (budget {args.budget:.3f}s){loaded_text}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
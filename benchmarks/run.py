@@ -0,0 +1,272 @@
+"""Time and memory-profile every pipeline stage on synthetic sitemaps.
+
+For each website type template and size, a sitemap is generated (see
+benchmarks.sitemaps) and run through the pipeline one stage at a time:
+
+- ingestion: load_sitemap over the sitemap index and its gzipped children
+- extract_url_components / categorize_page: the per-URL functions, on up to
+  --sample-limit URLs
+- decompose_urls / categorize_pages: their vectorized versions on all URLs
+- page_index: SegmentPrefixIndex over the page table
+- rule:<link_type>: each linking rule on its own, anchor text included
+- anchor_text: generate_varied_anchor_text for up to --sample-limit pages
+- plan: generate_link_plan for the whole plan
+- plan_parallel: the same with --workers processes (crosslinker.parallel)
+- plan_capped / plan_parallel_capped: both with max_links a tenth of the
+  plan; links_truncated counts links the parallel shards generated only for
+  the merge to cut, the overhead of applying max_links after sharding
+- anchor_text_bulk: fill_anchor_text over the whole plan
+- balancing: balance_link_distribution on the materialised plan
+- graph_metrics: degrees, orphans, click depth and PageRank of all pages with
+  the plan's links
+- existing_links: load_existing_links over the plan written as Parquet
+- plan_existing: generate_link_plan again with those links already on the
+  site, so every first choice is passed over
+- export_csv / export_excel / export_html / export_html_zip: on up to
+  --export-limit links
+
+Each stage is timed on its own. Unless --no-memory is given, it then runs a
+second time under tracemalloc to record its peak Python and numpy
+allocations; arrow_bytes is the pyarrow memory the stage left allocated.
+Results go to a JSON file that benchmarks.compare diffs between commits.
+
+    python -m benchmarks.run --sizes 1000 100000 --output bench_results.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # arrow_bytes is only reported with pyarrow
+    pa = None
+
+from crosslinker.anchors import fill_anchor_text
+from crosslinker.engine import (
+    LINKING_RULES,
+    SITE_TYPE_PATTERNS,
+    SegmentPrefixIndex,
+    balance_link_distribution,
+    build_page_table,
+    categorize_page,
+    categorize_pages,
+    decompose_urls,
+    extract_url_components,
+    generate_varied_anchor_text,
+    iter_link_records,
+    segment_columns,
+)
+from crosslinker.export import plan_to_csv, plan_to_excel, plan_to_html, plan_to_html_zip
+from crosslinker.graph import graph_metrics
+from crosslinker.inlinks import load_existing_links
+from crosslinker.plan import generate_link_plan
+from crosslinker.report import RunReport
+from crosslinker.sitemap import load_sitemap
+
+from .sitemaps import GENERATORS, generate_urls, write_sitemap
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_SAMPLE_LIMIT = 100_000
+DEFAULT_EXPORT_LIMIT = 100_000
+DEFAULT_WORKERS = 2
+
+def _arrow_bytes():
+    return pa.total_allocated_bytes() if pa is not None else 0
+
+def measure(function, memory=True):
+    """Run `function` and return (result, stats) with seconds and, with `memory`, peak bytes"""
+    gc.collect()
+    arrow_before = _arrow_bytes()
+    start = time.perf_counter()
+    result = function()
+    stats = {'seconds': round(time.perf_counter() - start, 6)}
+    stats['arrow_bytes'] = _arrow_bytes() - arrow_before
+
+    if memory:
+        # A second run, as tracing slows down Python code
+        del result
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = function()
+            stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, stats
+
+def git_commit():
+    """Commit of the working tree, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark_site(site_type, size, workdir, max_links, sample_limit=DEFAULT_SAMPLE_LIMIT,
+                   export_limit=DEFAULT_EXPORT_LIMIT, memory=True, seed=0, workers=DEFAULT_WORKERS, log=None):
+    """Run every stage for one template and size; returns a list of result dicts"""
+    log = log or (lambda message: None)
+    patterns = SITE_TYPE_PATTERNS[site_type]
+    results = []
+
+    def stage(name, function, items=None, **extra):
+        result, stats = measure(function, memory)
+        entry = {'site_type': site_type, 'size': size, 'stage': name, 'items': items, **extra, **stats}
+        if entry['items'] is None and hasattr(result, '__len__'):
+            entry['items'] = len(result)
+        results.append(entry)
+        log(f"{site_type:<15} {size:>9} {name:<36} {stats['seconds']:>9.3f}s"
+            + (f" {stats['peak_bytes'] / 2**20:>9.1f} MB" if 'peak_bytes' in stats else ''))
+        return result
+
+    directory = os.path.join(workdir, f"{site_type.replace('/', '-').replace(' ', '-').lower()}-{size}")
+    index_path = write_sitemap(generate_urls(site_type, size, seed=seed), directory)
+
+    df = stage('ingestion', lambda: load_sitemap(index_path))
+    addresses = df['Address']
+    sample = addresses.iloc[:sample_limit].tolist()
+
+    components = stage('extract_url_components', lambda: [extract_url_components(url) for url in sample])
+    stage('categorize_page', lambda: [categorize_page(parts, patterns) for parts in components])
+    decomposed = stage('decompose_urls', lambda: decompose_urls(addresses))
+    stage('categorize_pages', lambda: categorize_pages(decomposed['path'], patterns))
+
+    pages = build_page_table(df, patterns)
+    page_index = stage('page_index', lambda: SegmentPrefixIndex(pages), items=len(pages))
+
+    for rule in LINKING_RULES:
+        def run_rule(rule=rule):
+            random.seed(seed)
+            return list(iter_link_records(pages, page_index, max_links=max_links, linking_rules=[rule]))
+        stage(f"rule:{rule['source']}_to_{rule['target']}", run_rule)
+
+    rows = pages.iloc[:sample_limit]
+    segment_values = [rows[column].tolist() for column in segment_columns() if column in rows.columns]
+    def anchor_texts():
+        random.seed(seed)
+        return [
+            generate_varied_anchor_text(url, category, None, None,
+                                        segments=[values[i] for values in segment_values[:depth]])
+            for i, (url, category, depth) in enumerate(zip(rows['url'].tolist(), rows['category'].tolist(),
+                                                           rows['depth'].tolist()))
+        ]
+    stage('anchor_text', anchor_texts)
+
+    def plan():
+        random.seed(seed)
+        return generate_link_plan(df, patterns, max_links=max_links, pages=pages)
+    link_plan = stage('plan', plan)
+    links_df = link_plan.to_frame()
+    del link_plan
+
+    def parallel_plan(limit, report=None):
+        random.seed(seed)
+        return generate_link_plan(df, patterns, max_links=limit, pages=pages, workers=workers, report=report)
+    stage('plan_parallel', lambda: parallel_plan(max_links), workers=workers)
+
+    capped_links = max(1, len(links_df) // 10)
+    def capped_plan():
+        random.seed(seed)
+        return generate_link_plan(df, patterns, max_links=capped_links, pages=pages)
+    stage('plan_capped', capped_plan, max_links=capped_links)
+    truncated = {}
+    def parallel_capped_plan():
+        report = RunReport()
+        plan = parallel_plan(capped_links, report)
+        truncated['links'] = report.counters.get('links.truncated', 0)
+        return plan
+    stage('plan_parallel_capped', parallel_capped_plan, max_links=capped_links, workers=workers)
+    results[-1]['links_truncated'] = truncated['links']
+
+    stage('anchor_text_bulk', lambda: fill_anchor_text(links_df, pages, seed=seed), items=len(links_df))
+    stage('balancing', lambda: balance_link_distribution(links_df, seed=seed), items=len(links_df))
+    stage('graph_metrics', lambda: graph_metrics(pages['url'], links_df), items=len(links_df))
+
+    inlinks_path = os.path.join(directory, 'inlinks.parquet')
+    links_df[['source_page', 'target_page']].to_parquet(inlinks_path)
+    existing_links = stage('existing_links', lambda: load_existing_links(inlinks_path), items=len(links_df))
+    def plan_existing():
+        random.seed(seed)
+        return generate_link_plan(df, patterns, max_links=max_links, pages=pages, existing_links=existing_links)
+    stage('plan_existing', plan_existing)
+
+    exported = links_df.head(export_limit)
+    stage('export_csv', lambda: plan_to_csv(exported), items=len(exported))
+    stage('export_excel', lambda: plan_to_excel(exported), items=len(exported))
+    stage('export_html', lambda: plan_to_html(exported), items=len(exported))
+    stage('export_html_zip', lambda: plan_to_html_zip(exported), items=len(exported))
+    return results
+
+def run_benchmarks(site_types=None, sizes=None, max_links=10**9, sample_limit=DEFAULT_SAMPLE_LIMIT,
+                   export_limit=DEFAULT_EXPORT_LIMIT, memory=True, seed=0, workdir=None,
+                   workers=DEFAULT_WORKERS, log=None):
+    """Benchmark each site type at each size; returns the JSON-ready report"""
+    site_types = site_types or list(GENERATORS)
+    sizes = sizes or DEFAULT_SIZES
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'pyarrow': pa.__version__ if pa is not None else None,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'max_links': max_links,
+            'sample_limit': sample_limit,
+            'export_limit': export_limit,
+            'seed': seed,
+            'workers': workers,
+        },
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory(prefix='crosslinker-bench-', dir=workdir) as scratch:
+        for site_type in site_types:
+            for size in sizes:
+                report['results'] += benchmark_site(site_type, size, scratch, max_links, sample_limit,
+                                                    export_limit, memory, seed, workers, log)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage on synthetic sitemaps")
+    parser.add_argument('--site-types', nargs='+', choices=sorted(GENERATORS), default=None,
+                        help="Website type templates (default: all)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                        help="Sitemap sizes in URLs (default: %(default)s)")
+    parser.add_argument('--max-links', type=int, default=10**9, help="max_links for the linking stages")
+    parser.add_argument('--sample-limit', type=int, default=DEFAULT_SAMPLE_LIMIT,
+                        help="URLs run through the per-URL reference functions (default: %(default)s)")
+    parser.add_argument('--export-limit', type=int, default=DEFAULT_EXPORT_LIMIT,
+                        help="Links exported to CSV, Excel and HTML (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Processes for the parallel plan stages (default: %(default)s)")
+    parser.add_argument('--no-memory', action='store_true', help="Only time the stages")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None, help="Where to write the synthetic sitemaps")
+    parser.add_argument('-o', '--output', default='bench_results.json', help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.site_types, args.sizes, args.max_links, args.sample_limit, args.export_limit,
+                            memory=not args.no_memory, seed=args.seed, workdir=args.workdir,
+                            workers=args.workers,
+                            log=lambda message: print(message, file=sys.stderr))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,163 @@
+"""Synthetic sitemaps shaped like each website type template.
+
+URLs follow the default patterns of SITE_TYPE_PATTERNS, so every category
+and linking rule of a template gets pages: a few root listing pages, a layer
+of primary listing pages, a majority of detail pages and some category and
+uncategorised pages. The same seed always gives the same URLs.
+
+    python -m benchmarks.sitemaps --site-type "Real Estate" --size 100000 -o /tmp/sitemap
+"""
+import argparse
+import gzip
+import os
+import random
+import string
+
+DEFAULT_DOMAIN = 'https://www.example.com'
+
+# URLs per child sitemap, the protocol's limit
+URLS_PER_SITEMAP = 50_000
+
+STATES = ['al', 'ak', 'az', 'ar', 'ca', 'co', 'ct', 'de', 'fl', 'ga', 'hi', 'id', 'il', 'in', 'ia', 'ks',
+          'ky', 'la', 'me', 'md', 'ma', 'mi', 'mn', 'ms', 'mo', 'mt', 'ne', 'nv', 'nh', 'nj', 'nm', 'ny',
+          'nc', 'nd', 'oh', 'ok', 'or', 'pa', 'ri', 'sc', 'sd', 'tn', 'tx', 'ut', 'vt', 'va', 'wa', 'wv',
+          'wi', 'wy']
+
+OTHER_PAGES = ['', 'about', 'contact', 'privacy-policy', 'terms', 'careers', 'press']
+
+# Distinct made-up words slugs are drawn from
+WORD_POOL_SIZE = 5_000
+
+def _word_pool(rng):
+    words = set()
+    while len(words) < WORD_POOL_SIZE:
+        words.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8))))
+    return sorted(words)
+
+def _slug(rng, words, count=2):
+    """`count` words of the pool joined with '-' (letters only, as listing patterns expect)"""
+    return '-'.join(rng.choices(words, k=count))
+
+def _real_estate(rng, words, size):
+    # About one city per 200 listings, at least one per state
+    cities = {state: [_slug(rng, words) for _ in range(max(1, size // (200 * len(STATES))))] for state in STATES}
+    for state, names in cities.items():
+        yield state
+        for city in names:
+            yield f'{state}/{city}'
+    for name in [_slug(rng, words) for _ in range(max(5, size // 5000))]:
+        yield f'metro-area/{name}'
+    for state in STATES:
+        yield f'coworking/{state}'
+    while True:
+        state = rng.choice(STATES)
+        yield f'{state}/{rng.choice(cities[state])}/{rng.randrange(10**7)}-{_slug(rng, words)}'
+
+def _ecommerce(rng, words, size):
+    yield 'shop'
+    departments = [_slug(rng, words, 1) for _ in range(max(5, size // 2000))]
+    for department in departments:
+        yield f'shop/{department}'
+    for category in [_slug(rng, words) for _ in range(max(10, size // 500))]:
+        yield f'category/{category}'
+    while True:
+        yield f'product/{_slug(rng, words, 3)}-{rng.randrange(10**6)}'
+
+def _blog(rng, words, size):
+    yield 'blog'
+    months = [(year, month) for year in range(2010, 2026) for month in range(1, 13)]
+    for year, month in months:
+        yield f'blog/{year}/{month:02d}'
+    for topic in [_slug(rng, words, 1) for _ in range(max(10, size // 1000))]:
+        yield f'category/{topic}'
+    while True:
+        year, month = rng.choice(months)
+        yield f'blog/{year}/{month:02d}/{_slug(rng, words, 4)}'
+
+def _local_business(rng, words, size):
+    yield 'locations'
+    yield 'services'
+    locations = [_slug(rng, words) for _ in range(max(5, size // 100))]
+    services = [_slug(rng, words) for _ in range(max(5, size // 1000))]
+    for location in locations:
+        yield f'locations/{location}'
+    while True:
+        if rng.random() < 0.2:
+            yield f'services/{rng.choice(services)}'
+        else:
+            yield f'locations/{rng.choice(locations)}/services/{rng.choice(services)}-{rng.randrange(10**5)}'
+
+def _custom(rng, words, size):
+    yield 'home'
+    for category in [_slug(rng, words) for _ in range(max(5, size // 500))]:
+        yield f'categories/{category}'
+    for collection in [_slug(rng, words) for _ in range(max(5, size // 1000))]:
+        yield f'collections/{collection}'
+    while True:
+        yield f'products/{_slug(rng, words, 3)}-{rng.randrange(10**6)}'
+
+GENERATORS = {
+    'Real Estate': _real_estate,
+    'E-commerce': _ecommerce,
+    'Blog/Content': _blog,
+    'Local Business': _local_business,
+    'Custom': _custom,
+}
+
+def generate_urls(site_type, size, seed=0, domain=DEFAULT_DOMAIN):
+    """Yield `size` unique URLs for one of the website type templates"""
+    rng = random.Random(f'{site_type}:{seed}')
+    paths = GENERATORS[site_type](rng, _word_pool(rng), size)
+    seen = set()
+    for path in OTHER_PAGES:
+        if len(seen) >= size:
+            return
+        seen.add(path)
+        yield f'{domain}/{path}'
+    for path in paths:
+        if len(seen) >= size:
+            return
+        if path not in seen:
+            seen.add(path)
+            yield f'{domain}/{path}'
+
+def write_sitemap(urls, directory, urls_per_sitemap=URLS_PER_SITEMAP, lastmod='2024-01-01', compress=True):
+    """Write URLs as gzipped child sitemaps plus a sitemap index; returns the index path"""
+    os.makedirs(directory, exist_ok=True)
+    children = []
+    urls = iter(urls)
+    while True:
+        batch = [url for _, url in zip(range(urls_per_sitemap), urls)]
+        if not batch:
+            break
+        name = f'sitemap-{len(children) + 1}.xml' + ('.gz' if compress else '')
+        opener = gzip.open if compress else open
+        with opener(os.path.join(directory, name), 'wt', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            f.writelines(f'<url><loc>{url}</loc><lastmod>{lastmod}</lastmod></url>\n' for url in batch)
+            f.write('</urlset>\n')
+        children.append(name)
+
+    index_path = os.path.join(directory, 'sitemap-index.xml')
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        f.writelines(f'<sitemap><loc>{name}</loc></sitemap>\n' for name in children)
+        f.write('</sitemapindex>\n')
+    return index_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic sitemap for a website type template")
+    parser.add_argument('--site-type', choices=sorted(GENERATORS), default='Real Estate')
+    parser.add_argument('--size', type=int, default=10_000, help="Number of URLs")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--domain', default=DEFAULT_DOMAIN)
+    parser.add_argument('-o', '--output', required=True, help="Directory to write the sitemaps to")
+    args = parser.parse_args(argv)
+    index_path = write_sitemap(generate_urls(args.site_type, args.size, args.seed, args.domain), args.output)
+    print(index_path)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,76 @@
+"""Headless cross-linking engine behind the MV Octopus Cross-linker app"""
+from .anchors import AnchorTextEngine, fill_anchor_text
+from .budget import LINK_ALLOCATIONS, PRIORITY_WEIGHTS, allocate_budget
+from .engine import (
+    BALANCE_MIN_OUTGOING,
+    BALANCE_RATIO,
+    BALANCE_REMOVAL_SHARE,
+    HIERARCHICAL_MATCHING,
+    LINK_COLUMNS,
+    LINKING_RULES,
+    SITE_TYPE_PATTERNS,
+    SegmentPrefixIndex,
+    balance_link_distribution,
+    build_page_table,
+    categorize_page,
+    categorize_pages,
+    decompose_urls,
+    extract_url_components,
+    generate_cross_links,
+    generate_varied_anchor_text,
+    get_appropriate_placements,
+    imbalanced_pages,
+    iter_cross_links,
+    iter_link_records,
+    link_budget,
+    prepare_link_generation,
+    prepare_pages,
+    test_patterns,
+)
+from .graph import LinkGraph, graph_metrics, graph_summary
+from .inlinks import LinkBloomFilter, LinkHashSet, iter_inlink_chunks, link_hashes, load_existing_links
+from .plan import LinkPlan, generate_link_plan, iter_link_chunks, iter_link_plans
+from .report import RunReport, report_tables
+from .similarity import SimilarityIndex, calculate_content_similarity
+from .export import (
+    EXPORT_FORMATS,
+    plan_to_csv,
+    plan_to_excel,
+    plan_to_html,
+    plan_to_html_zip,
+    write_excel,
+    write_html_report,
+    write_plan,
+)
+from .sources import (
+    fetch_page_metadata,
+    fetch_page_title,
+    infer_input_format,
+    load_columnar,
+    load_csv,
+    parse_xml_sitemap,
+    urls_from_text,
+)
+from .cache import PageMetadataCache, StageCache, content_key
+from .sitemap import iter_sitemap_chunks, load_sitemap
+from .incremental import (
+    diff_link_plans,
+    diff_page_tables,
+    diff_plan_files,
+    generate_incremental_links,
+    load_plan_state,
+    save_plan_state,
+)
+from .sink import (
+    SINK_FORMATS,
+    balance_plan,
+    convert_plan,
+    default_plan_extension,
+    infer_sink_format,
+    iter_plan,
+    open_link_sink,
+    plan_statistics,
+    read_plan,
+    read_plan_head,
+    write_link_chunks,
+)
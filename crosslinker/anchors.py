@@ -0,0 +1,199 @@
+"""Anchor text for link targets, computed once per target page.
+
+Popular targets such as city and state listing pages are linked from
+thousands of sources. AnchorTextEngine cleans each target's title and builds
+its variants the first time the page is linked, then hands the variants out
+in rotation: the k-th link to a page gets variant (offset + k) mod n, where
+the offset is a checksum of the seed and the variants. Each variant of a page
+is used as often as the others, give or take one, and a page starts its
+rotation at the same variant in every process.
+
+generate_varied_anchor_text (crosslinker.engine) builds the same variants
+for a single link and picks one with random.choice.
+"""
+import random
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Site names appended to page titles after a pipe or a dash
+TITLE_PIPE_SUFFIX = re.compile(r'\s*\|\s*.*$')
+TITLE_DASH_SUFFIX = re.compile(r'\s*-\s*.*$')
+
+# Longest cleaned title kept before it is cut short with '...'
+MAX_TITLE_LENGTH = 50
+
+# Title variants per target category; other categories use the title alone
+TITLE_TEMPLATES = {
+    'pdp': ['{}', 'View {}', 'Explore {}'],
+    'city_plp': ['{}', 'Browse {}', 'Explore {}'],
+    'state_plp': ['{}', 'Discover {}', 'Browse {}'],
+    'category_plp': ['{}', 'Shop {}', 'View all {}'],
+}
+
+def clean_title(title):
+    """Strip the site name after a pipe or dash and shorten long titles"""
+    clean = TITLE_DASH_SUFFIX.sub('', TITLE_PIPE_SUFFIX.sub('', title))
+    if len(clean) > MAX_TITLE_LENGTH:
+        clean = clean[:MAX_TITLE_LENGTH - 3] + "..."
+    return clean
+
+def title_variations(category, clean):
+    """Anchor text variants of a cleaned title for a target category"""
+    return [template.format(clean) for template in TITLE_TEMPLATES.get(category, ['{}'])]
+
+def url_anchor_text(category, segments):
+    """Anchor text from the URL's path segments, for pages without a title"""
+    if category == 'pdp':
+        # For property detail pages
+        if len(segments) >= 3:
+            property_id = segments[2]
+            # Extract address from property ID (e.g., "123456-main-st" -> "main st")
+            address_parts = property_id.split('-')
+            if len(address_parts) > 1:
+                address = ' '.join(address_parts[1:])
+                return address.title()
+        return "Property Details"
+
+    elif category == 'city_plp':
+        # For city listing pages
+        if len(segments) >= 2:
+            city = segments[1].replace('-', ' ').title()
+            return f"{city} Listings"
+        return "City Listings"
+
+    elif category == 'state_plp':
+        # For state listing pages
+        if len(segments) >= 1:
+            state = segments[0].upper()
+            return f"{state} Listings"
+        return "State Listings"
+
+    elif category == 'category_plp':
+        # For category listing pages
+        if len(segments) >= 1:
+            category_name = segments[0].replace('-', ' ').title()
+            return f"{category_name} Listings"
+        return "Category Listings"
+
+    # Default
+    return "View Listings"
+
+class AnchorTextEngine:
+    """Memoized, rotating anchor text for the pages of a page table
+
+    Pages are referred to by row position in the table built by
+    build_page_table. `seed` defaults to a draw from `random`, so seeded runs
+    give the same anchors. Texts are interned: `texts` lists each distinct
+    anchor once and anchor_codes returns positions in it.
+    """
+
+    def __init__(self, pages, seed=None):
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.categories = pages['category'].astype(object).tolist()
+        self.depths = pages['depth'].tolist()
+        # Missing titles (NaN in crawler exports) fall back to URL-based anchor text
+        self.titles = [None] * len(pages)
+        if 'title' in pages.columns:
+            self.titles = pages['title'].astype(object).where(pages['title'].notna(), None).tolist()
+        # (codes, values) per segment column; only the targets linked to are looked up
+        self.segments = []
+        for column in sorted(c for c in pages.columns if c.startswith('segment_')):
+            values = pages[column].astype('category')
+            self.segments.append((values.cat.codes.to_numpy(), values.cat.categories.astype(object).tolist()))
+        # Links handed out per page so far
+        self.counts = np.zeros(len(pages), dtype=np.int64)
+
+        self.texts = []
+        self._text_codes = {}
+        # Each page's variants are _variant_codes[start:start + size]
+        self._variant_codes = []
+        self._starts = np.full(len(pages), -1, dtype=np.int64)
+        self._sizes = np.zeros(len(pages), dtype=np.int64)
+        self._offsets = np.zeros(len(pages), dtype=np.int64)
+
+    def variants(self, row):
+        """Anchor text variants of a page, built on first use"""
+        start = int(self._starts[row])
+        if start < 0:
+            start = self._add_variants(row)
+        return [self.texts[code] for code in self._variant_codes[start:start + int(self._sizes[row])]]
+
+    def _add_variants(self, row):
+        title = self.titles[row]
+        category = self.categories[row]
+        if title:
+            variants = title_variations(category, clean_title(title))
+        else:
+            segments = [values[codes[row]] for codes, values in self.segments[:self.depths[row]]]
+            variants = [url_anchor_text(category, segments)]
+
+        start = len(self._variant_codes)
+        for text in variants:
+            code = self._text_codes.get(text)
+            if code is None:
+                code = self._text_codes[text] = len(self.texts)
+                self.texts.append(text)
+            self._variant_codes.append(code)
+        self._starts[row] = start
+        self._sizes[row] = len(variants)
+        self._offsets[row] = zlib.crc32('\n'.join([str(self.seed)] + variants).encode())
+        return start
+
+    def anchor(self, row):
+        """Anchor text of the next link to a page"""
+        start = int(self._starts[row])
+        if start < 0:
+            start = self._add_variants(row)
+        count = int(self.counts[row])
+        self.counts[row] = count + 1
+        choice = (int(self._offsets[row]) + count) % int(self._sizes[row])
+        return self.texts[self._variant_codes[start + choice]]
+
+    def anchor_codes(self, rows):
+        """Codes into `texts` of the anchors of links to `rows`, in order
+
+        Same as calling anchor for each row in turn, but vectorized: variants
+        are built for pages seen for the first time, then every link's
+        variant is picked with array operations.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        for row in unique_rows[self._starts[unique_rows] < 0].tolist():
+            self._add_variants(row)
+
+        # Occurrence of each link among the links to its page, counting earlier calls
+        occurrence = self.counts[rows] + pd.Series(rows).groupby(rows).cumcount().to_numpy()
+        self.counts[unique_rows] += np.bincount(inverse, minlength=len(unique_rows))
+        choice = (self._offsets[rows] + occurrence) % self._sizes[rows]
+        return np.asarray(self._variant_codes, dtype=np.int64)[self._starts[rows] + choice]
+
+    def anchor_texts(self, rows):
+        """Anchor texts of links to `rows` as a pandas Categorical"""
+        codes = self.anchor_codes(rows)
+        return pd.Categorical.from_codes(codes, categories=pd.Index(self.texts, dtype=object))
+
+def fill_anchor_text(links_df, pages, seed=None):
+    """Return a copy of a plan with anchor_text filled in from its target pages
+
+    `links_df` has URL strings in target_page, e.g. from generate_cross_links,
+    and `pages` is the page table the plan was generated from. Anchors rotate
+    over the plan in its order, as link generation assigns them, so a plan
+    as generated (before balancing) filled with the
+    anchor_seed of its run, passed to generation or recorded in its report,
+    gets the anchors it was generated with (for a URL listed twice in
+    `pages`, the rotation of its first row).
+    """
+    urls = pages['url']
+    first = ~urls.duplicated().to_numpy()
+    positions = pd.Index(urls[first]).get_indexer(links_df['target_page'])
+    if (positions < 0).any():
+        raise ValueError(f"{int((positions < 0).sum())} target pages are not in the page table")
+    rows = np.flatnonzero(first)[positions]
+    links_df = links_df.copy()
+    links_df['anchor_text'] = AnchorTextEngine(pages, seed).anchor_texts(rows)
+    return links_df
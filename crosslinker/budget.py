@@ -0,0 +1,59 @@
+"""Splitting the max_links budget across linking rules and source pages.
+
+With the default 'sequential' allocation rules take links in order until
+max_links is reached, so the first rules can use up the whole budget.
+'weighted' allocation splits max_links up front in proportion to each rule's
+weight: its 'weight' key, else PRIORITY_WEIGHTS of its priority. No rule gets
+more than the number of links it can produce, estimated from the page index
+(SegmentPrefixIndex.candidate_counts), and what a rule cannot use goes to the
+others. With per_source, each rule's quota is also spread evenly over its
+source pages, so a capped rule gives fewer links to every source page rather
+than all links to the first ones.
+"""
+import numpy as np
+
+LINK_ALLOCATIONS = ('sequential', 'weighted')
+
+# Weight of a rule in 'weighted' allocation, by priority
+PRIORITY_WEIGHTS = {'high': 3, 'medium': 2, 'low': 1}
+
+def rule_weight(rule, priority_weights=PRIORITY_WEIGHTS):
+    """A rule's share of the budget relative to other rules"""
+    return rule.get('weight', priority_weights.get(rule.get('priority'), 1))
+
+def allocate_budget(total, capacities, weights=None):
+    """Split `total` into integer quotas proportional to `weights`, each at most its capacity
+
+    Quotas add up to `total`, or to the summed capacity of entries with a
+    positive weight when that is smaller. Budget an entry cannot use is
+    shared among the others; links left over after rounding go to the
+    largest remainders, earlier entries first on ties.
+    """
+    capacities = np.maximum(np.asarray(capacities, dtype=np.int64), 0)
+    weights = np.ones(len(capacities)) if weights is None else np.asarray(weights, dtype=np.float64)
+    quotas = np.zeros(len(capacities), dtype=np.int64)
+    open_entries = (capacities > 0) & (weights > 0)
+    remaining = min(int(total), int(capacities[open_entries].sum()))
+
+    while remaining > 0 and open_entries.any():
+        entries = np.flatnonzero(open_entries)
+        shares = remaining * weights[entries] / weights[entries].sum()
+        full = shares >= capacities[entries]
+        if full.any():
+            # Entries whose share exceeds their capacity take it all; share the rest again
+            quotas[entries[full]] = capacities[entries[full]]
+            remaining -= int(capacities[entries[full]].sum())
+            open_entries[entries[full]] = False
+            continue
+        floors = np.floor(shares).astype(np.int64)
+        order = np.argsort(floors - shares, kind='stable')[:remaining - int(floors.sum())]
+        quotas[entries] = floors
+        quotas[entries[order]] += 1
+        break
+    return quotas
+
+def sequential_budget(total, capacities):
+    """Quotas of entries taking up to their capacity in order until `total` runs out"""
+    capacities = np.maximum(np.asarray(capacities, dtype=np.int64), 0)
+    before = np.cumsum(capacities) - capacities
+    return np.clip(total - before, 0, capacities)
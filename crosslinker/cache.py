@@ -0,0 +1,339 @@
+"""Caches: fetched page metadata on disk and pipeline stages in memory.
+
+PageMetadataCache is a persistent SQLite cache keyed on normalised URLs. It
+keeps the page title together with the HTTP validators (ETag, Last-Modified)
+and the sitemap lastmod seen when the page was fetched, so repeat runs only
+download pages that changed.
+
+StageCache is a bounded in-memory LRU of stage results (loaded inputs, page
+tables, indexes, plans) keyed by content_key over the stage's inputs, so an
+interactive session only recomputes the stages whose inputs changed. It is
+bounded by entries and by the estimated bytes of its values.
+"""
+import collections
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_PATH = '.crosslinker_cache.sqlite'
+
+# Entries younger than this are trusted without contacting the server
+DEFAULT_TTL = 7 * 24 * 3600
+
+# Entries older than this are dropped; the least recently used entries are
+# dropped beyond max_entries
+DEFAULT_MAX_AGE = 90 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2_000_000
+
+# SQLite's default limit on bound parameters is 999
+_BATCH_SIZE = 900
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url):
+    """Canonical cache key: lower-case scheme and host, no default port or fragment"""
+    try:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').lower()
+        if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+            host = f'{host}:{parts.port}'
+        return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+    except (AttributeError, ValueError):
+        return url
+
+class PageMetadataCache:
+    """SQLite-backed page metadata cache with TTL and size-based eviction"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_age=DEFAULT_MAX_AGE,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.stats = {'fresh': 0, 'lastmod_unchanged': 0, 'revalidated': 0, 'fetched': 0}
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS page_metadata (
+                url TEXT PRIMARY KEY,
+                title TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                sitemap_lastmod TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS page_metadata_accessed ON page_metadata (accessed_at)'
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM page_metadata').fetchone()[0]
+
+    def get_many(self, keys):
+        """Return a dict of normalised URL -> entry dict for the cached keys"""
+        keys = list(dict.fromkeys(keys))
+        entries = {}
+        for start in range(0, len(keys), _BATCH_SIZE):
+            batch = keys[start:start + _BATCH_SIZE]
+            rows = self.connection.execute(
+                'SELECT url, title, etag, last_modified, sitemap_lastmod, fetched_at FROM page_metadata '
+                f'WHERE url IN ({",".join("?" * len(batch))})',
+                batch
+            )
+            for url, title, etag, last_modified, sitemap_lastmod, fetched_at in rows:
+                entries[url] = {
+                    'title': title,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'sitemap_lastmod': sitemap_lastmod,
+                    'fetched_at': fetched_at,
+                }
+        return entries
+
+    def put_many(self, entries):
+        """Insert or replace entries given as a dict of normalised URL -> entry dict"""
+        now = time.time()
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO page_metadata '
+            '(url, title, etag, last_modified, sitemap_lastmod, fetched_at, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [
+                (url, entry.get('title'), entry.get('etag'), entry.get('last_modified'),
+                 entry.get('sitemap_lastmod'), entry.get('fetched_at', now), now)
+                for url, entry in entries.items()
+            ]
+        )
+        self.connection.commit()
+
+    def touch(self, keys):
+        """Mark entries as recently used without changing their contents"""
+        now = time.time()
+        self.connection.executemany('UPDATE page_metadata SET accessed_at = ? WHERE url = ?',
+                                    [(now, key) for key in keys])
+        self.connection.commit()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        if self.max_age is not None:
+            self.connection.execute('DELETE FROM page_metadata WHERE fetched_at < ?',
+                                    (time.time() - self.max_age,))
+        if self.max_entries is not None:
+            self.connection.execute(
+                'DELETE FROM page_metadata WHERE url IN ('
+                'SELECT url FROM page_metadata ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+        self.connection.commit()
+
+    def plan(self, urls, sitemap_lastmods=None):
+        """Split URLs into cached titles and the requests still needed
+
+        Returns (titles, validators, to_fetch): titles of URLs served from the
+        cache, conditional-request validators for stale entries, and the URLs
+        to request. An entry is served without a request while it is younger
+        than the TTL or when the sitemap lastmod it was fetched under is
+        unchanged.
+        """
+        sitemap_lastmods = sitemap_lastmods or {}
+        keys = {url: normalize_url(url) for url in urls}
+        entries = self.get_many(keys.values())
+        now = time.time()
+
+        titles, validators, to_fetch, served = {}, {}, [], []
+        for url, key in keys.items():
+            entry = entries.get(key)
+            lastmod = sitemap_lastmods.get(url)
+            if entry is not None and now - entry['fetched_at'] < self.ttl:
+                titles[url] = entry['title']
+                served.append(key)
+                self.stats['fresh'] += 1
+            elif entry is not None and lastmod and lastmod == entry['sitemap_lastmod']:
+                titles[url] = entry['title']
+                served.append(key)
+                self.stats['lastmod_unchanged'] += 1
+            else:
+                if entry is not None and (entry['etag'] or entry['last_modified']):
+                    validators[url] = (entry['etag'], entry['last_modified'])
+                to_fetch.append(url)
+        self.touch(served)
+        return titles, validators, to_fetch
+
+    def update(self, pages, sitemap_lastmods=None):
+        """Store fetch_pages results and return their titles
+
+        304 responses keep the cached title and only refresh its validators
+        and fetch time. Failed fetches are not cached.
+        """
+        sitemap_lastmods = sitemap_lastmods or {}
+        keys = {url: normalize_url(url) for url in pages}
+        previous = self.get_many(keys[url] for url, page in pages.items() if page and page['not_modified'])
+
+        titles, entries = {}, {}
+        for url, page in pages.items():
+            if page is None:
+                titles[url] = None
+                continue
+            key = keys[url]
+            if page['not_modified'] and key in previous:
+                cached = previous[key]
+                title = cached['title']
+                etag = page['etag'] or cached['etag']
+                last_modified = page['last_modified'] or cached['last_modified']
+                self.stats['revalidated'] += 1
+            else:
+                title, etag, last_modified = page['title'], page['etag'], page['last_modified']
+                self.stats['fetched'] += 1
+            titles[url] = title
+            entries[key] = {
+                'title': title,
+                'etag': etag,
+                'last_modified': last_modified,
+                'sitemap_lastmod': sitemap_lastmods.get(url),
+            }
+        self.put_many(entries)
+        return titles
+
+def content_key(*parts):
+    """Hex digest identifying stage inputs
+
+    Bytes and strings are hashed as they are, DataFrames and Series by their
+    contents, and anything else (e.g. a dict of parameters) by its JSON form.
+    Pass the key of an earlier stage as a part to chain stages.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            data = bytes(part)
+        elif isinstance(part, str):
+            data = part.encode('utf-8')
+        elif isinstance(part, (pd.DataFrame, pd.Series)):
+            data = pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes()
+            if isinstance(part, pd.DataFrame):
+                data += json.dumps([str(column) for column in part.columns]).encode('utf-8')
+        else:
+            data = json.dumps(part, sort_keys=True, default=str).encode('utf-8')
+        # Length-prefixed so ('ab', 'c') and ('a', 'bc') differ
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+# Stage results kept by a StageCache before the least recently used is dropped
+DEFAULT_STAGE_ENTRIES = 16
+DEFAULT_STAGE_BYTES = 2 * 2**30
+
+def estimated_size(value, _seen=None):
+    """Rough bytes held by a value
+
+    pandas objects are measured with memory_usage(deep=True) and numpy
+    arrays by nbytes; containers and objects add up what they hold, counting
+    each object once.
+    """
+    _seen = set() if _seen is None else _seen
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(estimated_size(item, _seen) for item in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimated_size(item, _seen) for item in value)
+    if hasattr(value, '__dict__'):
+        return sum(estimated_size(item, _seen) for item in vars(value).values())
+    return sys.getsizeof(value)
+
+class StageCache:
+    """Bounded LRU cache of pipeline stage results
+
+    Keys are (stage, content_key) pairs. Least recently used entries are
+    dropped beyond `max_entries` or once the values' estimated_size adds up
+    to more than `max_bytes` (None for no limit); the newest entry is always
+    kept. `on_evict`, if given, is called with each dropped value, e.g. to
+    delete a plan's files.
+    """
+
+    def __init__(self, max_entries=DEFAULT_STAGE_ENTRIES, on_evict=None, max_bytes=DEFAULT_STAGE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.bytes = 0
+        self._entries = collections.OrderedDict()
+        self._sizes = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, entry):
+        """Whether a (stage, key) pair is cached, without marking it used"""
+        return entry in self._entries
+
+    def get(self, stage, key, default=None):
+        """Cached value of a stage, marked as recently used"""
+        entry = (stage, key)
+        if entry not in self._entries:
+            self.stats['misses'] += 1
+            return default
+        self.stats['hits'] += 1
+        self._entries.move_to_end(entry)
+        return self._entries[entry]
+
+    def _over_limit(self):
+        if len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.bytes > self.max_bytes and len(self._entries) > 1
+
+    def _pop_oldest(self):
+        entry, evicted = self._entries.popitem(last=False)
+        self.bytes -= self._sizes.pop(entry)
+        if self.on_evict is not None:
+            self.on_evict(evicted)
+
+    def put(self, stage, key, value):
+        entry = (stage, key)
+        self.bytes -= self._sizes.get(entry, 0)
+        self._sizes[entry] = estimated_size(value)
+        self.bytes += self._sizes[entry]
+        self._entries[entry] = value
+        self._entries.move_to_end(entry)
+        while self._over_limit():
+            self.stats['evictions'] += 1
+            self._pop_oldest()
+
+    def get_or_compute(self, stage, key, compute):
+        """Cached value of a stage, else compute() stored under `key`"""
+        entry = (stage, key)
+        if entry in self._entries:
+            return self.get(stage, key)
+        self.stats['misses'] += 1
+        value = compute()
+        self.put(stage, key, value)
+        return value
+
+    def clear(self):
+        """Drop every entry, calling on_evict for each"""
+        while self._entries:
+            self._pop_oldest()
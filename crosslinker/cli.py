@@ -0,0 +1,255 @@
+"""Command line entry point: sitemap/CSV in, cross-linking plan out.
+
+Example:
+    python -m crosslinker https://example.com/sitemap.xml -o plan.csv --site-type "Real Estate"
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from .budget import LINK_ALLOCATIONS
+from .cache import DEFAULT_TTL, PageMetadataCache
+from .engine import (
+    BALANCE_MIN_OUTGOING,
+    BALANCE_RATIO,
+    BALANCE_REMOVAL_SHARE,
+    SITE_TYPE_PATTERNS,
+)
+from .export import EXPORT_FORMATS, EXPORT_WRITERS, HTML_PREVIEW_ROWS, plan_to_html
+from .graph import graph_metrics
+from .incremental import generate_incremental_links, load_plan_state, save_plan_state
+from .inlinks import DEFAULT_ERROR_RATE, iter_inlink_chunks, load_existing_links
+from .plan import iter_link_chunks
+from .report import NULL_REPORT, RunReport
+from .sink import (
+    SINK_FORMATS,
+    balance_plan,
+    convert_plan,
+    default_plan_extension,
+    infer_sink_format,
+    iter_plan,
+    plan_statistics,
+    read_plan_head,
+    write_link_chunks,
+)
+from .sitemap import is_sitemap_source, load_sitemap
+from .sources import fetch_page_metadata, infer_input_format, load_columnar, load_csv
+
+def load_input(source, log=None, indexable_only=False):
+    """Load a page table from a CSV, Parquet or Arrow file or a sitemap URL, file or directory"""
+    if is_sitemap_source(source):
+        return load_sitemap(source, log=log)
+    if infer_input_format(source) != 'csv':
+        return load_columnar(source, indexable_only=indexable_only)
+
+    return load_csv(source, indexable_only=indexable_only)
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='crosslinker',
+        description="Generate a cross-linking plan from a sitemap URL or crawler CSV export."
+    )
+    parser.add_argument('input', help="Sitemap URL, sitemap file (.xml, .xml.gz, .txt) or directory of "
+                                      "sitemaps, or a CSV, Parquet or Arrow (.arrow, .feather) page table "
+                                      "with an 'Address' column")
+    parser.add_argument('-o', '--output', required=True, help="Path of the plan to write")
+    parser.add_argument('--format', choices=sorted(set(EXPORT_FORMATS) | set(SINK_FORMATS)), default=None,
+                        help="Export format (default: inferred from the output extension, else csv)")
+    parser.add_argument('--indexable-only', action='store_true',
+                        help="Only keep input rows whose Indexability is 'Indexable'")
+    parser.add_argument('--site-type', choices=sorted(SITE_TYPE_PATTERNS), default='Custom',
+                        help="Website type template for the default URL patterns")
+    for category in ('pdp', 'city_plp', 'state_plp', 'category_plp'):
+        parser.add_argument(f"--{category.replace('_', '-')}-pattern", dest=f'{category}_pattern',
+                            help=f"Override the {category} URL pattern (regex)")
+    parser.add_argument('--max-links', type=int, default=500, help="Maximum number of links to generate")
+    parser.add_argument('--allocation', choices=LINK_ALLOCATIONS, default='sequential',
+                        help="How rules share --max-links: in rule order, or split up front by rule priority "
+                             "or weight (default: %(default)s)")
+    parser.add_argument('--per-source-budget', action='store_true',
+                        help="Spread each rule's share of --max-links evenly over its source pages")
+    parser.add_argument('--existing-links', metavar='PATH', default=None,
+                        help="Crawler 'All Inlinks' export (CSV, Parquet or Arrow) of the site's current links, "
+                             "which are never recommended")
+    parser.add_argument('--existing-links-capacity', type=int, default=None, metavar='N',
+                        help="Hold existing links in a Bloom filter sized for N links rather than an exact set: "
+                             "less memory, but a few new links may be passed over as existing")
+    parser.add_argument('--existing-links-error-rate', type=float, default=DEFAULT_ERROR_RATE,
+                        help="False positive rate of the Bloom filter at N links (default: %(default)g)")
+    parser.add_argument('--content-similarity', action='store_true',
+                        help="Rank targets by TF-IDF similarity of page titles (or URL words)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes generating hierarchical links, sharded by first path segment "
+                             "(0: one per CPU; default: %(default)s)")
+    parser.add_argument('--no-balance', action='store_true', help="Skip bidirectional link balancing")
+    parser.add_argument('--balance-ratio', type=float, default=BALANCE_RATIO,
+                        help="Balance pages with more than this many times as many outgoing as incoming "
+                             "links (default: %(default)g)")
+    parser.add_argument('--balance-min-outgoing', type=int, default=BALANCE_MIN_OUTGOING,
+                        help="...and more than this many outgoing links (default: %(default)s)")
+    parser.add_argument('--balance-share', type=float, default=BALANCE_REMOVAL_SHARE,
+                        help="Share of an imbalanced page's outgoing links removed from its low priority "
+                             "links (default: %(default)g)")
+    parser.add_argument('--fetch-titles', type=int, default=0, metavar='N',
+                        help="Fetch page titles for a sample of N pages before generating the plan")
+    parser.add_argument('--fetch-concurrency', type=int, default=32,
+                        help="Maximum title requests in flight")
+    parser.add_argument('--fetch-per-host', type=int, default=8,
+                        help="Maximum title requests in flight to a single host")
+    parser.add_argument('--cache', metavar='PATH', default=None,
+                        help="SQLite file caching fetched titles between runs")
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL / 3600, metavar='HOURS',
+                        help="Reuse cached titles younger than this without revalidating (default: %(default)g)")
+    parser.add_argument('--state', metavar='DIR', default=None,
+                        help="Directory holding the previous run; only pages affected by sitemap changes "
+                             "since then are recomputed")
+    parser.add_argument('--changes', metavar='PATH', default=None,
+                        help="Write a CSV change log of added, removed and updated links (with --state)")
+    parser.add_argument('--graph-metrics', metavar='PATH', default=None,
+                        help="Write a CSV of per-page link graph metrics (links, orphans, click depth from the "
+                             "homepage, PageRank) with the plan's links, and before them with --existing-links")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible sampling and anchor texts")
+    parser.add_argument('--report', metavar='PATH', default=None,
+                        help="Write a JSON run report of stage timings and counters ('-' for stdout)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only print errors")
+    return parser
+
+def infer_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    for export_format, (_, format_extension) in EXPORT_FORMATS.items():
+        if extension == format_extension:
+            return export_format
+    return infer_sink_format(path)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = RunReport() if args.report else None
+    try:
+        with (report or NULL_REPORT).span('total'):
+            return run(args, report)
+    finally:
+        # Written for failed runs too, as those are the ones worth a look
+        if args.report == '-':
+            print(report.to_json())
+        elif report is not None:
+            report.write(args.report)
+
+def run(args, report=None):
+    """Generate the plan for parsed command line arguments; returns the exit status"""
+    report = report or NULL_REPORT
+
+    def log(message):
+        if not args.quiet:
+            print(message, file=sys.stderr)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    url_patterns = dict(SITE_TYPE_PATTERNS[args.site_type])
+    for category in url_patterns:
+        override = getattr(args, f'{category}_pattern')
+        if override:
+            url_patterns[category] = override
+
+    try:
+        with report.span('load'):
+            df = load_input(args.input, log=log, indexable_only=args.indexable_only)
+    except Exception as e:
+        print(f"Error loading {args.input}: {e}", file=sys.stderr)
+        return 1
+    log(f"Loaded {len(df)} URLs from {args.input}")
+
+    existing_links = None
+    if args.existing_links:
+        try:
+            with report.span('existing_links'):
+                existing_links = load_existing_links(args.existing_links, capacity=args.existing_links_capacity,
+                                                     error_rate=args.existing_links_error_rate, log=log)
+        except Exception as e:
+            print(f"Error loading {args.existing_links}: {e}", file=sys.stderr)
+            return 1
+
+    if args.fetch_titles and 'Title' not in df.columns:
+        log(f"Fetching page titles (max {args.fetch_titles})...")
+        cache = PageMetadataCache(args.cache, ttl=args.cache_ttl * 3600) if args.cache else None
+        try:
+            with report.span('fetch_titles'):
+                df = fetch_page_metadata(df, sample_size=args.fetch_titles, max_workers=args.fetch_concurrency,
+                                         per_host=args.fetch_per_host, cache=cache, report=report)
+        finally:
+            if cache is not None:
+                cache.close()
+        if cache is not None:
+            log(f"Title cache: {cache.stats}")
+
+    export_format = args.format or infer_format(args.output)
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    with tempfile.TemporaryDirectory(prefix='.crosslinker-', dir=output_dir) as scratch:
+        # Links go to disk chunk by chunk; only the final export may load them
+        extension = default_plan_extension()
+        plan_path = os.path.join(scratch, 'generated' + extension)
+        if args.state:
+            previous_state = load_plan_state(args.state)
+            link_count, change_count, state = generate_incremental_links(
+                df, url_patterns, plan_path, previous_state, max_links=args.max_links,
+                use_content_similarity=args.content_similarity, log=log, workers=args.workers or None,
+                report=report, allocation=args.allocation, per_source=args.per_source_budget,
+                existing_links=existing_links, changes_path=args.changes, anchor_seed=args.seed
+            )
+            save_plan_state(args.state, state)
+            log(f"{change_count} link changes since the previous run")
+        else:
+            link_count = write_link_chunks(
+                iter_link_chunks(df, url_patterns, max_links=args.max_links,
+                                 use_content_similarity=args.content_similarity, log=log,
+                                 workers=args.workers or None, report=report,
+                                 allocation=args.allocation, per_source=args.per_source_budget,
+                                 existing_links=existing_links, anchor_seed=args.seed),
+                plan_path, report=report
+            )
+        if not link_count:
+            print("No links were generated. Check your URL patterns and make sure they match your data.",
+                  file=sys.stderr)
+            return 1
+
+        if not args.no_balance:
+            balanced_path = os.path.join(scratch, 'balanced' + extension)
+            link_count = balance_plan(plan_path, balanced_path, log=log, ratio=args.balance_ratio,
+                                      min_outgoing=args.balance_min_outgoing,
+                                      removal_share=args.balance_share, seed=args.seed, report=report)
+            plan_path = balanced_path
+
+        if args.graph_metrics:
+            with report.span('graph'):
+                # Non-200 pages are not part of the site's link graph
+                pages = df[df['Status Code'] == 200] if 'Status Code' in df.columns else df
+                # Before and after adding the plan to the site's current links, when given
+                metrics = graph_metrics(pages['Address'], iter_plan(plan_path, columns=['source_page', 'target_page']),
+                                        existing_links=iter_inlink_chunks(args.existing_links)
+                                        if args.existing_links else None)
+                metrics.to_csv(args.graph_metrics)
+            log(f"Wrote link graph metrics of {len(metrics)} pages to {args.graph_metrics}")
+
+        with report.span('export'):
+            if export_format in SINK_FORMATS:
+                if export_format == infer_sink_format(plan_path) == 'csv':
+                    os.replace(plan_path, args.output)
+                else:
+                    # Columnar exports are written with categorical URL and label columns
+                    convert_plan(plan_path, args.output, export_format, categorical=True)
+            elif export_format in EXPORT_WRITERS:
+                EXPORT_WRITERS[export_format](iter_plan(plan_path), args.output)
+            else:
+                # The single-page HTML report: only its preview is loaded, and
+                # the summary is counted over the whole plan
+                page = plan_to_html(read_plan_head(plan_path, HTML_PREVIEW_ROWS), plan_statistics(plan_path))
+                with open(args.output, 'w') as f:
+                    f.write(page)
+    report.count('links.written', link_count)
+    log(f"Wrote {link_count} links to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,939 @@
+"""Cross-linking engine: URL categorisation, linking rules and anchor text.
+
+This module has no Streamlit dependency so plans can be generated from batch
+jobs (see crosslinker.cli) as well as from the Streamlit app.
+"""
+import random
+import re
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from .anchors import AnchorTextEngine, clean_title, title_variations, url_anchor_text
+from .budget import LINK_ALLOCATIONS, allocate_budget, rule_weight, sequential_budget
+from .inlinks import pair_hashes, url_hashes
+from .report import NULL_REPORT
+from .similarity import SimilarityIndex, calculate_content_similarity
+from .sources import fetch_page_metadata
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow is optional; fall back to Python regexes
+    pa = None
+
+# Default URL patterns for each website type template
+SITE_TYPE_PATTERNS = {
+    "Real Estate": {
+        'pdp': r'[a-z]{2}/[a-z-]+/\d+',  # e.g., ca/los-angeles/123456-address
+        'city_plp': r'[a-z]{2}/[a-z-]+',  # e.g., ca/los-angeles
+        'state_plp': r'^[a-z]{2}$',  # e.g., ca
+        'category_plp': r'(coworking|metro-area)/',  # e.g., coworking/
+    },
+    "E-commerce": {
+        'pdp': r'product/[a-z0-9-]+',  # e.g., product/blue-t-shirt
+        'city_plp': r'shop/[a-z-]+',  # e.g., shop/mens-clothing
+        'state_plp': r'^shop$',  # e.g., shop
+        'category_plp': r'category/[a-z-]+',  # e.g., category/shirts
+    },
+    "Blog/Content": {
+        'pdp': r'blog/\d{4}/\d{2}/[a-z0-9-]+',  # e.g., blog/2023/01/article-title
+        'city_plp': r'blog/\d{4}/\d{2}',  # e.g., blog/2023/01
+        'state_plp': r'^blog$',  # e.g., blog
+        'category_plp': r'category/[a-z-]+',  # e.g., category/marketing
+    },
+    "Local Business": {
+        'pdp': r'services/[a-z0-9-]+',  # e.g., services/roof-repair
+        'city_plp': r'locations/[a-z-]+',  # e.g., locations/new-york
+        'state_plp': r'^locations$',  # e.g., locations
+        'category_plp': r'services$',  # e.g., services
+    },
+    "Custom": {
+        'pdp': r'products?/[a-z0-9-]+',
+        'city_plp': r'categor(y|ies)/[a-z-]+',
+        'state_plp': r'^(home|main|index)$',
+        'category_plp': r'collections?/[a-z-]+',
+    },
+}
+
+# Define linking rules
+LINKING_RULES = [
+    # PDP to PLP links
+    {'source': 'pdp', 'target': 'city_plp', 'max_targets': 1, 'priority': 'high', 'placement': 'breadcrumb'},
+    {'source': 'pdp', 'target': 'state_plp', 'max_targets': 1, 'priority': 'medium', 'placement': 'breadcrumb'},
+    {'source': 'pdp', 'target': 'category_plp', 'max_targets': 2, 'priority': 'medium', 'placement': 'sidebar'},
+    {'source': 'pdp', 'target': 'pdp', 'max_targets': 3, 'priority': 'medium', 'placement': 'related_properties'},
+    
+    # PLP to PDP links
+    {'source': 'city_plp', 'target': 'pdp', 'max_targets': 5, 'priority': 'high', 'placement': 'featured_section'},
+    {'source': 'state_plp', 'target': 'city_plp', 'max_targets': 10, 'priority': 'high', 'placement': 'main_content'},
+    {'source': 'category_plp', 'target': 'pdp', 'max_targets': 5, 'priority': 'medium', 'placement': 'featured_section'},
+    
+    # Added more comprehensive rules
+    {'source': 'category_plp', 'target': 'category_plp', 'max_targets': 5, 'priority': 'medium', 'placement': 'related_categories'},
+    {'source': 'city_plp', 'target': 'city_plp', 'max_targets': 3, 'priority': 'low', 'placement': 'nearby_cities'},
+    {'source': 'other', 'target': 'pdp', 'max_targets': 2, 'priority': 'low', 'placement': 'content_body'},
+    {'source': 'other', 'target': 'category_plp', 'max_targets': 2, 'priority': 'low', 'placement': 'sidebar'}
+]
+
+def extract_url_components(url):
+    """Extract components from a URL"""
+    try:
+        parsed_url = urlparse(url)
+        domain = parsed_url.netloc
+        path = parsed_url.path.strip('/')
+        path_segments = path.split('/')
+        
+        return {
+            'domain': domain,
+            'path': path,
+            'segments': path_segments,
+            'depth': len(path_segments),
+            'full_url': url
+        }
+    except:
+        return {
+            'domain': '',
+            'path': '',
+            'segments': [],
+            'depth': 0,
+            'full_url': url
+        }
+
+def categorize_page(url_components, patterns):
+    """Categorize a page based on its URL pattern"""
+    path = url_components['path']
+    
+    # Check each pattern to see if it matches
+    for category, pattern in patterns.items():
+        if isinstance(pattern, str) and re.search(pattern, path):
+            return category
+    
+    # Default category
+    return 'other'
+
+# Plain scheme://netloc/path URLs that urlparse splits without any special
+# handling (no whitespace, params or IPv6 brackets); anything else goes
+# through extract_url_components so both paths give identical results
+SIMPLE_URL_PATTERN = (
+    r'^[A-Za-z][A-Za-z0-9+.-]*://'
+    r'(?P<domain>[!-"$-.0-\x3e@-Z\\^-~]*)'
+    r'(?P<path>(?:/[^?#;\t\r\n]*)?)'
+    r'(?:[?#][^\t\r\n]*)?$'
+)
+
+def _arrow_strings(values):
+    """Contiguous arrow string array (pandas arrow-backed columns may be chunked)"""
+    array = pa.array(values, type=pa.string(), from_pandas=True)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array
+
+def _match_simple_urls(addresses):
+    """Split simple URLs into domain and path columns (None where not simple)
+    
+    Columns are arrow arrays when pyarrow is available, else object arrays.
+    """
+    if pa is not None:
+        try:
+            parts = pc.extract_regex(_arrow_strings(addresses), SIMPLE_URL_PATTERN)
+            matched = parts.is_valid()
+            return {name: pc.if_else(matched, parts.field(name), None) for name in ('domain', 'path')}
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            pass  # mixed/non-string values: use the Python path below
+    
+    pattern = re.compile(SIMPLE_URL_PATTERN)
+    matches = [pattern.match(url) if isinstance(url, str) else None for url in addresses]
+    return {name: np.array([match[name] if match else None for match in matches], dtype=object)
+            for name in ('domain', 'path')}
+
+# Leading path segments kept as columns of the page table; enough for the
+# hierarchical rules (2) and URL-based anchor text (3)
+MAX_URL_SEGMENTS = 3
+
+def segment_columns(max_segments=MAX_URL_SEGMENTS):
+    return [f'segment_{i}' for i in range(max_segments)]
+
+def _categorical(values, index=None):
+    """Build a pandas categorical from an arrow string array or object array"""
+    if pa is not None and isinstance(values, pa.Array):
+        encoded = pc.dictionary_encode(values)
+        codes = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+        return pd.Series(pd.Categorical.from_codes(codes, encoded.dictionary.to_pandas()), index=index)
+    return pd.Series(pd.Categorical(values), index=index)
+
+def _to_objects(values):
+    if pa is not None and isinstance(values, pa.Array):
+        return values.to_numpy(zero_copy_only=False).astype(object)
+    return values
+
+def _split_paths(paths, valid, max_segments):
+    """Strip paths and split off their depth and first segments"""
+    if pa is not None:
+        paths = pc.utf8_trim(_arrow_strings(paths), '/')
+        depth = pc.count_substring(paths, '/').to_numpy(zero_copy_only=False) + 1
+        segments = []
+        if max_segments:
+            split = pc.split_pattern(paths, '/', max_splits=max_segments)
+            offsets = split.offsets.to_numpy()[:-1]
+            lengths = pc.list_value_length(split).to_numpy(zero_copy_only=False)
+            for i in range(max_segments):
+                present = valid & (lengths > i)
+                positions = pa.array(np.where(present, offsets + i, 0), mask=~present)
+                segments.append(split.values.take(positions))
+        return pd.arrays.ArrowStringArray(paths), depth, segments
+    
+    paths = pd.Series(paths, dtype=object).str.strip('/')
+    depth = paths.str.count('/').to_numpy(dtype=np.int64) + 1
+    segments = []
+    if max_segments:
+        split = paths.str.split('/', n=max_segments, expand=True)
+        for i in range(max_segments):
+            column = split[i] if i in split.columns else pd.Series(None, index=paths.index, dtype=object)
+            segments.append(column.where(valid & (depth > i)).to_numpy(dtype=object))
+    return paths.to_numpy(dtype=object), depth, segments
+
+def decompose_urls(addresses, max_segments=MAX_URL_SEGMENTS):
+    """Vectorized extract_url_components over a Series of URLs
+    
+    Returns a DataFrame aligned with `addresses` with domain, path and depth
+    columns plus the first `max_segments` path segments as categorical
+    columns (NaN where the path is shallower).
+    """
+    addresses = pd.Series(addresses)
+    parts = _match_simple_urls(addresses)
+    domains, paths = parts['domain'], parts['path']
+    valid = np.ones(len(addresses), dtype=bool)
+    
+    # Fall back to urlparse for URLs outside the simple form
+    if pa is not None and isinstance(paths, pa.Array):
+        fallback = np.flatnonzero(paths.is_null().to_numpy(zero_copy_only=False))
+    else:
+        fallback = np.flatnonzero(pd.isna(paths))
+    if len(fallback):
+        domains, paths = _to_objects(domains), _to_objects(paths)
+    for i in fallback:
+        components = extract_url_components(addresses.iat[i])
+        domains[i] = components['domain']
+        paths[i] = components['path']
+        valid[i] = components['depth'] > 0
+    
+    paths, depth, segments = _split_paths(paths, valid, max_segments)
+    table = pd.DataFrame({
+        'domain': _categorical(domains, index=addresses.index),
+        'path': paths,
+        'depth': np.where(valid, depth, 0).astype(np.int32),
+    }, index=addresses.index)
+    for column, values in zip(segment_columns(max_segments), segments):
+        table[column] = _categorical(values, index=addresses.index)
+    
+    return table
+
+def url_paths(addresses):
+    """Vectorized extract_url_components(url)['path'] over a Series of URLs"""
+    return decompose_urls(addresses, max_segments=0)['path']
+
+def categorize_pages(paths, patterns):
+    """Vectorized categorize_page over a Series of URL paths
+    
+    Patterns are compiled once and tried in dict order against the pages not
+    matched so far, so the first matching pattern wins as in categorize_page.
+    Returns a categorical Series aligned with `paths`.
+    """
+    values = pd.Series(paths).to_numpy(dtype=object)
+    categories = np.full(len(values), 'other', dtype=object)
+    remaining = np.arange(len(values))
+    
+    for category, pattern in patterns.items():
+        if not isinstance(pattern, str) or len(remaining) == 0:
+            continue
+        search = re.compile(pattern).search
+        matched = np.fromiter((search(path) is not None for path in values[remaining]),
+                              dtype=bool, count=len(remaining))
+        categories[remaining[matched]] = category
+        remaining = remaining[~matched]
+    
+    category_names = [category for category in patterns if category != 'other'] + ['other']
+    return pd.Series(pd.Categorical(categories, categories=category_names),
+                     index=getattr(paths, 'index', None), name='category')
+
+def generate_varied_anchor_text(url, category, title=None, content_type=None, segments=None):
+    """Generate varied anchor text based on URL, category, and additional info
+    
+    `segments` are the URL's leading path segments when already known (e.g.
+    from the page table); otherwise the URL is parsed here. Picks one title
+    variant with random.choice; link generation uses AnchorTextEngine, which
+    builds the variants once per target page and rotates through them.
+    """
+    # If we have a title, use it as a base
+    if title:
+        return random.choice(title_variations(category, clean_title(title)))
+    
+    if segments is None:
+        segments = extract_url_components(url)['segments']
+    
+    # Fall back to URL-based anchor text generation
+    return url_anchor_text(category, segments)
+
+def get_appropriate_placements(source_category, target_category):
+    """Determine appropriate placements based on page categories"""
+    if source_category == 'pdp':
+        if target_category == 'city_plp' or target_category == 'state_plp':
+            return ['breadcrumb', 'footer_navigation']
+        elif target_category == 'category_plp':
+            return ['sidebar', 'related_categories']
+        else:
+            return ['related_properties', 'similar_properties']
+    
+    elif source_category in ['city_plp', 'state_plp', 'category_plp']:
+        if target_category == 'pdp':
+            return ['featured_properties', 'property_grid']
+        else:
+            return ['related_categories', 'subcategory_links']
+    
+    return ['content_body', 'sidebar']
+
+# Parent/child matching used by hierarchical linking rules:
+# (source, target) -> number of leading path segments that must match,
+# minimum target depth and whether the source page itself is excluded
+HIERARCHICAL_MATCHING = {
+    ('pdp', 'city_plp'): {'prefix_length': 2, 'min_depth': 2, 'exclude_self': False},
+    ('pdp', 'state_plp'): {'prefix_length': 1, 'min_depth': 1, 'exclude_self': False},
+    ('city_plp', 'pdp'): {'prefix_length': 2, 'min_depth': 2, 'exclude_self': False},
+    ('pdp', 'pdp'): {'prefix_length': 2, 'min_depth': 2, 'exclude_self': True},
+    ('state_plp', 'city_plp'): {'prefix_length': 1, 'min_depth': 2, 'exclude_self': False},
+    ('category_plp', 'category_plp'): {'prefix_length': 1, 'min_depth': 1, 'exclude_self': True},
+}
+
+class SegmentPrefixIndex:
+    """Index of a page table keyed on leading URL path segments.
+    
+    Pages are referred to by row position in the table built by
+    build_page_table. Buckets are built lazily, once per (category, prefix
+    length, minimum depth), and keep rows in their original order so
+    candidate lists match a full scan of the category.
+    """
+    
+    def __init__(self, pages):
+        self.pages = pages
+        self.urls = pages['url'].tolist()
+        self.depth = pages['depth'].to_numpy()
+        self.max_prefix_length = sum(1 for column in pages.columns if column.startswith('segment_'))
+        categories = pages['category'].to_numpy(dtype=object)
+        self.category_rows = {category: np.flatnonzero(categories == category)
+                              for category in pages['category'].cat.categories}
+        self._prefix_keys = {}
+        self._buckets = {}
+        self._positions = {}
+    
+    def rows(self, category):
+        """Row positions of the pages in a category, in table order"""
+        return self.category_rows.get(category, np.array([], dtype=np.int64))
+    
+    def prefix_keys(self, prefix_length):
+        """Dense integer key per row identifying its first `prefix_length` segments"""
+        if prefix_length > self.max_prefix_length:
+            raise ValueError(f"Page table only has {self.max_prefix_length} segment columns")
+        if prefix_length not in self._prefix_keys:
+            keys = np.zeros(len(self.pages), dtype=np.int64)
+            for i in range(prefix_length):
+                codes = self.pages[f'segment_{i}'].cat.codes.to_numpy(dtype=np.int64)
+                keys, _ = pd.factorize(keys * (codes.max(initial=0) + 2) + codes + 1)
+            self._prefix_keys[prefix_length] = keys
+        return self._prefix_keys[prefix_length]
+    
+    def _bucket_map(self, category, prefix_length, min_depth):
+        key = (category, prefix_length, min_depth)
+        if key not in self._buckets:
+            rows = self.rows(category)
+            rows = rows[self.depth[rows] >= min_depth]
+            keys = self.prefix_keys(prefix_length)[rows]
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(rows) else []
+            self._buckets[key] = dict(zip(sorted_keys[starts].tolist(), np.split(rows[order], starts[1:])))
+        return self._buckets[key]
+    
+    def lookup(self, category, source_row, prefix_length, min_depth=None):
+        """Return rows of a category sharing the first `prefix_length` segments of a source row"""
+        if min_depth is None:
+            min_depth = prefix_length
+        if self.depth[source_row] < prefix_length:
+            return []
+        buckets = self._bucket_map(category, prefix_length, min_depth)
+        return buckets.get(self.prefix_keys(prefix_length)[source_row], [])
+    
+    def candidates(self, category, source_row, max_targets,
+                   prefix_length, min_depth=None, exclude_self=False):
+        """Return the first `max_targets` rows matching a source row's prefix"""
+        bucket = self.lookup(category, source_row, prefix_length, min_depth)
+        if not exclude_self:
+            return list(bucket[:max_targets])
+        
+        source_url = self.urls[source_row]
+        targets = []
+        for row in bucket:
+            if len(targets) >= max_targets:
+                break
+            if self.urls[row] != source_url:
+                targets.append(row)
+        return targets
+    
+    def candidate_counts(self, category, source_rows, max_targets,
+                         prefix_length=None, min_depth=None, exclude_self=False):
+        """Number of targets each source row gets from candidates, or from sample without a prefix_length
+        
+        Counted from category and bucket sizes without drawing any targets;
+        a URL listed more than once counts as that many pages.
+        """
+        source_rows = np.asarray(source_rows, dtype=np.int64)
+        rows = self.rows(category)
+        in_category = np.isin(source_rows, rows)
+        if prefix_length is None:
+            # sample() leaves out the source page
+            available = len(rows) - in_category
+        else:
+            if min_depth is None:
+                min_depth = prefix_length
+            keys = self.prefix_keys(prefix_length)
+            buckets = self._bucket_map(category, prefix_length, min_depth)
+            sizes = np.zeros(keys.max(initial=-1) + 1, dtype=np.int64)
+            sizes[list(buckets)] = [len(bucket) for bucket in buckets.values()]
+            available = np.where(self.depth[source_rows] >= prefix_length, sizes[keys[source_rows]], 0)
+            if exclude_self:
+                available = available - (in_category & (self.depth[source_rows] >= min_depth))
+        return np.clip(available, 0, max_targets)
+    
+    def sample(self, category, source_row, max_targets, rng=None):
+        """Randomly sample rows of a category, excluding the source page.
+        
+        Draws the same indices as sampling from the filtered list would, so
+        the sequence of random choices is unchanged, without copying the
+        category for every source page. Draws come from `rng`, a
+        random.Random, or the `random` module when not given.
+        """
+        rng = rng or random
+        rows = self.rows(category)
+        if category not in self._positions:
+            positions = {}
+            for position, row in enumerate(rows):
+                positions.setdefault(self.urls[row], []).append(position)
+            self._positions[category] = positions
+        
+        excluded = self._positions[category].get(self.urls[source_row], [])
+        available = len(rows) - len(excluded)
+        if available <= 0:
+            return []
+        
+        targets = []
+        for index in rng.sample(range(available), min(max_targets, available)):
+            # Shift the filtered index past any excluded positions before it
+            for position in excluded:
+                if position <= index:
+                    index += 1
+                else:
+                    break
+            targets.append(rows[index])
+        return targets
+
+def build_page_table(df, url_patterns, max_segments=MAX_URL_SEGMENTS):
+    """Build the columnar page table used by the linking rules
+    
+    One row per page, in input order: url, domain, path, depth, the first
+    `max_segments` path segments, category and, when present in `df`, title
+    and content_type.
+    """
+    pages = decompose_urls(df['Address'].reset_index(drop=True), max_segments=max_segments)
+    pages.insert(0, 'url', df['Address'].to_numpy())
+    pages['category'] = categorize_pages(pages['path'], url_patterns)
+    
+    # Add title and content type if available
+    if 'Title' in df.columns:
+        pages['title'] = df['Title'].to_numpy()
+    if 'Content Type' in df.columns:
+        pages['content_type'] = df['Content Type'].to_numpy()
+    
+    return pages
+
+def _ignore(*args):
+    pass
+
+def _new_targets(draw, count, source_hash, page_hashes, existing_links):
+    """Up to `count` rows from draw(n), leaving out those the source already links to
+    
+    `draw` returns up to n candidate rows, the first ones of its candidates
+    or a random sample of them. Returns (rows, number of candidates left out
+    as existing links).
+    """
+    # Twice the rows to begin with, so one draw is usually enough, and twice
+    # as many again each time existing links crowd out the new ones
+    wanted = 2 * count
+    while True:
+        rows = draw(wanted)
+        if not len(rows):
+            return [], 0
+        existing = existing_links.contains(pair_hashes(source_hash, page_hashes[np.asarray(rows)]))
+        # A handful of rows per source: plain Python beats more numpy calls here
+        new = []
+        skipped = 0
+        for row, known in zip(rows, existing.tolist()):
+            if len(new) == count:
+                break
+            if known:
+                skipped += 1
+            else:
+                new.append(row)
+        if len(new) == count or len(rows) < wanted:
+            return new, skipped
+        wanted *= 2
+
+# Columns of a link record, in output order
+LINK_COLUMNS = ['source_page', 'target_page', 'link_type', 'anchor_text', 'placement', 'priority',
+                'position', 'relevance_score']
+
+# Links per chunk emitted by iter_link_chunks (see crosslinker.plan)
+DEFAULT_LINK_CHUNK_SIZE = 100_000
+
+def prepare_pages(df, url_patterns, fetch_titles=False, log=None, progress=None, report=None):
+    """Filter the input pages and categorise them into the page table
+    
+    Keeps pages with a 200 status code, fetches a sample of page titles with
+    `fetch_titles` and builds the table with build_page_table. Pass the
+    result as `pages` to reuse it for several plans.
+    """
+    log = log or _ignore
+    progress = progress or _ignore
+    report = report or NULL_REPORT
+    
+    # Ensure 'Address' column exists
+    if 'Address' not in df.columns:
+        raise ValueError("DataFrame must contain an 'Address' column with URLs")
+    
+    # Filter for 200 status code pages if the column exists
+    report.count('pages.input', len(df))
+    if 'Status Code' in df.columns:
+        report.count('pages.status_filtered', int((df['Status Code'] != 200).sum()))
+        df = df[df['Status Code'] == 200]
+        log(f"Processing {len(df)} pages with 200 status code")
+    else:
+        log(f"Processing {len(df)} pages (no status code filtering)")
+    
+    # Fetch page titles if requested and not already present
+    if fetch_titles and 'Title' not in df.columns:
+        log("Fetching page titles (sample)...")
+        with report.span('fetch_titles'):
+            df = fetch_page_metadata(
+                df,
+                sample_size=min(50, len(df)),
+                progress=lambda done, total: progress("Fetching page titles", done / total),
+                report=report
+            )
+    
+    # Categorize all pages
+    log("Categorizing pages...")
+    with report.span('categorize'):
+        return build_page_table(df, url_patterns)
+
+def prepare_link_generation(df, url_patterns, use_content_similarity=False, fetch_titles=False,
+                            log=None, progress=None, pages=None, report=None, page_index=None):
+    """Filter, categorise and index the input pages once before link generation
+    
+    Returns (pages, page_index, similarity): the page table, its
+    SegmentPrefixIndex and, with content similarity, its SimilarityIndex
+    (else None). `pages` (from prepare_pages or build_page_table) and
+    `page_index` (built over that table) skip those steps; see
+    iter_cross_links for the other options.
+    """
+    log = log or _ignore
+    report = report or NULL_REPORT
+    
+    if pages is None:
+        pages = prepare_pages(df, url_patterns, fetch_titles=fetch_titles, log=log, progress=progress,
+                              report=report)
+    
+    # Index target pages by URL path prefix once per run
+    if page_index is None:
+        with report.span('page_index'):
+            page_index = SegmentPrefixIndex(pages)
+    
+    # Vectorize page texts once for similarity ranking
+    similarity = None
+    if use_content_similarity:
+        log("Vectorizing page texts for content similarity...")
+        with report.span('similarity'):
+            similarity = SimilarityIndex.from_pages(pages)
+    
+    # Print category counts
+    log("Pages by category:")
+    for category, count in pages['category'].value_counts(sort=False).items():
+        log(f"- {category}: {count} pages")
+        report.count(f'pages.category.{category}', int(count))
+    
+    return pages, page_index, similarity
+
+def link_budget(page_index, linking_rules, max_links, allocation='sequential', per_source=False,
+                source_mask=None):
+    """Split max_links into a quota per rule and, with per_source, per source page
+    
+    Returns (quotas, caps): each rule's share of max_links under
+    `allocation` (see crosslinker.budget), from the number of links the index
+    says it can produce, and with per_source a list aligned with
+    `linking_rules` of arrays over the page table holding the links each page
+    may get from the rule (else None). `source_mask` restricts the source
+    pages as source_urls does.
+    """
+    if allocation not in LINK_ALLOCATIONS:
+        raise ValueError(f"Unknown link allocation: {allocation}")
+    
+    sources = []
+    capacities = []
+    for rule in linking_rules:
+        source_rows = page_index.rows(rule['source'])
+        if source_mask is not None:
+            source_rows = source_rows[source_mask[source_rows]]
+        match = HIERARCHICAL_MATCHING.get((rule['source'], rule['target']), {})
+        sources.append(source_rows)
+        capacities.append(page_index.candidate_counts(rule['target'], source_rows, rule['max_targets'], **match))
+    
+    totals = [int(capacity.sum()) for capacity in capacities]
+    if allocation == 'weighted':
+        quotas = allocate_budget(max_links, totals, [rule_weight(rule) for rule in linking_rules])
+    else:
+        quotas = sequential_budget(max_links, totals)
+    
+    caps = None
+    if per_source:
+        caps = []
+        for source_rows, capacity, quota in zip(sources, capacities, quotas):
+            rule_caps = np.zeros(len(page_index.depth), dtype=np.int64)
+            rule_caps[source_rows] = allocate_budget(quota, capacity)
+            caps.append(rule_caps)
+    return quotas.tolist(), caps
+
+def iter_link_records(pages, page_index, similarity=None, max_links=1000, linking_rules=None, log=None,
+                      progress=None, source_urls=None, workers=1, report=None, anchors=None,
+                      allocation='sequential', per_source=False, source_caps=None, existing_links=None,
+                      anchor_seed=None, rng=None):
+    """Generate links as compact records rather than dicts
+    
+    Yields (rule_index, source_row, target_row, anchor_text, position,
+    relevance_score) tuples, where rows index the page table and position is
+    0 for links outside a featured section. Takes the output of
+    prepare_link_generation; see iter_cross_links for the other options.
+    Anchor text comes from `anchors`, an AnchorTextEngine over `pages`, or
+    else one seeded with `anchor_seed`, drawn from `random` when not given
+    and recorded in the report as 'anchor_seed'. `source_caps`, per-page link limits
+    for each rule as link_budget returns them, replaces per_source.
+    Candidates in `existing_links` (see crosslinker.inlinks) are passed over
+    for the next ones before they count against max_targets or max_links.
+    Targets are sampled with `rng`, a random.Random, or the `random` module
+    when not given.
+    """
+    log = log or _ignore
+    progress = progress or _ignore
+    report = report or NULL_REPORT
+    if linking_rules is None:
+        linking_rules = LINKING_RULES
+    
+    if workers is None or workers > 1:
+        # Imported here: crosslinker.parallel builds on this module
+        from .parallel import iter_link_records_parallel
+        yield from iter_link_records_parallel(pages, page_index, similarity, max_links=max_links,
+                                              linking_rules=linking_rules, log=log, progress=progress,
+                                              source_urls=source_urls, workers=workers, report=report,
+                                              allocation=allocation, per_source=per_source,
+                                              existing_links=existing_links, anchor_seed=anchor_seed)
+        return
+    
+    # Only generate links from the requested source pages
+    source_mask = None
+    if source_urls is not None:
+        source_mask = pages['url'].isin(source_urls).to_numpy()
+    
+    # Rules take links in order until max_links unless the budget is split up front
+    quotas = None
+    if allocation != 'sequential' or per_source:
+        quotas, caps = link_budget(page_index, linking_rules, max_links, allocation, per_source, source_mask)
+        if source_caps is None:
+            source_caps = caps
+    
+    # Variants are built once per target page and rotated across its links
+    if anchors is None:
+        if anchor_seed is None:
+            anchor_seed = random.getrandbits(64)
+        report.record('anchor_seed', anchor_seed)
+        anchors = AnchorTextEngine(pages, anchor_seed)
+    
+    # Links are looked up in existing_links by the hashes of their page URLs
+    page_hashes = url_hashes(pages['url']) if existing_links is not None else None
+    
+    # Generate cross-links
+    link_count = 0
+    
+    log("Generating cross-links...")
+    for rule_index, rule in enumerate(linking_rules):
+        source_category = rule['source']
+        target_category = rule['target']
+        max_targets = rule['max_targets']
+        placement = rule['placement']
+        link_type = f"{source_category}_to_{target_category}"
+        
+        source_rows = page_index.rows(source_category)
+        if source_mask is not None:
+            source_rows = source_rows[source_mask[source_rows]]
+        
+        # Skip if we don't have pages in either category
+        if not len(source_rows) or not len(page_index.rows(target_category)):
+            continue
+        
+        # Links this rule may add; none are scanned for once its quota is used up
+        quota = max_links - link_count
+        if quotas is not None:
+            quota = min(quota, quotas[rule_index])
+        if quota <= 0:
+            report.count(f'rule.{link_type}.sources_skipped', len(source_rows))
+            continue
+        caps = source_caps[rule_index] if source_caps is not None else None
+        
+        log(f"Generating {link_type} links...")
+        started = time.perf_counter()
+        
+        # For each source page, find appropriate target pages
+        match = HIERARCHICAL_MATCHING.get((source_category, target_category))
+        if similarity is not None:
+            # Rank spare targets to stand in for those the site already links to
+            ranked_targets = similarity.rank_rule_targets(page_index, source_rows, target_category,
+                                                          max_targets * (2 if existing_links is not None else 1),
+                                                          match)
+        
+        # Counted per rule rather than per link; see crosslinker.report
+        links_before = link_count
+        candidate_count = 0
+        existing_count = 0
+        i = -1
+        try:
+            for i, source_row in enumerate(source_rows):
+                # Update progress
+                progress(link_type, min(1.0, (i+1) / len(source_rows)))
+                
+                if similarity is not None:
+                    similar_rows, similar_scores = next(ranked_targets)
+                
+                # Fewer targets when the rule's quota is spread over its source pages
+                source_targets = max_targets if caps is None else min(max_targets, int(caps[source_row]))
+                if source_targets <= 0:
+                    continue
+                
+                # Find relevant target pages
+                if similarity is not None:
+                    # Most similar candidates first, topped up in the usual way
+                    if existing_links is not None:
+                        existing = existing_links.contains(pair_hashes(page_hashes[source_row],
+                                                                       page_hashes[similar_rows]))
+                        existing_count += int(np.count_nonzero(existing))
+                        similar_rows, similar_scores = similar_rows[~existing], similar_scores[~existing]
+                    relevant_targets = similar_rows[:source_targets].tolist()
+                    relevance_scores = [round(float(score), 4) for score in similar_scores[:source_targets]]
+                    if len(relevant_targets) < source_targets:
+                        chosen = set(relevant_targets)
+                        
+                        def draw_fill(count):
+                            # The targets so far, plus room for the draw to repeat them
+                            extra = count + 2 * len(chosen)
+                            if match is not None:
+                                fill = page_index.candidates(target_category, source_row, extra, **match)
+                            else:
+                                fill = page_index.sample(target_category, source_row, extra, rng)
+                            return [row for row in fill if row not in chosen][:count]
+                        
+                        if existing_links is None:
+                            fill = draw_fill(source_targets - len(relevant_targets))
+                        else:
+                            fill, existing = _new_targets(draw_fill, source_targets - len(relevant_targets),
+                                                          page_hashes[source_row], page_hashes, existing_links)
+                            existing_count += existing
+                        relevant_targets += fill
+                        relevance_scores += [0.0] * len(fill)
+                else:
+                    if match is not None:
+                        # Hierarchical rules share a path prefix with the source page
+                        def draw(count):
+                            return page_index.candidates(target_category, source_row, count, **match)
+                    else:
+                        # For other combinations, use a sample of target pages
+                        def draw(count):
+                            return page_index.sample(target_category, source_row, count, rng)
+                    
+                    if existing_links is None:
+                        relevant_targets = draw(source_targets)
+                    else:
+                        relevant_targets, existing = _new_targets(draw, source_targets, page_hashes[source_row],
+                                                                  page_hashes, existing_links)
+                        existing_count += existing
+                
+                candidate_count += len(relevant_targets)
+                
+                # Generate links
+                for position, target_row in enumerate(relevant_targets, 1):
+                    # Generate anchor text using the title if available
+                    anchor_text = anchors.anchor(target_row)
+                    
+                    # Calculate relevance score (if enabled)
+                    if similarity is not None:
+                        relevance_score = relevance_scores[position - 1]
+                    else:
+                        relevance_score = 0.5  # Default medium relevance
+                    
+                    yield (rule_index, source_row, target_row, anchor_text,
+                           position if placement == 'featured_section' else 0, relevance_score)
+                    link_count += 1
+                    
+                    if link_count - links_before >= quota:
+                        break
+                
+                if link_count - links_before >= quota:
+                    break
+        finally:
+            # Candidates left over at max_links count as truncated
+            rule_links = link_count - links_before
+            report.add_time(f'rule.{link_type}', time.perf_counter() - started)
+            report.count(f'rule.{link_type}.sources', i + 1)
+            report.count(f'rule.{link_type}.candidates', candidate_count)
+            report.count(f'rule.{link_type}.links', rule_links)
+            report.count(f'rule.{link_type}.truncated', candidate_count - rule_links)
+            report.count(f'rule.{link_type}.existing', existing_count)
+            report.count(f'rule.{link_type}.sources_skipped', len(source_rows) - i - 1)
+            report.count('links.emitted', rule_links)
+            report.count('links.truncated', candidate_count - rule_links)
+
+def iter_cross_links(df, url_patterns, max_links=1000, use_content_similarity=False, fetch_titles=False,
+                     linking_rules=None, log=None, progress=None, pages=None, source_urls=None, workers=1,
+                     report=None, allocation='sequential', per_source=False, existing_links=None,
+                     anchor_seed=None):
+    """Generate cross-linking recommendations lazily, one link dict at a time
+    
+    `log` is called with status messages and `progress` with (label, fraction)
+    while each rule runs; both default to no-ops so the engine can run headless.
+    `pages` reuses a page table already built from `df` by build_page_table,
+    and `source_urls` restricts link generation to those source pages.
+    With `workers` other than 1 (None for one per CPU) hierarchical rules run
+    in that many processes, sharded by first path segment; see
+    crosslinker.parallel. A crosslinker.report.RunReport passed as `report`
+    collects stage timings and counters. `allocation` and `per_source` split
+    max_links across rules and source pages; see crosslinker.budget.
+    `existing_links`, the site's current links loaded with
+    crosslinker.inlinks.load_existing_links, are never recommended again.
+    `anchor_seed` seeds anchor text rotation; see crosslinker.anchors.
+    """
+    if linking_rules is None:
+        linking_rules = LINKING_RULES
+    
+    pages, page_index, similarity = prepare_link_generation(
+        df, url_patterns, use_content_similarity=use_content_similarity, fetch_titles=fetch_titles,
+        log=log, progress=progress, pages=pages, report=report
+    )
+    records = iter_link_records(pages, page_index, similarity, max_links=max_links,
+                                linking_rules=linking_rules, log=log, progress=progress,
+                                source_urls=source_urls, workers=workers, report=report,
+                                allocation=allocation, per_source=per_source,
+                                existing_links=existing_links, anchor_seed=anchor_seed)
+    
+    urls = page_index.urls
+    link_types = [f"{rule['source']}_to_{rule['target']}" for rule in linking_rules]
+    for rule_index, source_row, target_row, anchor_text, position, relevance_score in records:
+        rule = linking_rules[rule_index]
+        yield {
+            'source_page': urls[source_row],
+            'target_page': urls[target_row],
+            'link_type': link_types[rule_index],
+            'anchor_text': anchor_text,
+            'placement': rule['placement'],
+            'priority': rule['priority'],
+            'position': position or '',
+            'relevance_score': relevance_score
+        }
+
+def generate_cross_links(df, url_patterns, max_links=1000, use_content_similarity=False, fetch_titles=False,
+                         linking_rules=None, log=None, progress=None, pages=None, source_urls=None, workers=1,
+                         report=None, allocation='sequential', per_source=False, existing_links=None,
+                         anchor_seed=None):
+    """Generate cross-linking recommendations with enhanced features
+    
+    Returns a list of link dicts; see iter_cross_links for the options, and
+    generate_link_plan and iter_link_chunks for plans too large to hold as dicts.
+    """
+    return list(iter_cross_links(df, url_patterns, max_links=max_links,
+                                 use_content_similarity=use_content_similarity, fetch_titles=fetch_titles,
+                                 linking_rules=linking_rules, log=log, progress=progress, pages=pages,
+                                 source_urls=source_urls, workers=workers, report=report,
+                                 allocation=allocation, per_source=per_source,
+                                 existing_links=existing_links, anchor_seed=anchor_seed))
+
+# Pages with more than BALANCE_RATIO times as many outgoing as incoming links
+# and more than BALANCE_MIN_OUTGOING outgoing links lose BALANCE_REMOVAL_SHARE
+# of their outgoing count in low priority links
+BALANCE_RATIO = 3
+BALANCE_MIN_OUTGOING = 5
+BALANCE_REMOVAL_SHARE = 0.3
+
+def imbalanced_pages(outgoing, incoming, ratio=BALANCE_RATIO, min_outgoing=BALANCE_MIN_OUTGOING):
+    """Mask of pages with many outgoing and few incoming links, from aligned per-page counts"""
+    return (outgoing > incoming * ratio) & (outgoing > min_outgoing)
+
+def removal_quotas(outgoing, removal_share=BALANCE_REMOVAL_SHARE):
+    """Number of low priority links to drop from imbalanced pages with these outgoing counts"""
+    return (outgoing * removal_share).astype('int64')
+
+def balance_link_distribution(links_df, log=None, ratio=BALANCE_RATIO, min_outgoing=BALANCE_MIN_OUTGOING,
+                              removal_share=BALANCE_REMOVAL_SHARE, seed=None, report=None):
+    """Reduce low priority outgoing links from pages with imbalanced link counts
+    
+    Pages are imbalanced with more than `ratio` times as many outgoing as
+    incoming links and more than `min_outgoing` outgoing links. Each loses a
+    random `removal_share` of its outgoing count in low priority links (or all
+    of them, if it has fewer). Works on the compact links of a LinkPlan too;
+    `seed` seeds the numpy Generator that picks the links.
+    """
+    log = log or _ignore
+    report = report or NULL_REPORT
+    with report.span('balance'):
+        balanced = _balance_links(links_df, log, report, ratio, min_outgoing, removal_share, seed)
+    report.count('balance.links_removed', len(links_df) - len(balanced))
+    return balanced
+
+def _balance_links(links_df, log, report, ratio, min_outgoing, removal_share, seed):
+    """balance_link_distribution without the span"""
+    # Count outgoing and incoming links per source page
+    sources, source_pages = pd.factorize(links_df['source_page'])
+    targets = source_pages.get_indexer(links_df['target_page'])
+    outgoing = np.bincount(sources, minlength=len(source_pages))
+    incoming = np.bincount(targets[targets >= 0], minlength=len(source_pages))
+    
+    # Find pages with imbalanced links (many outgoing, few incoming)
+    imbalanced = imbalanced_pages(outgoing, incoming, ratio, min_outgoing)
+    if not imbalanced.any():
+        return links_df
+    
+    log(f"Found {imbalanced.sum()} pages with imbalanced links. Adjusting link distribution...")
+    report.count('balance.imbalanced_pages', int(imbalanced.sum()))
+    
+    # Low priority links of imbalanced pages, grouped by page in random order
+    quotas = np.where(imbalanced, removal_quotas(outgoing, removal_share), 0)
+    candidates = np.flatnonzero((links_df['priority'] == 'low').to_numpy() & (quotas[sources] > 0))
+    rng = np.random.default_rng(seed)
+    order = candidates[np.lexsort((rng.random(len(candidates)), sources[candidates]))]
+    grouped = sources[order]
+    
+    # Drop the first `quota` links of each page's shuffled group
+    rank = np.arange(len(order)) - np.searchsorted(grouped, grouped)
+    keep = np.ones(len(links_df), dtype=bool)
+    keep[order[rank < quotas[grouped]]] = False
+    return links_df[keep]
+
+def test_patterns(test_url, url_patterns):
+    """Test a URL against the patterns and show which category it matches"""
+    components = extract_url_components(test_url)
+    category = categorize_page(components, url_patterns)
+    return category
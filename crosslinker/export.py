@@ -0,0 +1,299 @@
+"""Export formats for cross-linking plans"""
+import html
+import os
+import tempfile
+import time
+import zipfile
+
+import pandas as pd
+import xlsxwriter
+
+from .engine import LINK_COLUMNS
+from .plan import LinkPlan
+
+def plan_to_csv(links_df):
+    """Render the cross-linking plan as CSV text"""
+    return links_df.to_csv(index=False)
+
+# Excel's rows per worksheet, header row included
+EXCEL_MAX_ROWS = 1_048_576
+
+# Rows sampled to size the columns of a workbook
+EXCEL_WIDTH_SAMPLE = 1000
+
+EXCEL_SHEET_NAME = 'Cross-linking Plan'
+
+EXCEL_HEADER_FORMAT = {
+    'bold': True,
+    'bg_color': '#4CAF50',
+    'color': 'white',
+    'border': 1
+}
+
+def _excel_widths(sample):
+    """Column widths from sampled rows: the longest value or header plus 2, at most 50"""
+    widths = []
+    for col in sample.columns:
+        # Missing values are written as blank cells
+        lengths = sample[col].astype(str).str.len().where(sample[col].notna(), 0)
+        max_len = max(int(lengths.max()) if len(sample) else 0, len(col)) + 2
+        widths.append(min(max_len, 50))
+    return widths
+
+def _add_plan_sheet(workbook, columns, widths, header_format):
+    """Add the next plan sheet with its header row and column widths"""
+    number = len(workbook.worksheets()) + 1
+    worksheet = workbook.add_worksheet(EXCEL_SHEET_NAME if number == 1 else f'{EXCEL_SHEET_NAME} ({number})')
+    for i, width in enumerate(widths):
+        worksheet.set_column(i, i, width)
+    worksheet.write_row(0, 0, columns, header_format)
+    return worksheet
+
+def write_excel(chunks, path, rows_per_sheet=EXCEL_MAX_ROWS - 1):
+    """Stream link chunks into an Excel workbook at `path` and return the number of rows
+
+    The workbook is written in xlsxwriter's constant_memory mode, which
+    flushes each row to disk as the next one starts, and column widths are
+    estimated from the first EXCEL_WIDTH_SAMPLE links. A sheet holds at most
+    `rows_per_sheet` links; the plan continues on 'Cross-linking Plan (2)'
+    and so on. URLs are written as text, as Excel drops hyperlinks beyond
+    65,530 per sheet, and text starting with '=' is not turned into formulas.
+    """
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_urls': False,
+                                          'strings_to_formulas': False})
+    header_format = workbook.add_format(EXCEL_HEADER_FORMAT)
+    columns = widths = worksheet = None
+    rows = row = 0
+    try:
+        for chunk in chunks:
+            if columns is None:
+                columns = list(chunk.columns)
+                widths = _excel_widths(chunk.head(EXCEL_WIDTH_SAMPLE))
+            # Missing values become blank cells
+            values = chunk.astype(object).where(chunk.notna(), None)
+            for record in values.itertuples(index=False, name=None):
+                if worksheet is None or row > rows_per_sheet:
+                    worksheet = _add_plan_sheet(workbook, columns, widths, header_format)
+                    row = 1
+                worksheet.write_row(row, 0, record)
+                row += 1
+            rows += len(chunk)
+
+        if worksheet is None:
+            columns = columns or LINK_COLUMNS
+            _add_plan_sheet(workbook, columns, _excel_widths(pd.DataFrame(columns=columns)), header_format)
+    finally:
+        workbook.close()
+    return rows
+
+def plan_to_excel(links_df):
+    """Render the cross-linking plan as an Excel workbook and return its bytes"""
+    # Built in a temporary file rather than in memory; see write_excel
+    with tempfile.TemporaryDirectory(prefix='crosslinker-') as directory:
+        path = os.path.join(directory, 'cross_linking_plan.xlsx')
+        write_excel([links_df], path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+HTML_STYLE = """
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        h1, h2 { color: #2C3E50; }
+        table { border-collapse: collapse; width: 100%; margin-bottom: 20px; }
+        th { background-color: #4CAF50; color: white; text-align: left; padding: 8px; }
+        td { border: 1px solid #ddd; padding: 8px; }
+        tr:nth-child(even) { background-color: #f2f2f2; }
+        .summary { background-color: #f9f9f9; padding: 15px; border-radius: 5px; margin-bottom: 20px; }
+        .nav { margin: 10px 0; }
+        .footer { margin-top: 30px; font-size: 12px; color: #777; }
+"""
+
+# Links shown by the single-file HTML report
+HTML_PREVIEW_ROWS = 1000
+
+# Links per page of the zipped HTML report
+HTML_ROWS_PER_PAGE = 5000
+
+_HTML_ESCAPES = [('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'), ("'", '&#x27;')]
+
+def _escape_column(values):
+    """HTML-escaped text of a column; missing values become ''"""
+    text = values.astype(object).where(values.notna(), '').astype(str)
+    for char, entity in _HTML_ESCAPES:
+        text = text.str.replace(char, entity, regex=False)
+    return text
+
+def _html_rows(links_df):
+    """Table rows of the links as a list of strings, rendered column by column"""
+    rows = pd.Series('<tr>', index=links_df.index, dtype=object)
+    for col in links_df.columns:
+        rows = rows + '<td>' + _escape_column(links_df[col]) + '</td>'
+    return (rows + '</tr>').tolist()
+
+def _html_table(columns, rows):
+    header = ''.join(f'<th>{html.escape(str(col))}</th>' for col in columns)
+    return f'<table>\n<tr>{header}</tr>\n' + '\n'.join(rows) + '\n</table>'
+
+def _html_summary(total, sources, targets):
+    return f"""<div class="summary">
+        <h2>Summary</h2>
+        <p>Total Links: {total}</p>
+        <p>Unique Source Pages: {sources}</p>
+        <p>Unique Target Pages: {targets}</p>
+        <p>Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}</p>
+    </div>"""
+
+def _html_document(title, body):
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{html.escape(title)}</title>
+    <style>{HTML_STYLE}</style>
+</head>
+<body>
+    {body}
+
+    <div class="footer">
+        <p>Generated by MV Cross-linking Generator</p>
+    </div>
+</body>
+</html>
+"""
+
+def plan_to_html(links_df, statistics=None):
+    """Render the cross-linking plan as a standalone HTML report
+
+    Shows the first HTML_PREVIEW_ROWS links; write_html_report renders all
+    of them. With `statistics` from plan_statistics, the summary describes
+    the whole plan and `links_df` need only hold its first links.
+    """
+    if statistics is not None:
+        total = statistics['total']
+        summary = _html_summary(total, len(statistics['source_page']), len(statistics['target_page']))
+    else:
+        total = len(links_df)
+        summary = _html_summary(total, links_df['source_page'].nunique(), links_df['target_page'].nunique())
+    body = f"""<h1>Cross-linking Plan</h1>
+    {summary}
+
+    <h2>Cross-linking Plan</h2>"""
+    if total > HTML_PREVIEW_ROWS:
+        body += f"\n    <p>Showing the first {HTML_PREVIEW_ROWS} of {total} links.</p>"
+    body += '\n    ' + _html_table(links_df.columns, _html_rows(links_df.head(HTML_PREVIEW_ROWS)))
+    return _html_document('Cross-linking Plan', body)
+
+def _page_name(number):
+    return f'page-{number:05d}.html'
+
+def _iter_html_pages(chunks, rows_per_page, on_chunk):
+    """Yield (columns, rendered rows) of `rows_per_page` links at a time
+
+    Chunks are sliced into pages before rendering, so only the links of the
+    page being filled are rendered at once.
+    """
+    columns = None
+    pending = []
+    for chunk in chunks:
+        on_chunk(chunk)
+        columns = list(chunk.columns)
+        start = 0
+        while start < len(chunk):
+            stop = start + rows_per_page - len(pending)
+            pending += _html_rows(chunk.iloc[start:stop])
+            start = stop
+            if len(pending) == rows_per_page:
+                yield columns, pending
+                pending = []
+    if pending:
+        yield columns, pending
+
+def write_html_report(chunks, path, rows_per_page=HTML_ROWS_PER_PAGE, statistics=None):
+    """Write every link as a zipped, paginated HTML report and return the number of links
+
+    The zip holds index.html, with the summary and a list of pages, and
+    pages/page-00001.html and on with `rows_per_page` links each. Links are
+    rendered a page at a time and each page is written once the next one is
+    rendered, so at most two rendered pages are in memory besides the chunk
+    being read. `statistics` from plan_statistics fills in the summary;
+    without it, unique pages are counted while writing.
+    """
+    sources, targets = set(), set()
+    def count_pages(chunk):
+        if statistics is None:
+            sources.update(chunk['source_page'].unique())
+            targets.update(chunk['target_page'].unique())
+
+    total = 0
+    contents = []
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        pages = _iter_html_pages(chunks, rows_per_page, count_pages)
+        page = next(pages, None)
+        while page is not None:
+            following = next(pages, None)
+            columns, rows = page
+            number = len(contents) + 1
+            label = f'Links {total + 1:,}–{total + len(rows):,}'
+            nav = ['<a href="../index.html">Summary</a>']
+            if number > 1:
+                nav.insert(0, f'<a href="{_page_name(number - 1)}">&laquo; Previous</a>')
+            if following is not None:
+                nav.append(f'<a href="{_page_name(number + 1)}">Next &raquo;</a>')
+            nav = f'<p class="nav">{" | ".join(nav)}</p>'
+            body = (f"<h1>Cross-linking Plan</h1>\n    <h2>{label}</h2>\n    {nav}\n"
+                    f"    {_html_table(columns, rows)}\n    {nav}")
+            archive.writestr(f'pages/{_page_name(number)}', _html_document(f'Cross-linking Plan: {label}', body))
+            contents.append(f'<li><a href="pages/{_page_name(number)}">{label}</a></li>')
+            total += len(rows)
+            page = following
+
+        if statistics is not None:
+            summary = _html_summary(statistics['total'], len(statistics['source_page']),
+                                    len(statistics['target_page']))
+        else:
+            summary = _html_summary(total, len(sources), len(targets))
+        listing = '<ol>\n' + '\n'.join(contents) + '\n</ol>' if contents else '<p>The plan has no links.</p>'
+        body = f"<h1>Cross-linking Plan</h1>\n    {summary}\n\n    <h2>Pages</h2>\n    {listing}"
+        archive.writestr('index.html', _html_document('Cross-linking Plan', body))
+    return total
+
+def plan_to_html_zip(links_df):
+    """Render the cross-linking plan as a zipped, paginated HTML report and return its bytes"""
+    with tempfile.TemporaryDirectory(prefix='crosslinker-') as directory:
+        path = os.path.join(directory, 'cross_linking_report.zip')
+        write_html_report([links_df], path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+# Export format -> (renderer, file extension)
+EXPORT_FORMATS = {
+    'csv': (plan_to_csv, '.csv'),
+    'excel': (plan_to_excel, '.xlsx'),
+    'html': (plan_to_html, '.html'),
+    'html_zip': (plan_to_html_zip, '.zip'),
+}
+
+# Export formats written from an iterable of link chunks straight to a file
+EXPORT_WRITERS = {
+    'excel': write_excel,
+    'html_zip': write_html_report,
+}
+
+def write_plan(links_df, path, export_format='csv'):
+    """Write the cross-linking plan to `path` in one of EXPORT_FORMATS
+
+    `links_df` may also be a LinkPlan, whose URLs are materialised here.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    if isinstance(links_df, LinkPlan):
+        links_df = links_df.to_frame()
+    if export_format in EXPORT_WRITERS:
+        # Streamed straight to the file
+        EXPORT_WRITERS[export_format]([links_df], path)
+        return
+
+    renderer, _ = EXPORT_FORMATS[export_format]
+    data = renderer(links_df)
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    with open(path, mode) as f:
+        f.write(data)
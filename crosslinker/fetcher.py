@@ -0,0 +1,220 @@
+"""Asynchronous page title fetcher with pooled keep-alive connections.
+
+One aiohttp session is shared by a fixed pool of worker tasks, so the number
+of requests in flight is capped globally (`concurrency`) and per host
+(`per_host`) and connections are reused across requests. Memory stays flat
+however many URLs are queued. aiohttp and BeautifulSoup are imported when
+pages are first fetched or parsed. benchmarks.fetcher runs the fetcher
+against a local stand-in server.
+"""
+import asyncio
+import concurrent.futures
+import datetime
+import email.utils
+import html
+import re
+import time
+
+from .report import NULL_REPORT
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Responses worth retrying; anything else is final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Titles live in <head>; stop reading large pages after this many bytes
+MAX_BODY_BYTES = 2 * 1024 * 1024
+
+# Content types whose bodies are searched for a title; a response without a
+# Content-Type header is read too
+HTML_CONTENT_TYPES = {'text/html', 'application/xhtml+xml'}
+
+TITLE_PATTERN = re.compile(r'<title\b[^>]*>(.*?)</title\s*>', re.IGNORECASE | re.DOTALL)
+
+def extract_title(page_html):
+    """Return the page <title>, else its first <h1>, else None"""
+    match = TITLE_PATTERN.search(page_html)
+    if match:
+        return html.unescape(match.group(1)).strip()
+
+    # Rare enough that a full parse is affordable
+    from bs4 import BeautifulSoup
+
+    h1_tag = BeautifulSoup(page_html, 'html.parser').find('h1')
+    if h1_tag:
+        return h1_tag.text.strip()
+    return None
+
+def retry_after_seconds(value, now=None):
+    """Seconds to wait from a Retry-After header, given in seconds or as an HTTP date
+
+    Dates in the past give 0; returns None for a missing or malformed header.
+    """
+    value = (value or '').strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+async def _read_body(response, max_bytes=MAX_BODY_BYTES):
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes:
+            break
+    body = b''.join(chunks)[:max_bytes]
+    return body.decode(response.charset or 'utf-8', errors='replace')
+
+async def fetch_page_async(session, url, validators=None, retries=2, backoff=0.5, report=None):
+    """Fetch one page's title and cache validators, retrying transient failures
+
+    `validators` is an optional (etag, last_modified) pair sent as
+    If-None-Match/If-Modified-Since. Returns a dict with title, etag,
+    last_modified and not_modified (True on a 304), or None on failure.
+    Responses that are not HTML (PDFs, images) are not read and have no
+    title. Retries are counted in `report` as fetch.retries and non-HTML
+    responses as fetch.not_html.
+    """
+    import aiohttp
+
+    report = report or NULL_REPORT
+    headers = {}
+    if validators:
+        etag, last_modified = validators
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    for attempt in range(retries + 1):
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status in (200, 304):
+                    not_modified = response.status == 304
+                    title = None
+                    if not not_modified:
+                        if 'Content-Type' in response.headers and response.content_type not in HTML_CONTENT_TYPES:
+                            report.count('fetch.not_html')
+                        else:
+                            title = extract_title(await _read_body(response))
+                    return {
+                        'title': title,
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'not_modified': not_modified,
+                    }
+                if response.status not in RETRY_STATUSES or attempt == retries:
+                    return None
+                delay = retry_after_seconds(response.headers.get('Retry-After'))
+                if delay is None:
+                    delay = backoff * 2 ** attempt
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == retries:
+                return None
+            delay = backoff * 2 ** attempt
+        report.count('fetch.retries')
+        await asyncio.sleep(min(delay, 30))
+    return None
+
+async def fetch_title_async(session, url, retries=2, backoff=0.5):
+    """Fetch one page title with `session`, retrying transient failures"""
+    page = await fetch_page_async(session, url, retries=retries, backoff=backoff)
+    return page['title'] if page else None
+
+async def fetch_pages_async(urls, validators=None, concurrency=32, per_host=8, timeout=10, retries=2,
+                            backoff=0.5, headers=None, progress=None, session=None, report=None):
+    """Fetch `urls` and return a dict of url -> fetch_page_async result
+
+    `validators` maps URLs to (etag, last_modified) pairs for conditional
+    requests. `progress`, if given, is called as progress(processed, total)
+    after each URL. Pass an existing aiohttp `session` to reuse its
+    connection pool; its own limits then apply instead of `per_host`.
+    A RunReport passed as `report` gets a fetch.latency histogram (retries
+    included) and counts of fetched, not modified and failed pages.
+    """
+    urls = list(dict.fromkeys(urls))
+    validators = validators or {}
+    report = report or NULL_REPORT
+    total = len(urls)
+    results = {}
+    if not total:
+        return results
+
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+
+    async def worker(client):
+        while True:
+            try:
+                url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                results[url] = await fetch_page_async(client, url, validators.get(url),
+                                                      retries=retries, backoff=backoff, report=report)
+            except Exception:
+                results[url] = None
+            report.observe('fetch.latency', time.perf_counter() - started)
+            page = results[url]
+            report.count('fetch.failed' if page is None else
+                         'fetch.not_modified' if page['not_modified'] else 'fetch.ok')
+            if progress is not None:
+                progress(len(results), total)
+
+    async def run(client):
+        workers = [asyncio.create_task(worker(client)) for _ in range(min(concurrency, total))]
+        await asyncio.gather(*workers)
+
+    if session is not None:
+        await run(session)
+    else:
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            headers=headers or DEFAULT_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as client:
+            await run(client)
+
+    return results
+
+async def fetch_titles_async(urls, **options):
+    """Fetch titles for `urls` and return a dict of url -> title (None on failure)
+
+    Accepts the same options as fetch_pages_async.
+    """
+    pages = await fetch_pages_async(urls, **options)
+    return {url: page['title'] if page else None for url, page in pages.items()}
+
+def _run(coroutine):
+    """Run a coroutine on a private event loop, in a helper thread if the
+    caller already has a loop running (e.g. inside a notebook)"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+def fetch_pages(urls, **options):
+    """Synchronous wrapper around fetch_pages_async"""
+    return _run(fetch_pages_async(urls, **options))
+
+def fetch_titles(urls, **options):
+    """Synchronous wrapper around fetch_titles_async"""
+    return _run(fetch_titles_async(urls, **options))
@@ -0,0 +1,225 @@
+"""Internal link graph analytics: degrees, orphan pages, click depth and PageRank.
+
+A LinkGraph holds the links between a fixed set of pages as a scipy sparse
+adjacency matrix, one row and column per page, so every metric is a pass
+over the matrix or a few sparse matrix-vector products rather than a loop
+over links. Repeated links between two pages count once and links from a
+page to itself are left out; links to or from URLs outside the page set
+(redirects, external or non-indexable pages in a crawl) are skipped and
+counted in skipped_links.
+
+graph_metrics compares the site's existing links with the existing links
+plus a plan, page by page. scipy is imported when a graph is built rather
+than with the package.
+"""
+import numpy as np
+import pandas as pd
+
+# PageRank damping factor, and the change in ranks (summed over all pages)
+# below which power iteration stops
+DEFAULT_DAMPING = 0.85
+DEFAULT_TOLERANCE = 1e-6
+DEFAULT_MAX_ITERATIONS = 100
+
+# URLs without a path, e.g. https://example.com and https://example.com/
+HOMEPAGE_PATTERN = r'^[A-Za-z][A-Za-z0-9+.-]*://[^/?#]*/?(?:[?#].*)?$'
+
+def homepage_rows(urls):
+    """Positions of the homepages (URLs without a path) among `urls`"""
+    urls = pd.Series(pd.Index(urls).astype(object))
+    return np.flatnonzero(urls.str.match(HOMEPAGE_PATTERN, na=False).to_numpy())
+
+def _url_codes(url_index, values):
+    """Positions of `values` in `url_index`, -1 for URLs not in it"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Plans read from disk have categorical URL columns: look up each URL once
+        codes = values.cat.codes.to_numpy()
+        positions = url_index.get_indexer(values.cat.categories)
+        return np.where(codes >= 0, positions[codes], -1)
+    return url_index.get_indexer(values)
+
+def _link_codes(url_index, links):
+    """(source rows, target rows, skipped) for a link table or iterable of link tables"""
+    if isinstance(links, pd.DataFrame):
+        links = [links]
+    sources, targets = [np.zeros(0, dtype=np.int32)], [np.zeros(0, dtype=np.int32)]
+    skipped = 0
+    for chunk in links:
+        source_rows = _url_codes(url_index, chunk['source_page'])
+        target_rows = _url_codes(url_index, chunk['target_page'])
+        keep = (source_rows >= 0) & (target_rows >= 0)
+        skipped += int(len(keep) - keep.sum())
+        sources.append(source_rows[keep].astype(np.int32))
+        targets.append(target_rows[keep].astype(np.int32))
+    return np.concatenate(sources), np.concatenate(targets), skipped
+
+class LinkGraph:
+    """Directed link graph over a fixed set of pages
+
+    `urls` lists the pages once each; `source_rows` and `target_rows` are
+    positions in it, one pair per link. The adjacency matrix has a 1 at
+    (source, target) for every pair of pages linked at least once.
+    """
+
+    def __init__(self, urls, source_rows, target_rows, skipped_links=0):
+        # Imported here: scipy is only needed for graph analytics
+        from scipy import sparse
+
+        self.urls = pd.Index(urls)
+        self.skipped_links = skipped_links
+        n = len(self.urls)
+        # Sorting (source, target) pairs packed into one integer orders the
+        # links by source and then target, so repeated links end up adjacent
+        source_rows, target_rows = np.asarray(source_rows), np.asarray(target_rows)
+        pairs = source_rows.astype(np.int64)
+        pairs *= n
+        pairs += target_rows
+        pairs = pairs[source_rows != target_rows]
+        pairs.sort()
+        if len(pairs):
+            pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+        index_dtype = np.int32 if len(pairs) < 2**31 else np.int64
+        indptr = np.searchsorted(pairs, np.arange(n + 1, dtype=np.int64) * n).astype(index_dtype)
+        targets = np.remainder(pairs, max(n, 1), out=pairs).astype(np.int32)
+        del pairs
+        self.matrix = sparse.csr_matrix((np.ones(len(targets), dtype=np.float32), targets, indptr), shape=(n, n))
+        self.matrix.has_sorted_indices = True
+
+    @classmethod
+    def from_links(cls, urls, links):
+        """Graph over `urls` from a DataFrame of links, or an iterable of them
+
+        Links are given by URL in source_page and target_page columns, as in
+        a plan, so chunks from crosslinker.sink.iter_plan can be passed
+        straight in. Links to or from other URLs are counted in skipped_links.
+        """
+        urls = pd.Index(pd.unique(np.asarray(urls, dtype=object)))
+        source_rows, target_rows, skipped = _link_codes(urls, links)
+        return cls(urls, source_rows, target_rows, skipped)
+
+    @property
+    def link_count(self):
+        """Number of linked (source, target) pairs"""
+        return self.matrix.nnz
+
+    def out_degree(self):
+        """Number of pages each page links to"""
+        return np.diff(self.matrix.indptr)
+
+    def in_degree(self):
+        """Number of pages linking to each page"""
+        return np.bincount(self.matrix.indices, minlength=len(self.urls))
+
+    def orphans(self, roots=None):
+        """Mask of pages no other page links to, other than the `roots` (by default the homepages)"""
+        if roots is None:
+            roots = homepage_rows(self.urls)
+        orphans = self.in_degree() == 0
+        orphans[roots] = False
+        return orphans
+
+    def click_depth(self, roots=None):
+        """Fewest clicks from any of the `roots` (by default the homepages) to each page
+
+        Breadth-first, one level of the graph at a time; pages that cannot
+        be reached get -1.
+        """
+        if roots is None:
+            roots = homepage_rows(self.urls)
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        depth = np.full(len(self.urls), -1, dtype=np.int32)
+        frontier = np.unique(np.asarray(roots, dtype=np.int64))
+        level = 0
+        while len(frontier):
+            depth[frontier] = level
+            # Positions in `indices` of the links out of the frontier, one range per page
+            starts, counts = indptr[frontier], np.diff(indptr)[frontier]
+            ends = np.cumsum(counts)
+            positions = np.repeat(starts - ends + counts, counts) + np.arange(ends[-1] if len(ends) else 0)
+            reached = np.zeros(len(depth), dtype=bool)
+            reached[indices[positions]] = True
+            frontier = np.flatnonzero(reached & (depth < 0))
+            level += 1
+        return depth
+
+    def pagerank(self, damping=DEFAULT_DAMPING, tolerance=DEFAULT_TOLERANCE,
+                 max_iterations=DEFAULT_MAX_ITERATIONS):
+        """PageRank of each page by power iteration; the ranks sum to 1
+
+        Pages without outgoing links spread their rank evenly over all pages.
+        Stops when the ranks change by less than `tolerance` in total, or
+        after `max_iterations`.
+        """
+        n = len(self.urls)
+        if not n:
+            return np.zeros(0)
+        # A CSC view of the transpose, so links are summed into their targets without a copy
+        transposed = self.matrix.T
+        out_degree = self.out_degree()
+        dangling = out_degree == 0
+        share = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iterations):
+            spread = transposed @ (rank * share).astype(np.float32)
+            new_rank = damping * (spread + rank[dangling].sum() / n) + (1 - damping) / n
+            new_rank /= new_rank.sum()
+            change = np.abs(new_rank - rank).sum()
+            rank = new_rank
+            if change < tolerance:
+                break
+        return rank
+
+def graph_metrics(urls, links, existing_links=None, roots=None, **pagerank_options):
+    """Per-page link graph metrics before and after adding a plan to the site
+
+    `links` (the plan) and `existing_links` (the site's current internal
+    links, e.g. from a crawl) are DataFrames with source_page and
+    target_page columns, or iterables of them. Returns a DataFrame indexed
+    by URL with in_links, out_links, click_depth (-1 when unreachable from
+    the `roots`, by default the homepages), orphan and pagerank columns for
+    the existing links alone (suffixed _before) and with the plan added.
+    """
+    url_index = pd.Index(pd.unique(np.asarray(urls, dtype=object)))
+    if roots is None:
+        roots = homepage_rows(url_index)
+    existing_sources, existing_targets, existing_skipped = _link_codes(
+        url_index, existing_links if existing_links is not None else [])
+    plan_sources, plan_targets, plan_skipped = _link_codes(url_index, links)
+
+    graphs = {
+        '_before': LinkGraph(url_index, existing_sources, existing_targets, existing_skipped),
+        '': LinkGraph(url_index, np.concatenate([existing_sources, plan_sources]),
+                      np.concatenate([existing_targets, plan_targets]), existing_skipped + plan_skipped),
+    }
+    columns = {}
+    for suffix, graph in graphs.items():
+        columns[f'in_links{suffix}'] = graph.in_degree()
+        columns[f'out_links{suffix}'] = graph.out_degree()
+        columns[f'click_depth{suffix}'] = graph.click_depth(roots)
+        columns[f'orphan{suffix}'] = graph.orphans(roots)
+        columns[f'pagerank{suffix}'] = graph.pagerank(**pagerank_options)
+    metrics = pd.DataFrame(columns, index=url_index.rename('url'))
+    metrics.attrs['skipped_links'] = existing_skipped + plan_skipped
+    return metrics
+
+def graph_summary(metrics):
+    """Site-wide figures from graph_metrics, before and after the plan
+
+    Returns a DataFrame indexed by metric with 'before' and 'after' columns:
+    linked pages, orphan pages, pages unreachable from the homepage and the
+    mean and maximum click depth of the pages that can be reached.
+    """
+    summary = {}
+    for name, suffix in (('before', '_before'), ('after', '')):
+        depth = metrics[f'click_depth{suffix}']
+        reachable = depth[depth >= 0]
+        summary[name] = {
+            'pages': len(metrics),
+            'links': int(metrics[f'out_links{suffix}'].sum()),
+            'orphan_pages': int(metrics[f'orphan{suffix}'].sum()),
+            'unreachable_pages': int((depth < 0).sum()),
+            'mean_click_depth': round(float(reachable.mean()), 2) if len(reachable) else None,
+            'max_click_depth': int(reachable.max()) if len(reachable) else None,
+        }
+    return pd.DataFrame(summary, dtype=object)
@@ -0,0 +1,463 @@
+"""Incremental regeneration of a cross-linking plan from sitemap deltas.
+
+A run stores its page table (with sitemap lastmods), its link plan before
+balancing and the settings it was generated with. The next run diffs the new
+input against the stored pages by URL and lastmod and only recomputes links
+for source pages affected by the difference:
+
+- added pages and pages whose lastmod changed;
+- sources of hierarchical rules whose path prefix bucket (state, city,
+  category) gained or lost one of the targets they draw from;
+- sources whose stored links point at a removed or changed page;
+- with existing_links, sources of stored links the site now has.
+
+Links of all other sources are carried over unchanged. Randomly sampled
+rules are not redrawn just because a target was added, so new pages receive
+sampled inbound links only from sources recomputed for another reason.
+
+Plans stay on disk: the stored plan is streamed a chunk at a time, links of
+the affected sources are generated in chunks (crosslinker.plan) and the two
+are merged rule by rule into the new plan, so memory grows with the change
+rather than the plan. A state directory holds the page table as Parquet
+(CSV without pyarrow), the plan as written by crosslinker.sink and the
+settings as JSON.
+"""
+import heapq
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .engine import HIERARCHICAL_MATCHING, LINK_COLUMNS, LINKING_RULES, SegmentPrefixIndex, build_page_table
+from .inlinks import LinkHashSet, link_hashes
+from .plan import iter_link_chunks
+from .report import NULL_REPORT
+from .sink import default_plan_extension, infer_sink_format, iter_plan, open_link_sink, write_link_chunks
+
+# State files: the page table and plan are PAGES_NAME and LINKS_NAME plus
+# the extension of their format
+PAGES_NAME = 'pages'
+LINKS_NAME = 'links'
+SETTINGS_FILE = 'settings.json'
+STATE_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow', 'csv': '.csv'}
+
+# Columns identifying a link when comparing plans
+LINK_KEY = ['source_page', 'target_page', 'link_type']
+
+# Columns of a change log, as written to its CSV file
+CHANGE_COLUMNS = ['change'] + LINK_KEY + [column for column in LINK_COLUMNS if column not in LINK_KEY]
+
+def _text(values):
+    """Values as compared between runs: text, '' when missing"""
+    return values.astype(object).fillna('').astype(str)
+
+def _state_file(path, name):
+    for extension in STATE_EXTENSIONS.values():
+        file_path = os.path.join(path, name + extension)
+        if os.path.exists(file_path):
+            return file_path
+    return None
+
+def load_plan_state(path):
+    """Load the state saved by save_plan_state, or None if there is none
+
+    The page table is read into memory; the plan stays on disk and
+    state['links'] is its path.
+    """
+    settings_path = os.path.join(path, SETTINGS_FILE)
+    pages_path, links_path = _state_file(path, PAGES_NAME), _state_file(path, LINKS_NAME)
+    if not os.path.exists(settings_path) or pages_path is None or links_path is None:
+        return None
+    with open(settings_path) as f:
+        settings = json.load(f)
+    if infer_sink_format(pages_path) == 'parquet':
+        pages = pd.read_parquet(pages_path)
+    else:
+        # Only empty fields are missing: URL segments such as 'null' stay text
+        pages = pd.read_csv(pages_path, dtype=str, keep_default_na=False, na_values=[''])
+        pages['depth'] = pages['depth'].astype(np.int64)
+        pages['lastmod'] = pages['lastmod'].fillna('')
+    return {'pages': pages, 'links': links_path, 'settings': settings}
+
+def _replace_file(path, write):
+    """Write a file through a temporary name, so readers never see half of it"""
+    temporary = path + '.tmp'
+    write(temporary)
+    os.replace(temporary, path)
+
+def save_plan_state(path, state):
+    """Save a run's page table, unbalanced plan and settings under `path`
+
+    state['links'] is the path of the plan, which is copied in. Only the
+    page table columns the next run diffs against are kept.
+    """
+    os.makedirs(path, exist_ok=True)
+    settings_path = os.path.join(path, SETTINGS_FILE)
+    # A state only counts as saved once its settings exist, so drop them first
+    if os.path.exists(settings_path):
+        os.remove(settings_path)
+
+    links_path = os.path.join(path, LINKS_NAME + STATE_EXTENSIONS[infer_sink_format(state['links'])])
+    if os.path.abspath(state['links']) != os.path.abspath(links_path):
+        _replace_file(links_path, lambda temporary: shutil.copyfile(state['links'], temporary))
+
+    pages = state['pages']
+    columns = ['url', 'category', 'depth'] + [column for column in pages.columns if column.startswith('segment_')]
+    pages = pages[columns].assign(lastmod=_text(pages['lastmod']))
+    extension = default_plan_extension()
+    pages_path = os.path.join(path, PAGES_NAME + extension)
+    if extension == '.parquet':
+        _replace_file(pages_path, lambda temporary: pages.to_parquet(temporary, index=False))
+    else:
+        _replace_file(pages_path, lambda temporary: pages.to_csv(temporary, index=False))
+
+    # Files of an earlier state in another format
+    for name, current in ((PAGES_NAME, pages_path), (LINKS_NAME, links_path)):
+        for other in STATE_EXTENSIONS.values():
+            stale = os.path.join(path, name + other)
+            if stale != current and os.path.exists(stale):
+                os.remove(stale)
+
+    with open(settings_path, 'w') as f:
+        json.dump(state['settings'], f, indent=2)
+
+def diff_page_tables(previous_pages, pages):
+    """URLs added, removed and with a changed lastmod between two page tables"""
+    columns = ['url', 'lastmod']
+    merged = previous_pages[columns].drop_duplicates('url').merge(
+        pages[columns].drop_duplicates('url'), on='url', how='outer', suffixes=('_previous', ''),
+        indicator=True
+    )
+    both = merged[merged['_merge'] == 'both']
+    before = _text(both['lastmod_previous']).to_numpy()
+    after = _text(both['lastmod']).to_numpy()
+    return {
+        'added': pd.Index(merged.loc[merged['_merge'] == 'right_only', 'url']),
+        'removed': pd.Index(merged.loc[merged['_merge'] == 'left_only', 'url']),
+        'changed': pd.Index(both.loc[before != after, 'url']),
+    }
+
+def _prefix_keys(pages, prefix_length):
+    """The first `prefix_length` path segments of each page joined with '/'"""
+    keys = pages['segment_0'].astype(object).astype(str)
+    for i in range(1, prefix_length):
+        keys = keys + '/' + pages[f'segment_{i}'].astype(object).astype(str)
+    return keys
+
+def _bucket_heads(pages, prefix_keys, category, min_depth, keys, size):
+    """First `size` URLs of each prefix bucket in `keys`, in table order"""
+    rows = ((pages['category'] == category) & (pages['depth'] >= min_depth) & prefix_keys.isin(keys)).to_numpy()
+    heads = pd.DataFrame({'key': prefix_keys[rows].to_numpy(), 'url': pages['url'][rows].to_numpy()})
+    return heads.groupby('key', sort=False)['url'].agg(lambda urls: tuple(urls[:size]))
+
+def affected_sources(previous_pages, pages, previous_links, diff, linking_rules=None,
+                     use_content_similarity=False):
+    """Source URLs whose links have to be recomputed after a sitemap delta
+
+    `previous_links` is the previous plan as a DataFrame or an iterable of
+    them, such as crosslinker.sink.iter_plan chunks. Hierarchical rules take
+    the first max_targets pages of the source's prefix bucket, so only
+    buckets whose head changed affect their sources. With content similarity
+    the whole bucket is ranked, so any added or removed target affects every
+    source sharing its prefix.
+    """
+    if linking_rules is None:
+        linking_rules = LINKING_RULES
+    if isinstance(previous_links, pd.DataFrame):
+        previous_links = [previous_links]
+
+    affected = set(diff['added']) | set(diff['changed'])
+
+    # Sources whose existing links point at pages that went away or changed
+    stale = diff['removed'].union(diff['changed'])
+    for chunk in previous_links:
+        stale_targets = chunk['target_page'].isin(stale).to_numpy()
+        affected.update(chunk.loc[stale_targets, 'source_page'])
+
+    # Hierarchical rules: sources whose prefix bucket gained or lost a target
+    delta = pd.concat([
+        pages[pages['url'].isin(diff['added'])],
+        previous_pages[previous_pages['url'].isin(diff['removed'])],
+    ], ignore_index=True)
+    if not len(delta):
+        return affected
+
+    # Prefix keys per table and prefix length, built on first use
+    prefix_keys = {}
+    def keys_of(table, name, prefix_length):
+        if (name, prefix_length) not in prefix_keys:
+            prefix_keys[name, prefix_length] = _prefix_keys(table, prefix_length)
+        return prefix_keys[name, prefix_length]
+
+    for rule in linking_rules:
+        match = HIERARCHICAL_MATCHING.get((rule['source'], rule['target']))
+        if match is None:
+            continue
+        prefix_length, min_depth = match['prefix_length'], match['min_depth']
+        targets = delta[(delta['category'] == rule['target']) & (delta['depth'] >= min_depth)]
+        if not len(targets):
+            continue
+        keys = set(_prefix_keys(targets, prefix_length))
+
+        if not use_content_similarity:
+            # One extra page in case the source itself is excluded
+            size = rule['max_targets'] + (1 if match['exclude_self'] else 0)
+            before = _bucket_heads(previous_pages, keys_of(previous_pages, 'previous', prefix_length),
+                                   rule['target'], min_depth, keys, size)
+            after = _bucket_heads(pages, keys_of(pages, 'current', prefix_length),
+                                  rule['target'], min_depth, keys, size)
+            before, after = before.reindex(list(keys)), after.reindex(list(keys))
+            keys = {key for key, old, new in zip(keys, before, after) if old != new}
+            if not keys:
+                continue
+
+        hit = ((pages['category'] == rule['source']) & (pages['depth'] >= prefix_length)
+               & keys_of(pages, 'current', prefix_length).isin(keys))
+        affected.update(pages.loc[hit.to_numpy(), 'url'])
+
+    return affected
+
+def _settings(url_patterns, linking_rules, max_links, use_content_similarity, allocation, per_source):
+    return {
+        'url_patterns': dict(url_patterns),
+        'linking_rules': linking_rules,
+        'max_links': max_links,
+        'use_content_similarity': bool(use_content_similarity),
+        'allocation': allocation,
+        'per_source': bool(per_source),
+    }
+
+def _rule_pieces(chunks, rule_order, stream):
+    """Split link chunks in rule order into (rule index, stream, links) runs of a single rule"""
+    for chunk in chunks:
+        codes = chunk['link_type'].astype(object).map(rule_order).fillna(len(rule_order)).to_numpy(dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else []
+        for start, stop in zip(starts, list(starts[1:]) + [len(codes)]):
+            yield int(codes[start]), stream, chunk.iloc[start:stop]
+
+def _plan_sources(path, existing_links=None):
+    """(links per source URL, sources of links in existing_links) of a plan on disk"""
+    counts = []
+    linked = set()
+    for chunk in iter_plan(path, columns=['source_page', 'target_page']):
+        counts.append(chunk['source_page'].value_counts())
+        if existing_links is not None:
+            linked.update(chunk.loc[existing_links.contains(link_hashes(chunk)), 'source_page'])
+    if not counts:
+        return pd.Series(dtype=np.int64), linked
+    return pd.concat(counts).groupby(level=0).sum(), linked
+
+def diff_link_plans(previous_links, links):
+    """Change log between two plans: one row per added, removed or updated link"""
+    merged = previous_links.merge(links, on=LINK_KEY, how='outer', suffixes=('_previous', ''),
+                                  indicator=True)
+    columns = [column for column in links.columns if column not in LINK_KEY]
+
+    added = merged[merged['_merge'] == 'right_only']
+    removed = merged[merged['_merge'] == 'left_only']
+    both = merged[merged['_merge'] == 'both']
+    differs = np.zeros(len(both), dtype=bool)
+    for column in columns:
+        differs |= (_text(both[column]).to_numpy() != _text(both[f'{column}_previous']).to_numpy())
+    updated = both[differs]
+
+    for column in columns:
+        removed = removed.assign(**{column: removed[f'{column}_previous']})
+
+    change_log = pd.concat([
+        added.assign(change='added'),
+        removed.assign(change='removed'),
+        updated.assign(change='updated'),
+    ], ignore_index=True)
+    return change_log[['change'] + LINK_KEY + columns]
+
+def _changed_links(path, hashes, other_hashes):
+    """Links of a plan on disk whose row hash is not among `other_hashes`"""
+    changed = ~LinkHashSet(other_hashes).contains(hashes)
+    parts = []
+    start = 0
+    for chunk in iter_plan(path):
+        parts.append(chunk[changed[start:start + len(chunk)]])
+        start += len(chunk)
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=LINK_COLUMNS)
+
+def _row_hashes(path):
+    """Hash of each link of a plan on disk, over all of its columns as text"""
+    hashes = [pd.util.hash_pandas_object(chunk[LINK_COLUMNS].astype(str), index=False).to_numpy()
+              for chunk in iter_plan(path)]
+    return np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+
+def diff_plan_files(previous_path, path):
+    """diff_link_plans of two plans on disk, loading only the links that differ
+
+    Links are first compared by a hash of all their columns; those found in
+    both plans are left on disk.
+    """
+    previous_hashes, hashes = _row_hashes(previous_path), _row_hashes(path)
+    return diff_link_plans(_changed_links(previous_path, previous_hashes, hashes),
+                           _changed_links(path, hashes, previous_hashes))
+
+def _write_changes(path, change_logs):
+    """Write change log chunks to a CSV file; returns the number of changes"""
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        f.write(','.join(CHANGE_COLUMNS) + '\n')
+        for change_log in change_logs:
+            change_log[CHANGE_COLUMNS].to_csv(f, index=False, header=False)
+            rows += len(change_log)
+    return rows
+
+def generate_incremental_links(df, url_patterns, path, previous_state=None, max_links=1000,
+                               use_content_similarity=False, linking_rules=None, log=None, progress=None,
+                               workers=1, report=None, allocation='sequential', per_source=False,
+                               existing_links=None, changes_path=None, anchor_seed=None):
+    """Regenerate a plan, recomputing only the sources affected since `previous_state`
+
+    Writes the plan before balancing to `path`, a plan file in any sink
+    format (see crosslinker.sink), and with `changes_path` a CSV change log
+    as diff_link_plans builds it. Returns (link_count, change_count, state),
+    where state is for save_plan_state.
+
+    Within each rule, recomputed sources follow the carried-over links and
+    max_links is applied to the merged plan. When the previous plan was cut
+    off at max_links, room left by the change goes to the sources it never
+    reached. Falls back to a full run without a previous state or when the
+    settings changed. A weighted or per-source budget (see
+    crosslinker.budget) is shared out over every source page, so a plan
+    under one that does not fit under max_links is regenerated in full.
+    Links in `existing_links` (see crosslinker.inlinks) are never
+    recommended, and sources of stored links the site now has are
+    recomputed.
+    """
+    log = log or (lambda message: None)
+    report = report or NULL_REPORT
+    if linking_rules is None:
+        linking_rules = LINKING_RULES
+
+    if 'Status Code' in df.columns:
+        df = df[df['Status Code'] == 200]
+    with report.span('categorize'):
+        pages = build_page_table(df, url_patterns)
+    pages['lastmod'] = df['Last Modified'].to_numpy() if 'Last Modified' in df.columns else None
+    with report.span('page_index'):
+        page_index = SegmentPrefixIndex(pages)
+    settings = _settings(url_patterns, linking_rules, max_links, use_content_similarity, allocation, per_source)
+    state = {'pages': pages, 'links': path, 'settings': settings}
+
+    options = {
+        'use_content_similarity': use_content_similarity,
+        'linking_rules': linking_rules,
+        'log': log,
+        'progress': progress,
+        'pages': pages,
+        'page_index': page_index,
+        'workers': workers,
+        'report': report,
+        'existing_links': existing_links,
+        'anchor_seed': anchor_seed,
+    }
+
+    def full_run():
+        link_count = write_link_chunks(iter_link_chunks(df, url_patterns, max_links=max_links, allocation=allocation,
+                                                        per_source=per_source, **options), path, report=report)
+        if previous_state is None:
+            # Every link is new
+            if changes_path:
+                _write_changes(changes_path, (chunk.assign(change='added') for chunk in iter_plan(path)))
+            return link_count, link_count, state
+        change_log = diff_plan_files(previous_state['links'], path)
+        if changes_path:
+            _write_changes(changes_path, [change_log])
+        return link_count, len(change_log), state
+
+    if previous_state is None:
+        return full_run()
+    # JSON round trip so tuples and lists compare equal
+    if json.loads(json.dumps(settings)) != previous_state['settings']:
+        log("Settings changed since the previous run; regenerating the full plan")
+        return full_run()
+
+    budgeted = allocation != 'sequential' or per_source
+    previous_pages, previous_path = previous_state['pages'], previous_state['links']
+    source_counts, linked = _plan_sources(previous_path, existing_links)
+    previous_count = int(source_counts.sum())
+    capped = previous_count >= max_links
+    if capped and budgeted:
+        log("Previous plan was cut off at max_links by the link budget; regenerating the full plan")
+        return full_run()
+
+    diff = diff_page_tables(previous_pages, pages)
+    log(f"Sitemap delta: {len(diff['added'])} added, {len(diff['removed'])} removed, "
+        f"{len(diff['changed'])} changed pages")
+
+    affected = affected_sources(previous_pages, pages, iter_plan(previous_path, columns=['source_page', 'target_page']),
+                                diff, linking_rules, use_content_similarity)
+    # The site has added some of the planned links since; those sources get new ones
+    affected |= linked
+    touched = affected | set(diff['removed'])
+    log(f"Recomputing links for {len(affected)} source pages")
+    report.count('incremental.affected_sources', len(affected))
+    kept_count = previous_count - int(source_counts[source_counts.index.isin(touched)].sum())
+
+    rule_order = {f"{rule['source']}_to_{rule['target']}": i for i, rule in enumerate(linking_rules)}
+    with tempfile.TemporaryDirectory(prefix='.crosslinker-', dir=os.path.dirname(os.path.abspath(path))) as scratch:
+        # Links of the recomputed sources, in rule order like the stored plan
+        recomputed_path = os.path.join(scratch, 'recomputed' + default_plan_extension())
+        new_count = write_link_chunks(
+            iter_link_chunks(df, url_patterns, max_links=max_links, source_urls=affected, **options)
+            if affected else [], recomputed_path, report=report
+        )
+        if budgeted and kept_count + new_count > max_links:
+            log("Plan no longer fits under max_links; regenerating the full plan with the link budget")
+            return full_run()
+        streams = [iter_plan(recomputed_path)]
+
+        room = max_links - kept_count - new_count
+        if capped and room > 0:
+            # A serial run would have gone on to the sources the previous plan never reached
+            unreached = set(pages['url']) - set(source_counts.index) - touched
+            log(f"Filling {room} links left under max_links from {len(unreached)} more source pages")
+            unreached_path = os.path.join(scratch, 'unreached' + default_plan_extension())
+            write_link_chunks(
+                iter_link_chunks(df, url_patterns, max_links=room, source_urls=unreached, **options)
+                if unreached else [], unreached_path, report=report
+            )
+            streams.append(iter_plan(unreached_path))
+
+        previous_touched = []
+        def kept_chunks():
+            for chunk in iter_plan(previous_path):
+                is_touched = chunk['source_page'].isin(touched).to_numpy()
+                if is_touched.any():
+                    previous_touched.append(chunk[is_touched])
+                yield chunk[~is_touched]
+
+        # Carried-over links (stream 0) come first within each rule, then max_links cuts the merged plan
+        pieces = [_rule_pieces(kept_chunks(), rule_order, 0)]
+        pieces += [_rule_pieces(stream, rule_order, number) for number, stream in enumerate(streams, 1)]
+        link_count = 0
+        new_links, cut = [], []
+        with open_link_sink(path) as sink:
+            for _, stream, links in heapq.merge(*pieces, key=lambda piece: piece[0]):
+                taken = links.iloc[:max(0, max_links - link_count)]
+                if len(taken):
+                    with report.span('write'):
+                        sink.write(taken)
+                    link_count += len(taken)
+                if stream:
+                    new_links.append(taken)
+                elif len(taken) < len(links):
+                    cut.append(links.iloc[len(taken):])
+
+    empty = pd.DataFrame(columns=LINK_COLUMNS)
+    change_log = diff_link_plans(pd.concat(previous_touched, ignore_index=True) if previous_touched else empty,
+                                 pd.concat(new_links, ignore_index=True) if new_links else empty)
+    # Carried-over links that no longer fit under max_links
+    change_logs = [change_log] + [links.assign(change='removed') for links in cut]
+    change_count = sum(len(part) for part in change_logs)
+    if changes_path:
+        _write_changes(changes_path, change_logs)
+    return link_count, change_count, state
@@ -0,0 +1,239 @@
+"""Links a site already has, from a crawler's "All Inlinks" export.
+
+Inlink exports list every link on a site as source/destination pairs, often
+hundreds of millions of rows. iter_inlink_chunks streams them in chunks and
+each link is reduced to a 64-bit hash of its source and target URLs, kept in
+a LinkHashSet (a sorted array, 8 bytes per distinct link) or, with a known
+capacity, a LinkBloomFilter (about 10 bits per link at a 1% false positive
+rate). Link generation skips candidates whose hash is in the set before they
+count against max_targets or max_links. A hash collision or Bloom filter
+false positive can only drop a recommendation, never add one.
+
+URLs are compared as they are written, so the export and the page table
+should use the same form of each URL (scheme, trailing slash).
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from .sources import CSV_BLOCK_SIZE, CSV_CHUNK_ROWS, _csv_header, infer_input_format
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # CSV exports are read in pandas chunks instead; Parquet/Arrow need pyarrow
+    pa = None
+
+# Column names of a link's source and target: Screaming Frog ('Source',
+# 'Destination'), other crawlers, and plans written by crosslinker
+INLINK_SOURCE_COLUMNS = ['Source', 'From', 'Source URL', 'source_page']
+INLINK_TARGET_COLUMNS = ['Destination', 'To', 'Destination URL', 'Target URL', 'target_page']
+
+# Screaming Frog also lists images, CSS and scripts; only hyperlinks link pages
+INLINK_TYPE_COLUMN = 'Type'
+HYPERLINK_TYPE = 'Hyperlink'
+
+DEFAULT_ERROR_RATE = 0.01
+
+# Mixes the source hash before combining, so (a, b) and (b, a) hash differently
+_PAIR_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+def url_hashes(urls):
+    """64-bit hash of each URL; categoricals hash each distinct URL once"""
+    if isinstance(getattr(urls, 'dtype', None), pd.CategoricalDtype):
+        codes = urls.cat.codes.to_numpy()
+        hashes = pd.util.hash_array(np.asarray(urls.cat.categories, dtype=object))
+        return np.where(codes >= 0, hashes[codes], np.uint64(0))
+    return pd.util.hash_array(np.asarray(urls, dtype=object))
+
+def pair_hashes(source_hashes, target_hashes):
+    """Hash of each link from the url_hashes of its source and target"""
+    return (np.asarray(source_hashes, dtype=np.uint64) * _PAIR_MULTIPLIER) ^ np.asarray(target_hashes,
+                                                                                         dtype=np.uint64)
+
+def link_hashes(links):
+    """Hash of each link of a DataFrame with source_page and target_page columns"""
+    return pair_hashes(url_hashes(links['source_page']), url_hashes(links['target_page']))
+
+def _pick_column(names, candidates, role):
+    for name in candidates:
+        if name in names:
+            return name
+    raise ValueError(f"Inlinks export has no {role} column (expected one of: {', '.join(candidates)})")
+
+def _inlink_columns(names):
+    """(source, target, type or None) column names of an export"""
+    return (_pick_column(names, INLINK_SOURCE_COLUMNS, 'source'),
+            _pick_column(names, INLINK_TARGET_COLUMNS, 'destination'),
+            INLINK_TYPE_COLUMN if INLINK_TYPE_COLUMN in names else None)
+
+def _inlink_frame(frame, source, target, link_type):
+    """Hyperlink rows of a chunk as source_page and target_page"""
+    if link_type is not None:
+        frame = frame[(frame[link_type].astype(object) == HYPERLINK_TYPE).to_numpy()]
+    return pd.DataFrame({'source_page': frame[source].reset_index(drop=True),
+                         'target_page': frame[target].reset_index(drop=True)})
+
+def _arrow_batches(path_or_buffer, file_format, chunk_size):
+    """(column names, record batches) of an export, read with pyarrow"""
+    if file_format == 'parquet':
+        source = pq.ParquetFile(path_or_buffer)
+        names = source.schema_arrow.names
+        columns = [name for name in _inlink_columns(names) if name is not None]
+        return names, source.iter_batches(batch_size=chunk_size, columns=columns)
+    if file_format == 'arrow':
+        source = pa.ipc.open_file(path_or_buffer)
+        return source.schema.names, (source.get_batch(i) for i in range(source.num_record_batches))
+    names = _csv_header(path_or_buffer)
+    columns = [name for name in _inlink_columns(names) if name is not None]
+    # Dictionary-encoded, so each block hashes every distinct URL once
+    reader = pa_csv.open_csv(
+        path_or_buffer,
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            column_types={column: pa.dictionary(pa.int32(), pa.string()) for column in columns},
+            strings_can_be_null=True,
+        ),
+    )
+    return names, reader
+
+def iter_inlink_chunks(path_or_buffer, file_format=None, chunk_size=CSV_CHUNK_ROWS):
+    """Stream a crawler inlinks export as DataFrames of source_page and target_page
+
+    Reads CSV, Parquet or Arrow IPC (inferred from the file name unless
+    given), a block at a time, keeping only hyperlinks when the export has
+    a Type column. URL columns are categorical where pyarrow reads them.
+    """
+    file_format = file_format or infer_input_format(getattr(path_or_buffer, 'name', path_or_buffer))
+    if pa is None:
+        if file_format != 'csv':
+            raise ImportError("Parquet and Arrow input require pyarrow (pip install pyarrow)")
+        columns = _inlink_columns(_csv_header(path_or_buffer))
+        reader = pd.read_csv(path_or_buffer, usecols=[name for name in columns if name is not None],
+                             dtype='str', chunksize=chunk_size)
+        with reader:
+            for chunk in reader:
+                yield _inlink_frame(chunk, *columns)
+        return
+
+    names, batches = _arrow_batches(path_or_buffer, file_format, chunk_size)
+    columns = _inlink_columns(names)
+    for batch in batches:
+        frame = batch.select([name for name in columns if name is not None]).to_pandas()
+        yield _inlink_frame(frame, *columns)
+
+class LinkHashSet:
+    """Exact set of link hashes, stored as a sorted array of distinct uint64
+
+    add buffers hashes and merges them into the array once the buffer is as
+    large as the array, so adding n hashes sorts O(log n) times.
+    """
+
+    def __init__(self, hashes=None):
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self._pending = []
+        self._pending_count = 0
+        if hashes is not None:
+            self.add(hashes)
+
+    def add(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        self._pending.append(hashes)
+        self._pending_count += len(hashes)
+        if self._pending_count >= max(len(self.hashes), CSV_CHUNK_ROWS):
+            self._merge()
+
+    def _merge(self):
+        if self._pending:
+            hashes = np.concatenate([self.hashes] + self._pending)
+            hashes.sort()
+            self.hashes = hashes[np.r_[True, hashes[1:] != hashes[:-1]]] if len(hashes) else hashes
+            self._pending = []
+            self._pending_count = 0
+
+    def contains(self, hashes):
+        """Mask of the `hashes` in the set"""
+        self._merge()
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        # Hashes past the last one are compared with it, and cannot match
+        positions = self.hashes.searchsorted(hashes)
+        np.minimum(positions, len(self.hashes) - 1, out=positions)
+        return self.hashes[positions] == hashes
+
+    def __len__(self):
+        self._merge()
+        return len(self.hashes)
+
+    @property
+    def nbytes(self):
+        return self.hashes.nbytes + sum(pending.nbytes for pending in self._pending)
+
+class LinkBloomFilter:
+    """Bloom filter of link hashes sized for `capacity` links
+
+    Takes about -log2(error_rate) / ln 2 bits per link, whatever the URL
+    lengths; beyond `capacity` links the false positive rate rises above
+    `error_rate`. Bit positions come from the two halves of each link hash
+    (double hashing).
+    """
+
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE):
+        if not 0 < error_rate < 1:
+            raise ValueError(f"Bloom filter error rate must be between 0 and 1, not {error_rate}")
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bit_count = max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.bit_count / capacity * math.log(2))), 1)
+        self.bits = np.zeros((self.bit_count + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, hashes):
+        """Bit positions of each hash, one row per hash"""
+        hashes = np.asarray(hashes, dtype=np.uint64)[:, None]
+        first = hashes & np.uint64(0xFFFFFFFF)
+        step = (hashes >> np.uint64(32)) | np.uint64(1)
+        return (first + np.arange(self.hash_count, dtype=np.uint64) * step) % np.uint64(self.bit_count)
+
+    def add(self, hashes):
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(positions) // self.hash_count
+
+    def contains(self, hashes):
+        """Mask of the `hashes` probably in the set; never False for an added hash"""
+        positions = self._positions(hashes)
+        bits = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7))) & 1
+        return bits.all(axis=1)
+
+    def __len__(self):
+        """Number of links added, counting repeats"""
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+def load_existing_links(path_or_buffer, file_format=None, capacity=None, error_rate=DEFAULT_ERROR_RATE,
+                        log=None):
+    """Read an inlinks export into a LinkHashSet, or a LinkBloomFilter sized for `capacity` links
+
+    See iter_inlink_chunks for the formats read. Only the hashes of the
+    links are kept, so memory depends on the number of links rather than
+    the length of their URLs.
+    """
+    log = log or (lambda message: None)
+    links = LinkBloomFilter(capacity, error_rate) if capacity else LinkHashSet()
+    rows = 0
+    for chunk in iter_inlink_chunks(path_or_buffer, file_format):
+        links.add(link_hashes(chunk))
+        rows += len(chunk)
+    log(f"Loaded {rows} existing links ({links.nbytes / 2**20:.1f} MB)")
+    return links
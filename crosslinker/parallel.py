@@ -0,0 +1,252 @@
+"""Multi-process link generation sharded by the first URL path segment.
+
+Every hierarchical rule (HIERARCHICAL_MATCHING) draws its targets from pages
+sharing at least the source's first path segment, so for those rules the page
+table splits into independent shards by segment_0. Shards run in a process
+pool while the randomly sampled, cross-shard rules run in the calling process.
+
+Each rule and shard samples with its own random.Random, seeded from a
+single draw of the caller's `random` state, which is otherwise left alone,
+so a seeded run gives the same plan whatever the number of workers and
+whichever shard finishes first. The plan is not the
+one a serial run draws, but it follows the same order (rule, then source
+page in table order) and the same max_links cut-off. Anchor texts are
+assigned after merging, rotating over the plan in that order as in a serial
+run, so links cut off by max_links never build theirs.
+Weighted and per-source budgets (crosslinker.budget) are computed once here
+from the whole page table and each rule's share is applied when merging.
+Shards cannot see each other's links, so the max_links cut happens at the
+merge. Each task skips what its earlier rules already fill of max_links,
+but a shard may still generate links the merge then cuts, an overhead that
+grows with the number of shards when max_links is far below the plan's
+size; the plan_parallel stage of benchmarks.run reports it.
+Existing links (crosslinker.inlinks) are sent to each worker process once,
+when it starts, rather than with every task.
+"""
+import concurrent.futures
+import heapq
+import os
+import random
+
+import numpy as np
+
+from .anchors import AnchorTextEngine
+from .engine import HIERARCHICAL_MATCHING, LINKING_RULES, SegmentPrefixIndex, iter_link_records, link_budget
+from .report import NULL_REPORT, RunReport
+from .similarity import SimilarityIndex
+
+# Tasks per worker process, so large and small shards even out
+TASKS_PER_WORKER = 4
+
+# The existing_links of the run, set in each worker process by _set_existing_links
+_existing_links = None
+
+def _set_existing_links(existing_links):
+    global _existing_links
+    _existing_links = existing_links
+
+def _seed(base_seed, rule_index, key=''):
+    return f'{base_seed}:{rule_index}:{key}'
+
+class _DeferredAnchors:
+    """Stands in for an AnchorTextEngine while anchors wait for the merge"""
+
+    def anchor(self, row):
+        return None
+
+def _columns(records):
+    """Split link records of one rule into (source rows, target rows, positions, scores)"""
+    _, source_rows, target_rows, _, positions, scores = zip(*records)
+    return (np.array(source_rows, dtype=np.int64), np.array(target_rows, dtype=np.int64),
+            np.array(positions, dtype=np.int64), np.array(scores, dtype=np.float64))
+
+def _generate_shards(pages, rows, shards, matrix, url_ids, linking_rules, rule_indexes, max_links,
+                     base_seed, source_urls, instrument=False, quotas=None, source_caps=None):
+    """Run the sharded rules over each shard of one task
+
+    `pages` holds the task's rows of the page table, whose positions in the
+    full table are `rows`; `shards` is a list of (key, positions in `pages`).
+    `quotas` and `source_caps` are dicts of rule index -> links the rule may
+    add and per-page caps over `pages`, from link_budget. Returns a dict of
+    rule index -> list of column tuples (see _columns) with rows translated
+    back to the full table, and with `instrument` the task's RunReport as a
+    dict (else None).
+    """
+    report = RunReport() if instrument else None
+    results = {rule_index: [] for rule_index in rule_indexes}
+    prepared = []
+    for key, shard_rows in shards:
+        shard = pages.iloc[shard_rows].reset_index(drop=True)
+        similarity = None
+        if matrix is not None:
+            similarity = SimilarityIndex(matrix[shard_rows], url_ids[shard_rows])
+        prepared.append((key, shard_rows, shard, SegmentPrefixIndex(shard), similarity))
+
+    # Links this task keeps for earlier rules are a lower bound of those the
+    # merge keeps, so later rules only need what max_links has left after them
+    kept = 0
+    for rule_index in rule_indexes:
+        quota = quotas[rule_index] if quotas is not None else max_links
+        limit = min(quota, max_links - kept)
+        if limit <= 0:
+            continue
+        rule_links = 0
+        for key, shard_rows, shard, page_index, similarity in prepared:
+            rule_caps = None
+            if source_caps is not None:
+                rule_caps = [source_caps[rule_index][shard_rows]]
+            # The merge keeps a prefix of each shard's links, at most `limit` long
+            records = list(iter_link_records(shard, page_index, similarity, max_links=limit,
+                                             linking_rules=[linking_rules[rule_index]],
+                                             source_urls=source_urls, report=report, anchors=_DeferredAnchors(),
+                                             source_caps=rule_caps, existing_links=_existing_links,
+                                             rng=random.Random(_seed(base_seed, rule_index, key))))
+            if records:
+                full_rows = rows[shard_rows]
+                source_rows, target_rows, positions, scores = _columns(records)
+                results[rule_index].append((full_rows[source_rows], full_rows[target_rows], positions, scores))
+                rule_links += len(records)
+        kept += min(rule_links, quota)
+    return results, report.to_dict() if report is not None else None
+
+def _pack_shards(shards, task_count):
+    """Spread (key, rows) shards over `task_count` tasks, largest first"""
+    tasks = [(0, number, []) for number in range(task_count)]
+    for key, rows in sorted(shards, key=lambda shard: -len(shard[1])):
+        size, number, task = heapq.heappop(tasks)
+        task.append((key, rows))
+        heapq.heappush(tasks, (size + len(rows), number, task))
+    return [task for _, _, task in sorted(tasks, key=lambda task: task[1]) if task]
+
+def iter_link_columns_parallel(pages, page_index, similarity=None, max_links=1000, linking_rules=None,
+                               log=None, progress=None, source_urls=None, workers=None, report=None,
+                               allocation='sequential', per_source=False, existing_links=None,
+                               anchor_seed=None):
+    """Shard hierarchical rules by segment_0 over `workers` processes
+
+    Yields one (rule_index, source_rows, target_rows, anchors, positions,
+    scores) tuple of arrays per rule that produced links, in rule order;
+    iter_link_records_parallel turns them into records. `workers` defaults to
+    the number of CPUs. Rule spans of sharded rules add up the time of every
+    shard, across processes. `allocation`, `per_source`, `existing_links` and
+    `anchor_seed` are those of iter_link_records; anchors are seeded with the
+    run's base seed when `anchor_seed` is not given.
+    """
+    log = log or (lambda message: None)
+    progress = progress or (lambda label, fraction: None)
+    report = report or NULL_REPORT
+    if linking_rules is None:
+        linking_rules = LINKING_RULES
+    workers = workers or os.cpu_count() or 1
+
+    base_seed = random.getrandbits(64)
+    if anchor_seed is None:
+        anchor_seed = base_seed
+    report.record('anchor_seed', anchor_seed)
+    sharded = [i for i, rule in enumerate(linking_rules)
+               if (rule['source'], rule['target']) in HIERARCHICAL_MATCHING]
+    central = [i for i in range(len(linking_rules)) if i not in sharded]
+
+    # Pages without a first segment never match a hierarchical rule
+    codes = pages['segment_0'].cat.codes.to_numpy()
+    categories = pages['segment_0'].cat.categories
+    valid = np.flatnonzero(codes >= 0)
+    order = valid[np.argsort(codes[valid], kind='stable')]
+    starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]]) if len(order) else []
+    shards = [(str(categories[codes[rows[0]]]), rows) for rows in np.split(order, starts[1:]) if len(rows)]
+
+    source_mask = pages['url'].isin(source_urls).to_numpy() if source_urls is not None else None
+    quotas = caps = None
+    if allocation != 'sequential' or per_source:
+        quotas, caps = link_budget(page_index, linking_rules, max_links, allocation, per_source, source_mask)
+    tasks = _pack_shards(shards, min(len(shards), workers * TASKS_PER_WORKER)) if sharded else []
+    log(f"Generating links for {len(shards)} shards on {workers} processes...")
+
+    results = {rule_index: [] for rule_index in range(len(linking_rules))}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_set_existing_links,
+                                                initargs=(existing_links,)) as executor:
+        futures = []
+        for task in tasks:
+            rows = np.concatenate([shard_rows for _, shard_rows in task])
+            offsets = np.cumsum([0] + [len(shard_rows) for _, shard_rows in task])
+            local = [(key, np.arange(start, stop)) for (key, _), start, stop in zip(task, offsets, offsets[1:])]
+            task_sources = None
+            if source_mask is not None:
+                task_sources = set(pages['url'].iloc[rows[source_mask[rows]]])
+            task_quotas = task_caps = None
+            if quotas is not None:
+                task_quotas = {rule_index: quotas[rule_index] for rule_index in sharded}
+            if caps is not None:
+                task_caps = {rule_index: caps[rule_index][rows] for rule_index in sharded}
+            futures.append(executor.submit(
+                _generate_shards, pages.iloc[rows], rows, local,
+                similarity.matrix[rows] if similarity is not None else None,
+                similarity.url_ids[rows] if similarity is not None else None,
+                linking_rules, sharded, max_links, base_seed, task_sources, report.enabled,
+                task_quotas, task_caps
+            ))
+
+        # Cross-shard rules sample from whole categories; run them here meanwhile
+        for rule_index in central:
+            records = list(iter_link_records(pages, page_index, similarity,
+                                             max_links=quotas[rule_index] if quotas is not None else max_links,
+                                             linking_rules=[linking_rules[rule_index]], log=log,
+                                             source_urls=source_urls, report=report, anchors=_DeferredAnchors(),
+                                             source_caps=[caps[rule_index]] if caps is not None else None,
+                                             existing_links=existing_links,
+                                             rng=random.Random(_seed(base_seed, rule_index))))
+            if records:
+                results[rule_index].append(_columns(records))
+
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            task_results, task_report = future.result()
+            for rule_index, parts in task_results.items():
+                results[rule_index].extend(parts)
+            if task_report is not None:
+                report.merge(task_report)
+            progress("Generating links", done / len(futures))
+
+    # Merge in serial order and apply max_links across rules as a serial run does
+    anchor_engine = AnchorTextEngine(pages, seed=anchor_seed)
+    link_count = 0
+    for rule_index, parts in results.items():
+        if not parts:
+            continue
+        source_rows, target_rows, positions, scores = (np.concatenate(column) for column in zip(*parts))
+        # Stable, so each source keeps its targets in order
+        order = np.argsort(source_rows, kind='stable')
+        limit = max_links - link_count
+        if quotas is not None:
+            limit = min(limit, quotas[rule_index])
+        order = order[:max(0, limit)]
+        # Links cut here were counted as emitted by their shard
+        cut = len(source_rows) - len(order)
+        if cut:
+            rule = linking_rules[rule_index]
+            link_type = f"{rule['source']}_to_{rule['target']}"
+            report.count(f'rule.{link_type}.links', -cut)
+            report.count(f'rule.{link_type}.truncated', cut)
+            report.count('links.emitted', -cut)
+            report.count('links.truncated', cut)
+        if not len(order):
+            continue
+        target_rows = target_rows[order]
+        with report.span('anchors'):
+            codes = anchor_engine.anchor_codes(target_rows)
+            anchors = np.asarray(anchor_engine.texts, dtype=object)[codes]
+        yield rule_index, source_rows[order], target_rows, anchors, positions[order], scores[order]
+        link_count += len(order)
+
+def iter_link_records_parallel(pages, page_index, similarity=None, max_links=1000, linking_rules=None,
+                               log=None, progress=None, source_urls=None, workers=None, report=None,
+                               allocation='sequential', per_source=False, existing_links=None,
+                               anchor_seed=None):
+    """Parallel iter_link_records; takes the options of iter_link_columns_parallel"""
+    for rule_index, *columns in iter_link_columns_parallel(pages, page_index, similarity, max_links=max_links,
+                                                           linking_rules=linking_rules, log=log,
+                                                           progress=progress, source_urls=source_urls,
+                                                           workers=workers, report=report,
+                                                           allocation=allocation, per_source=per_source,
+                                                           existing_links=existing_links,
+                                                           anchor_seed=anchor_seed):
+        yield from zip([rule_index] * len(columns[0]), *(column.tolist() for column in columns))
@@ -0,0 +1,216 @@
+"""Compact in-memory link plans.
+
+Link dicts repeat both page URLs and every rule field on each row. A LinkPlan
+stores each URL once in an ID table and links as typed columns: int32 source
+and target IDs, categorical link_type, placement, priority and anchor_text,
+uint16 positions (0 where the link has none) and float32 relevance scores.
+URLs and the mixed int/'' position column are only materialised by to_frame,
+one chunk at a time at export.
+"""
+import numpy as np
+import pandas as pd
+
+from .engine import (
+    DEFAULT_LINK_CHUNK_SIZE,
+    LINK_COLUMNS,
+    LINKING_RULES,
+    balance_link_distribution,
+    iter_link_records,
+    prepare_link_generation,
+)
+from .parallel import iter_link_columns_parallel
+from .report import NULL_REPORT
+
+# Columns stored as pandas categoricals
+CATEGORY_COLUMNS = ['link_type', 'anchor_text', 'placement', 'priority']
+
+def _links_frame(columns):
+    """Compact links table from a dict of column name -> values"""
+    links = pd.DataFrame({
+        'source_page': np.asarray(columns['source_page'], dtype=np.int32),
+        'target_page': np.asarray(columns['target_page'], dtype=np.int32),
+        'position': np.asarray(columns['position'], dtype=np.uint16),
+        'relevance_score': np.asarray(columns['relevance_score'], dtype=np.float32),
+    })
+    for column in CATEGORY_COLUMNS:
+        values = columns[column]
+        links[column] = values if isinstance(values, pd.Categorical) else pd.Categorical(values)
+    return links[LINK_COLUMNS]
+
+class LinkPlan:
+    """A link plan over an interned page table
+
+    `urls` is an Index of unique page URLs and `links` a DataFrame with the
+    LINK_COLUMNS, where source_page and target_page are int32 positions in
+    `urls`.
+    """
+
+    def __init__(self, urls, links):
+        self.urls = pd.Index(urls)
+        self.links = links
+
+    def __len__(self):
+        return len(self.links)
+
+    @classmethod
+    def from_frame(cls, links_df):
+        """Intern a plan of URL strings such as generate_cross_links output"""
+        pages = pd.concat([links_df['source_page'], links_df['target_page']], ignore_index=True)
+        ids, urls = pd.factorize(pages)
+        # '' in link dicts, missing in plans read back by crosslinker.sink.iter_plan
+        position = pd.to_numeric(links_df['position'], errors='coerce').fillna(0)
+        columns = {column: links_df[column].to_numpy() for column in CATEGORY_COLUMNS}
+        columns.update({
+            'source_page': ids[:len(links_df)],
+            'target_page': ids[len(links_df):],
+            'position': position.to_numpy(),
+            'relevance_score': links_df['relevance_score'].to_numpy(),
+        })
+        return cls(urls, _links_frame(columns))
+
+    @classmethod
+    def concat(cls, plans, urls=None):
+        """Join plans sharing the same URL table"""
+        plans = list(plans)
+        if urls is None:
+            urls = plans[0].urls if plans else pd.Index([], dtype=object)
+        if not plans:
+            return cls(urls, _links_frame({column: [] for column in LINK_COLUMNS}))
+        columns = {
+            column: np.concatenate([plan.links[column].to_numpy() for plan in plans])
+            for column in LINK_COLUMNS if column not in CATEGORY_COLUMNS
+        }
+        for column in CATEGORY_COLUMNS:
+            columns[column] = pd.api.types.union_categoricals([plan.links[column] for plan in plans])
+        return cls(urls, _links_frame(columns))
+
+    def take(self, rows):
+        """Plan of the links at the given row positions"""
+        return LinkPlan(self.urls, self.links.iloc[rows].reset_index(drop=True))
+
+    def balance(self, **options):
+        """Balanced copy of the plan; takes the options of balance_link_distribution"""
+        return LinkPlan(self.urls, balance_link_distribution(self.links, **options).reset_index(drop=True))
+
+    def to_frame(self, start=None, stop=None):
+        """Materialise links[start:stop] with URL strings, as generate_cross_links would"""
+        links = self.links.iloc[start:stop]
+        position = links['position'].to_numpy()
+        positions = position.astype(object)
+        positions[position == 0] = ''
+        urls = self.urls.array
+        return pd.DataFrame({
+            'source_page': urls.take(links['source_page'].to_numpy()),
+            'target_page': urls.take(links['target_page'].to_numpy()),
+            'link_type': links['link_type'].astype(str).to_numpy(),
+            'anchor_text': links['anchor_text'].astype(str).to_numpy(),
+            'placement': links['placement'].astype(str).to_numpy(),
+            'priority': links['priority'].astype(str).to_numpy(),
+            'position': positions,
+            # float32 keeps the 4 decimals the engine rounds to
+            'relevance_score': links['relevance_score'].to_numpy(dtype=np.float64).round(4),
+        })
+
+    def iter_frames(self, chunk_size=DEFAULT_LINK_CHUNK_SIZE):
+        """Materialise the plan as DataFrames of at most `chunk_size` rows"""
+        for start in range(0, len(self), chunk_size):
+            yield self.to_frame(start, start + chunk_size)
+
+    def memory_usage(self):
+        """Bytes held by the links and the URL table"""
+        return int(self.links.memory_usage(deep=True).sum() + self.urls.memory_usage(deep=True))
+
+def _rule_codes(linking_rules):
+    """Per-rule codes and categories of link_type, placement and priority"""
+    values = {
+        'link_type': [f"{rule['source']}_to_{rule['target']}" for rule in linking_rules],
+        'placement': [rule['placement'] for rule in linking_rules],
+        'priority': [rule['priority'] for rule in linking_rules],
+    }
+    return {column: pd.factorize(np.array(column_values, dtype=object))
+            for column, column_values in values.items()}
+
+def iter_link_plans(df, url_patterns, chunk_size=DEFAULT_LINK_CHUNK_SIZE, max_links=1000,
+                    use_content_similarity=False, fetch_titles=False, linking_rules=None, log=None,
+                    progress=None, pages=None, source_urls=None, workers=1, report=None, page_index=None,
+                    allocation='sequential', per_source=False, existing_links=None, anchor_seed=None):
+    """Generate links as LinkPlans of at most `chunk_size` links sharing one URL table
+
+    Takes the options of iter_cross_links, plus a SegmentPrefixIndex over
+    `pages` to reuse as `page_index`.
+    """
+    if linking_rules is None:
+        linking_rules = LINKING_RULES
+    report = report or NULL_REPORT
+
+    pages, page_index, similarity = prepare_link_generation(
+        df, url_patterns, use_content_similarity=use_content_similarity, fetch_titles=fetch_titles,
+        log=log, progress=progress, pages=pages, report=report, page_index=page_index
+    )
+    # Duplicate rows of a URL share its ID
+    url_ids, urls = pd.factorize(pages['url'])
+    url_ids = url_ids.astype(np.int32)
+    rule_codes = _rule_codes(linking_rules)
+
+    def build(rule_index, source_rows, target_rows, anchors, positions, scores):
+        with report.span('compact'):
+            rule_index = np.asarray(rule_index, dtype=np.intp)
+            columns = {
+                'source_page': url_ids[np.asarray(source_rows, dtype=np.intp)],
+                'target_page': url_ids[np.asarray(target_rows, dtype=np.intp)],
+                'position': positions,
+                'relevance_score': scores,
+            }
+            anchor_codes, anchor_values = pd.factorize(np.asarray(anchors, dtype=object))
+            columns['anchor_text'] = pd.Categorical.from_codes(anchor_codes, categories=anchor_values)
+            for column, (codes, categories) in rule_codes.items():
+                columns[column] = pd.Categorical.from_codes(codes[rule_index], categories=categories)
+            return LinkPlan(urls, _links_frame(columns))
+
+    options = {
+        'max_links': max_links,
+        'linking_rules': linking_rules,
+        'log': log,
+        'progress': progress,
+        'source_urls': source_urls,
+        'report': report,
+        'allocation': allocation,
+        'per_source': per_source,
+        'existing_links': existing_links,
+        'anchor_seed': anchor_seed,
+    }
+    if workers is None or workers > 1:
+        # Parallel runs hand back whole rules as arrays; skip the records
+        for rule_index, *columns in iter_link_columns_parallel(pages, page_index, similarity, workers=workers,
+                                                               **options):
+            for start in range(0, len(columns[0]), chunk_size):
+                chunk = [column[start:start + chunk_size] for column in columns]
+                yield build(np.full(len(chunk[0]), rule_index), *chunk)
+        return
+
+    batch = []
+    for record in iter_link_records(pages, page_index, similarity, **options):
+        batch.append(record)
+        if len(batch) >= chunk_size:
+            yield build(*zip(*batch))
+            batch = []
+    if batch:
+        yield build(*zip(*batch))
+
+def generate_link_plan(df, url_patterns, chunk_size=DEFAULT_LINK_CHUNK_SIZE, **options):
+    """Generate a whole plan as a LinkPlan
+
+    Takes the options of iter_cross_links. Links are compacted one chunk of
+    records at a time, so the plan never exists as link dicts.
+    """
+    plans = list(iter_link_plans(df, url_patterns, chunk_size=chunk_size, **options))
+    return LinkPlan.concat(plans)
+
+def iter_link_chunks(df, url_patterns, chunk_size=DEFAULT_LINK_CHUNK_SIZE, **options):
+    """Generate links as DataFrames of at most `chunk_size` rows
+
+    Takes the options of iter_cross_links. Only one chunk of links is held at
+    a time, so chunks can go straight to a sink on disk.
+    """
+    for plan in iter_link_plans(df, url_patterns, chunk_size=chunk_size, **options):
+        yield plan.to_frame()
@@ -0,0 +1,184 @@
+"""Run reports: named timing spans, counters, histograms and settings of one run.
+
+Engine functions take an optional `report` alongside `log` and `progress`.
+Without one they record into NULL_REPORT, whose methods do nothing, so an
+uninstrumented run only pays a method call per stage or rule; hot loops keep
+their counts in local variables and record them once per rule.
+
+Settings record values a run drew for itself, such as its anchor seed, so
+the run can be reproduced.
+
+Spans measure wall time and add up over repeated calls with the same name.
+Spans around a generator (e.g. a linking rule) include the time its consumer
+spends between items, such as compacting and writing links.
+"""
+import bisect
+import contextlib
+import datetime
+import json
+import time
+
+import pandas as pd
+
+# Upper bounds in seconds of the fetch latency histogram buckets; the last
+# bucket counts everything slower
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+class RunReport:
+    """Spans, counters, histograms and settings collected during one run"""
+
+    enabled = True
+
+    def __init__(self):
+        self.started = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        self.spans = {}
+        self.counters = {}
+        self.histograms = {}
+        self.settings = {}
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """Time the enclosed block under `name`"""
+        # Registered on entry so spans are listed in the order they started
+        self.spans.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        span = self.spans.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        span['calls'] += calls
+        span['seconds'] += seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_many(self, prefix, values):
+        """Add a dict of counts as counters named prefix.key"""
+        for key, value in values.items():
+            self.count(f'{prefix}.{key}', value)
+
+    def record(self, name, value):
+        """Record the setting `name` of the run"""
+        self.settings[name] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        """Add a value to the histogram `name`"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1),
+                                                 'count': 0, 'sum': 0.0, 'max': 0.0}
+        histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['max'] = max(histogram['max'], value)
+
+    def merge(self, other):
+        """Add the spans, counters, histograms and settings of another report or its to_dict()"""
+        if isinstance(other, RunReport):
+            other = other.to_dict()
+        self.settings.update(other.get('settings', {}))
+        for name, span in other.get('spans', {}).items():
+            self.add_time(name, span['seconds'], span['calls'])
+        for name, value in other.get('counters', {}).items():
+            self.count(name, value)
+        for name, theirs in other.get('histograms', {}).items():
+            ours = self.histograms.get(name)
+            if ours is None:
+                self.histograms[name] = {**theirs, 'buckets': list(theirs['buckets']),
+                                         'counts': list(theirs['counts'])}
+                continue
+            if ours['buckets'] != theirs['buckets']:
+                raise ValueError(f"Histogram {name} has different buckets")
+            ours['counts'] = [a + b for a, b in zip(ours['counts'], theirs['counts'])]
+            ours['count'] += theirs['count']
+            ours['sum'] += theirs['sum']
+            ours['max'] = max(ours['max'], theirs['max'])
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'settings': dict(self.settings),
+            'spans': {name: {'calls': span['calls'], 'seconds': round(span['seconds'], 6)}
+                      for name, span in self.spans.items()},
+            'counters': dict(self.counters),
+            'histograms': {name: {**histogram, 'counts': list(histogram['counts'])}
+                           for name, histogram in self.histograms.items()},
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def write(self, path):
+        """Write the report as JSON to `path`"""
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+class _NullReport:
+    """A report that records nothing"""
+
+    enabled = False
+    _span = contextlib.nullcontext()
+
+    def span(self, name):
+        return self._span
+
+    def add_time(self, name, seconds, calls=1):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def count_many(self, prefix, values):
+        pass
+
+    def record(self, name, value):
+        pass
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        pass
+
+    def merge(self, other):
+        pass
+
+NULL_REPORT = _NullReport()
+
+def report_tables(report):
+    """DataFrames for displaying a RunReport or its to_dict()
+
+    Returns a dict with 'spans' (calls and seconds per span, rule spans
+    excluded), 'rules' (counters and seconds per linking rule), 'categories'
+    (pages per category), 'counters' (every other counter) and 'histograms',
+    a dict of name -> counts per bucket upper bound.
+    """
+    if isinstance(report, RunReport):
+        report = report.to_dict()
+    spans = {name: span for name, span in report['spans'].items() if not name.startswith('rule.')}
+
+    rules, categories, counters = {}, {}, {}
+    for name, span in report['spans'].items():
+        if name.startswith('rule.'):
+            rules.setdefault(name[len('rule.'):], {})['seconds'] = span['seconds']
+    for name, value in report['counters'].items():
+        if name.startswith('rule.'):
+            link_type, metric = name[len('rule.'):].rsplit('.', 1)
+            rules.setdefault(link_type, {})[metric] = value
+        elif name.startswith('pages.category.'):
+            categories[name[len('pages.category.'):]] = value
+        else:
+            counters[name] = value
+
+    histograms = {}
+    for name, histogram in report['histograms'].items():
+        labels = [f'<= {bound:g}' for bound in histogram['buckets']] + [f"> {histogram['buckets'][-1]:g}"]
+        histograms[name] = pd.Series(histogram['counts'], index=labels, name='count')
+
+    return {
+        'spans': pd.DataFrame.from_dict(spans, orient='index', columns=['calls', 'seconds']),
+        'rules': pd.DataFrame.from_dict(rules, orient='index').rename_axis('link_type'),
+        'categories': pd.Series(categories, dtype='int64', name='pages').rename_axis('category'),
+        'counters': pd.Series(counters, dtype='int64', name='value').rename_axis('counter'),
+        'histograms': histograms,
+    }
@@ -0,0 +1,256 @@
+"""Content similarity: corpus-wide TF-IDF vectors and sparse top-k neighbours
+
+scikit-learn and NLTK take seconds to import, so they are imported when
+similarity is first computed rather than with the package. Missing NLTK data
+is only downloaded when CROSSLINKER_NLTK_DOWNLOAD=1 is set; otherwise text is
+split on word characters and the stopwords come from scikit-learn, or from
+the file named by CROSSLINKER_STOPWORDS.
+"""
+import functools
+import os
+import re
+import string
+
+import numpy as np
+import pandas as pd
+
+# Upper bound on the number of similarity scores materialised at once; the
+# number of source rows per block is derived from the candidate set size
+DEFAULT_BLOCK_ENTRIES = 4_000_000
+
+# '1' lets ensure_nltk_resources download missing NLTK data
+NLTK_DOWNLOAD_ENV = 'CROSSLINKER_NLTK_DOWNLOAD'
+# Path of a stopword file, one word per line, used instead of NLTK's list
+STOPWORDS_ENV = 'CROSSLINKER_STOPWORDS'
+
+# NLTK data used by preprocessing; word_tokenize reads punkt_tab from NLTK 3.8.2 on
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'stopwords': 'corpora/stopwords',
+}
+
+# Tokens when NLTK's tokenizer data is not installed
+_WORD_PATTERN = re.compile(r'\w+')
+
+def ensure_nltk_resources(download=None):
+    """Return the names of NLTK_RESOURCES that are not installed
+
+    With `download` (by default, when CROSSLINKER_NLTK_DOWNLOAD=1 is set) the
+    missing ones are downloaded first. Never downloading by default keeps
+    offline machines from waiting on the network; point NLTK_DATA at a local
+    copy of the data instead.
+    """
+    import nltk
+
+    if download is None:
+        download = os.environ.get(NLTK_DOWNLOAD_ENV) == '1'
+    missing = []
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            if not (download and nltk.download(name, quiet=True)):
+                missing.append(name)
+    return missing
+
+@functools.lru_cache(maxsize=None)
+def english_stopwords():
+    """English stopwords, loaded once per process
+    
+    Read from the file named by CROSSLINKER_STOPWORDS when it is set, else
+    NLTK's corpus, falling back to scikit-learn's English list when the
+    corpus is not installed.
+    """
+    path = os.environ.get(STOPWORDS_ENV)
+    if path:
+        with open(path, encoding='utf-8') as f:
+            return frozenset(word.strip().lower() for word in f if word.strip())
+    if 'stopwords' not in ensure_nltk_resources():
+        from nltk.corpus import stopwords
+        return frozenset(stopwords.words('english'))
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return frozenset(ENGLISH_STOP_WORDS)
+
+@functools.lru_cache(maxsize=None)
+def word_tokenizer():
+    """NLTK's word_tokenize when its tokenizer data is installed, else a split on word characters"""
+    ensure_nltk_resources()
+    from nltk.tokenize import word_tokenize
+    try:
+        word_tokenize('probe')
+    except LookupError:
+        return _WORD_PATTERN.findall
+    return word_tokenize
+
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+def calculate_content_similarity(source_content, target_content):
+    """Calculate similarity between source and target content using TF-IDF and cosine similarity"""
+    if not source_content or not target_content:
+        return 0.0
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    # Preprocess text
+    def preprocess(text):
+        # Convert to lowercase
+        text = text.lower()
+        # Remove punctuation
+        text = text.translate(_PUNCTUATION_TABLE)
+        # Tokenize
+        tokens = word_tokenizer()(text)
+        # Remove stopwords
+        stop_words = english_stopwords()
+        tokens = [word for word in tokens if word not in stop_words]
+        return ' '.join(tokens)
+
+    try:
+        source_processed = preprocess(source_content)
+        target_processed = preprocess(target_content)
+
+        # Calculate TF-IDF
+        vectorizer = TfidfVectorizer()
+        tfidf_matrix = vectorizer.fit_transform([source_processed, target_processed])
+
+        # Calculate cosine similarity
+        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
+        return similarity
+    except Exception as e:
+        return 0.0
+
+def page_texts(pages):
+    """Text to vectorize for each row of a page table
+
+    Uses the page title when there is one, else the words of the URL path.
+    """
+    path_words = pages['path'].astype(object).str.replace(r'[/_\-.]+', ' ', regex=True).fillna('')
+    if 'title' not in pages.columns:
+        return path_words
+    titles = pages['title'].astype(object)
+    has_title = titles.map(lambda title: isinstance(title, str) and bool(title.strip()))
+    return titles.where(has_title, path_words)
+
+class SimilarityIndex:
+    """TF-IDF vectors for every page, with blockwise sparse top-k cosine search.
+
+    Rows are L2-normalised, so the dot product of two rows is their cosine
+    similarity. Scores are only materialised for one block of source pages
+    against one candidate set at a time, which keeps memory bounded by
+    `block_entries` regardless of the number of pages.
+    """
+
+    def __init__(self, matrix, url_ids, block_entries=DEFAULT_BLOCK_ENTRIES):
+        self.matrix = matrix.tocsr()
+        self.url_ids = np.asarray(url_ids)
+        self.block_entries = block_entries
+
+    @classmethod
+    def from_pages(cls, pages, block_entries=DEFAULT_BLOCK_ENTRIES, **vectorizer_options):
+        """Vectorize the page table's texts (see page_texts) in one pass"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        options = {
+            'lowercase': True,
+            'stop_words': sorted(english_stopwords()),
+            'dtype': np.float32,
+            'sublinear_tf': True,
+        }
+        options.update(vectorizer_options)
+        texts = page_texts(pages).str.translate(_PUNCTUATION_TABLE)
+        matrix = TfidfVectorizer(**options).fit_transform(texts)
+        url_ids, _ = pd.factorize(pages['url'])
+        return cls(matrix, url_ids, block_entries=block_entries)
+
+    def prepare_candidates(self, candidate_rows):
+        """Slice and transpose a candidate set once for repeated top_k calls"""
+        candidate_rows = np.asarray(candidate_rows, dtype=np.int64)
+        return candidate_rows, self.matrix[candidate_rows].T.tocsr(), self.url_ids[candidate_rows]
+
+    def top_k(self, source_rows, candidate_rows, k, exclude_same_url=True):
+        """Most similar candidates for each source row
+
+        Returns a list aligned with `source_rows` of (rows, scores) arrays
+        holding at most `k` candidates with positive similarity, best first
+        and ties broken by candidate order. `candidate_rows` may also be the
+        result of prepare_candidates.
+        """
+        source_rows = np.asarray(source_rows)
+        if not isinstance(candidate_rows, tuple):
+            candidate_rows = self.prepare_candidates(candidate_rows)
+        candidate_rows, candidates, candidate_url_ids = candidate_rows
+        if not len(candidate_rows) or k <= 0:
+            empty = (candidate_rows[:0], np.zeros(0, dtype=np.float32))
+            return [empty] * len(source_rows)
+
+        block_size = max(1, self.block_entries // len(candidate_rows))
+
+        results = []
+        for start in range(0, len(source_rows), block_size):
+            block = source_rows[start:start + block_size]
+            scores = (self.matrix[block] @ candidates).tocsr()
+            for i, row in enumerate(block):
+                begin, end = scores.indptr[i], scores.indptr[i + 1]
+                positions = scores.indices[begin:end]
+                values = scores.data[begin:end]
+
+                keep = values > 0
+                if exclude_same_url:
+                    keep &= candidate_url_ids[positions] != self.url_ids[row]
+                positions, values = positions[keep], values[keep]
+                if len(values) > k:
+                    # Keep everything tied with the k-th best score, then sort
+                    keep = values >= np.partition(values, -k)[-k]
+                    positions, values = positions[keep], values[keep]
+
+                order = np.lexsort((positions, -values))[:k]
+                results.append((candidate_rows[positions[order]], values[order]))
+        return results
+
+    def rank_rule_targets(self, page_index, source_rows, target_category, k, match=None,
+                          block_size=1024):
+        """Yield (rows, scores) of the best targets for each source row, in order
+
+        Candidates are the source's prefix bucket for hierarchical rules
+        (`match` from HIERARCHICAL_MATCHING) and the whole target category
+        otherwise. Work is done one block of source rows at a time, so
+        stopping early (e.g. at max_links) skips the remaining blocks. A
+        bucket's transposed candidates are kept only until the block holding
+        its last source page.
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        prepared = {}
+        if match is not None:
+            # Block number of each bucket's last source page
+            prefix_length = match['prefix_length']
+            keys = page_index.prefix_keys(prefix_length)
+            rows = np.asarray(source_rows, dtype=np.int64)
+            positions = np.flatnonzero(page_index.depth[rows] >= prefix_length)[::-1]
+            bucket_keys, last = np.unique(keys[rows[positions]], return_index=True)
+            last_block = dict(zip(bucket_keys.tolist(), (positions[last] // block_size).tolist()))
+        for start in range(0, len(source_rows), block_size):
+            block = source_rows[start:start + block_size]
+            ranked = {}
+
+            if match is None:
+                if None not in prepared:
+                    prepared[None] = self.prepare_candidates(page_index.rows(target_category))
+                ranked = dict(zip(block, self.top_k(block, prepared[None], k)))
+            else:
+                # Group the block's sources by the bucket they draw candidates from
+                groups = {}
+                for row in block:
+                    if page_index.depth[row] >= prefix_length:
+                        groups.setdefault(keys[row], []).append(row)
+                for key, rows in groups.items():
+                    if key not in prepared:
+                        bucket = page_index.lookup(target_category, rows[0], prefix_length, match['min_depth'])
+                        prepared[key] = self.prepare_candidates(bucket)
+                    ranked.update(zip(rows, self.top_k(rows, prepared[key], k,
+                                                       exclude_same_url=match['exclude_self'])))
+                    if last_block[key] == start // block_size:
+                        del prepared[key]
+
+            for row in block:
+                yield ranked.get(row, empty)
@@ -0,0 +1,393 @@
+"""On-disk link plans: chunked CSV/Parquet/Arrow sinks and lazy readers.
+
+Plans are written chunk by chunk as they are generated and read back the
+same way, so the size of a plan is bounded by disk rather than memory.
+Statistics and balancing stream over the file; only per-page counts are
+kept in memory.
+
+Positions are stored as nullable uint16 numbers, missing for links outside
+a featured section, and read back from every format as pandas UInt16.
+
+Parquet and Arrow IPC plans can be written with `categorical=True` for
+export: URL and label columns are then dictionary encoded, so tools such as
+pandas, polars or DuckDB read them back as categoricals. Arrow IPC files
+are uncompressed and can be memory-mapped without copying, e.g.
+pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all().
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # CSV sinks work without pyarrow
+    pa = None
+    pq = None
+
+from .engine import (
+    BALANCE_MIN_OUTGOING,
+    BALANCE_RATIO,
+    BALANCE_REMOVAL_SHARE,
+    DEFAULT_LINK_CHUNK_SIZE,
+    LINK_COLUMNS,
+    imbalanced_pages,
+    removal_quotas,
+)
+from .report import NULL_REPORT
+
+# Plan file extension -> sink format; anything else is written as CSV
+SINK_EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+}
+
+# Columns dictionary encoded by categorical sinks
+CATEGORICAL_COLUMNS = ['source_page', 'target_page', 'link_type', 'anchor_text', 'placement', 'priority']
+
+def infer_sink_format(path):
+    """'parquet' for .parquet/.pq paths, 'arrow' for .arrow/.feather/.ipc, else 'csv'"""
+    return SINK_EXTENSIONS.get(os.path.splitext(str(path))[1].lower(), 'csv')
+
+def default_plan_extension():
+    """Extension for scratch plan files: Parquet when pyarrow is installed"""
+    return '.parquet' if pq is not None else '.csv'
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet and Arrow plans require pyarrow (pip install pyarrow)")
+
+def _plan_chunk(chunk):
+    """Links with positions as nullable UInt16; link dicts and CSV plans hold '' for none"""
+    if 'position' in chunk.columns:
+        chunk = chunk.assign(position=pd.to_numeric(chunk['position'], errors='coerce').astype(pd.UInt16Dtype()))
+    return chunk
+
+def _dictionary_field(field):
+    return pa.field(field.name, pa.dictionary(pa.int32(), pa.string()))
+
+class CsvLinkSink:
+    """Append link chunks to a CSV file, writing the header once"""
+
+    def __init__(self, path, categorical=False):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._columns = None
+
+    def write(self, chunk):
+        chunk.to_csv(self._file, index=False, header=self._columns is None)
+        if self._columns is None:
+            self._columns = list(chunk.columns)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self._columns is None:
+            self._file.write(','.join(LINK_COLUMNS) + '\n')
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ParquetLinkSink:
+    """Append link chunks to a Parquet file as row groups
+
+    With `categorical`, CATEGORICAL_COLUMNS are stored as dictionaries, one
+    per row group.
+    """
+
+    def __init__(self, path, categorical=False):
+        _require_pyarrow()
+        self.path = path
+        self.rows = 0
+        self.categorical = categorical
+        self._writer = None
+
+    def write(self, chunk):
+        table = pa.Table.from_pandas(_plan_chunk(chunk), preserve_index=False)
+        if self._writer is None:
+            schema = table.schema
+            if self.categorical:
+                schema = pa.schema([_dictionary_field(field) if field.name in CATEGORICAL_COLUMNS else field
+                                    for field in schema])
+            self._writer = pq.ParquetWriter(self.path, schema)
+        table = table.cast(self._writer.schema)
+        self._writer.write_table(table)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self._writer is None:
+            self.write(pd.DataFrame({column: pd.Series(dtype=str) for column in LINK_COLUMNS}))
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ArrowLinkSink:
+    """Append link chunks to an uncompressed Arrow IPC file as record batches
+
+    With `categorical`, each of CATEGORICAL_COLUMNS is encoded against one
+    dictionary that grows as new values arrive; later batches only carry
+    the new values (dictionary deltas), so readers see one categorical per
+    column.
+    """
+
+    def __init__(self, path, categorical=False):
+        _require_pyarrow()
+        self.path = path
+        self.rows = 0
+        self.categorical = categorical
+        self._writer = None
+        self._schema = None
+        self._codes = {}
+        self._dictionaries = {}
+
+    def _encode(self, name, values):
+        """Dictionary array of string `values` against the column's dictionary, extended with new values"""
+        # Encode the chunk on its own, then map its distinct values to global codes
+        local = values.combine_chunks().dictionary_encode()
+        codes = self._codes.setdefault(name, {})
+        new_values = []
+        mapping = []
+        for value in local.dictionary.to_pylist():
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+                new_values.append(value)
+            mapping.append(code)
+        dictionary = self._dictionaries.get(name, pa.array([], type=pa.string()))
+        if new_values:
+            dictionary = pa.concat_arrays([dictionary, pa.array(new_values, type=pa.string())])
+            self._dictionaries[name] = dictionary
+        indices = pc.take(pa.array(mapping, type=pa.int32()), local.indices)
+        return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+    def write(self, chunk):
+        chunk = _plan_chunk(chunk)
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._writer is None:
+            schema = table.schema.remove_metadata()
+            if self.categorical:
+                schema = pa.schema([_dictionary_field(field) if field.name in CATEGORICAL_COLUMNS else field
+                                    for field in schema])
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self._writer = pa.ipc.new_file(self.path, schema, options=options)
+            self._schema = schema
+        columns = []
+        for field in self._schema:
+            if pa.types.is_dictionary(field.type):
+                columns.append(self._encode(field.name, table.column(field.name).cast(pa.string())))
+            else:
+                columns.append(table.column(field.name).cast(field.type))
+        self._writer.write_table(pa.Table.from_arrays(columns, schema=self._schema))
+        self.rows += len(chunk)
+
+    def close(self):
+        if self._writer is None:
+            self.write(pd.DataFrame({column: pd.Series(dtype=str) for column in LINK_COLUMNS}))
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+SINK_FORMATS = {
+    'csv': CsvLinkSink,
+    'parquet': ParquetLinkSink,
+    'arrow': ArrowLinkSink,
+}
+
+def open_link_sink(path, sink_format=None, categorical=False):
+    """Open a sink for `path`, inferring the format from its extension
+
+    `categorical` dictionary encodes CATEGORICAL_COLUMNS in Parquet and
+    Arrow sinks; CSV sinks ignore it.
+    """
+    return SINK_FORMATS[sink_format or infer_sink_format(path)](path, categorical=categorical)
+
+def write_link_chunks(chunks, path, sink_format=None, report=None, categorical=False):
+    """Write an iterable of link chunks to `path` and return the number of rows"""
+    report = report or NULL_REPORT
+    with open_link_sink(path, sink_format, categorical) as sink:
+        for chunk in chunks:
+            with report.span('write'):
+                sink.write(chunk)
+    return sink.rows
+
+def _plain_batch(batch):
+    """A record batch with dictionary columns decoded, as CSV plans read"""
+    if not any(pa.types.is_dictionary(field.type) for field in batch.schema):
+        return batch
+    return batch.cast(pa.schema([pa.field(field.name, field.type.value_type)
+                                 if pa.types.is_dictionary(field.type) else field for field in batch.schema]))
+
+def iter_plan(path, chunk_size=DEFAULT_LINK_CHUNK_SIZE, columns=None):
+    """Read a plan written by a sink back as DataFrame chunks
+
+    Categorical plans are decoded, so chunks have the same dtypes whatever
+    the format; position is UInt16, missing where a link has none.
+    """
+    sink_format = infer_sink_format(path)
+    if sink_format == 'parquet':
+        _require_pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield _plan_chunk(_plain_batch(batch).to_pandas())
+        return
+    if sink_format == 'arrow':
+        _require_pyarrow()
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                for start in range(0, batch.num_rows, chunk_size):
+                    yield _plan_chunk(_plain_batch(batch.slice(start, chunk_size)).to_pandas())
+        return
+
+    reader = pd.read_csv(path, chunksize=chunk_size, usecols=columns, dtype={'position': str},
+                         keep_default_na=False)
+    with reader:
+        for chunk in reader:
+            yield _plan_chunk(chunk)
+
+def read_plan_head(path, n=10):
+    """First `n` links of a plan"""
+    for chunk in iter_plan(path, chunk_size=n):
+        return chunk.head(n)
+    return pd.DataFrame(columns=LINK_COLUMNS)
+
+def read_plan(path):
+    """Load a whole plan into memory"""
+    chunks = list(iter_plan(path))
+    if not chunks:
+        return pd.DataFrame(columns=LINK_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+def convert_plan(path, output_path, sink_format=None, categorical=False):
+    """Copy a plan into another sink format chunk by chunk"""
+    return write_link_chunks(iter_plan(path), output_path, sink_format, categorical=categorical)
+
+class _Counter:
+    """Value counts summed over chunks
+
+    Per-chunk counts are combined in batches rather than aligned against the
+    running total one chunk at a time.
+    """
+
+    def __init__(self, batch=16):
+        self.batch = batch
+        self.parts = []
+
+    def add(self, values):
+        self.parts.append(values.value_counts())
+        if len(self.parts) >= self.batch:
+            self.parts = [self.total()]
+
+    def total(self):
+        if not self.parts:
+            return pd.Series(dtype='int64')
+        if len(self.parts) == 1:
+            return self.parts[0]
+        return pd.concat(self.parts).groupby(level=0, sort=False).sum()
+
+def plan_statistics(path):
+    """Stream over a plan and count links per page, type, priority and placement
+
+    Returns a dict with the total number of links and value-count Series
+    (largest first) for source_page, target_page, link_type, priority and
+    placement.
+    """
+    columns = ['source_page', 'target_page', 'link_type', 'priority', 'placement']
+    counters = {column: _Counter() for column in columns}
+    total = 0
+    for chunk in iter_plan(path, columns=columns):
+        total += len(chunk)
+        for column in columns:
+            counters[column].add(chunk[column])
+
+    statistics = {'total': total}
+    for column, counter in counters.items():
+        counts = counter.total().astype('int64').sort_values(ascending=False, kind='stable')
+        statistics[column] = counts.rename('count').rename_axis(column)
+    return statistics
+
+def balance_plan(path, output_path, log=None, ratio=BALANCE_RATIO, min_outgoing=BALANCE_MIN_OUTGOING,
+                 removal_share=BALANCE_REMOVAL_SHARE, seed=None, report=None):
+    """Streaming version of balance_link_distribution over a plan file
+
+    A first pass counts links per page; a second copies the plan to
+    `output_path`, dropping the same share of low priority links from
+    imbalanced pages. Takes the options of balance_link_distribution and
+    returns the number of links written.
+    """
+    log = log or (lambda message: None)
+    report = report or NULL_REPORT
+    with report.span('balance'):
+        return _balance_plan(path, output_path, log, report, ratio, min_outgoing, removal_share, seed)
+
+def _balance_plan(path, output_path, log, report, ratio, min_outgoing, removal_share, seed):
+    """balance_plan without the span"""
+
+    outgoing, incoming, low = _Counter(), _Counter(), _Counter()
+    for chunk in iter_plan(path, columns=['source_page', 'target_page', 'priority']):
+        outgoing.add(chunk['source_page'])
+        incoming.add(chunk['target_page'])
+        low.add(chunk.loc[chunk['priority'] == 'low', 'source_page'])
+    outgoing = outgoing.total()
+    incoming = incoming.total().reindex(outgoing.index, fill_value=0)
+    imbalanced = outgoing[imbalanced_pages(outgoing, incoming, ratio, min_outgoing)]
+
+    # Pick which occurrences of each page's low priority links to drop, keyed
+    # as page number * stride + occurrence
+    removals = np.zeros(0, dtype=np.int64)
+    pages = imbalanced.index[:0]
+    stride = 1
+    if len(imbalanced):
+        log(f"Found {len(imbalanced)} pages with imbalanced links. Adjusting link distribution...")
+        report.count('balance.imbalanced_pages', len(imbalanced))
+        low = low.total().reindex(imbalanced.index, fill_value=0).to_numpy().astype('int64')
+        quotas = np.minimum(removal_quotas(imbalanced.to_numpy(), removal_share), low)
+        pages = imbalanced.index[quotas > 0]
+        low, quotas = low[quotas > 0], quotas[quotas > 0]
+        stride = int(low.max(initial=1))
+
+        # Shuffle each page's occurrences and keep the first `quota`
+        owners = np.repeat(np.arange(len(pages)), low)
+        occurrence = np.arange(len(owners)) - np.repeat(np.cumsum(low) - low, low)
+        rng = np.random.default_rng(seed)
+        order = np.lexsort((rng.random(len(owners)), owners))
+        chosen = order[occurrence < np.repeat(quotas, low)]
+        removals = owners[chosen] * stride + occurrence[chosen]
+
+    seen = np.zeros(len(pages), dtype=np.int64)
+    read = 0
+    with open_link_sink(output_path) as sink:
+        for chunk in iter_plan(path):
+            read += len(chunk)
+            numbers = pages.get_indexer(chunk['source_page'])
+            candidates = (chunk['priority'] == 'low').to_numpy() & (numbers >= 0)
+            if candidates.any():
+                numbers = numbers[candidates]
+                # Occurrence of each candidate among its page's low priority links so far
+                occurrence = seen[numbers] + pd.Series(numbers).groupby(numbers).cumcount().to_numpy()
+                seen += np.bincount(numbers, minlength=len(pages))
+                drop = np.zeros(len(chunk), dtype=bool)
+                drop[candidates] = np.isin(numbers * stride + occurrence, removals)
+                chunk = chunk[~drop]
+            sink.write(chunk)
+    report.count('balance.links_removed', read - sink.rows)
+    return sink.rows
@@ -0,0 +1,252 @@
+"""Streaming sitemap ingestion.
+
+Sitemaps are parsed incrementally with iterparse and every <url> element is
+cleared as soon as its row has been read, so memory does not grow with the
+size of a sitemap. <sitemapindex> children are fetched and parsed in parallel
+worker threads that hand rows back in chunks through a bounded queue; gzip is
+decompressed on the fly whatever the server's Content-Type says. Sources may
+be URLs, local files or directories of sitemap files.
+"""
+import concurrent.futures
+import gzip
+import io
+import os
+import queue
+import threading
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+from .fetcher import DEFAULT_HEADERS
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Local files picked up when the source is a directory
+SITEMAP_EXTENSIONS = ('.xml', '.xml.gz', '.txt', '.txt.gz', '.gz')
+
+# Sitemap element -> output column
+URL_FIELDS = {
+    'loc': 'Address',
+    'lastmod': 'Last Modified',
+    'priority': 'Priority',
+    'changefreq': 'Change Frequency',
+}
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+def is_sitemap_source(source):
+    """True for sitemap URLs, directories and files with a sitemap extension"""
+    source = str(source)
+    return (source.startswith(('http://', 'https://')) or os.path.isdir(source)
+            or source.lower().endswith(SITEMAP_EXTENSIONS))
+
+def _decompressed(stream):
+    """Wrap a buffered binary stream in gzip when it starts with the gzip magic"""
+    if stream.peek(2)[:2] == _GZIP_MAGIC:
+        return io.BufferedReader(gzip.GzipFile(fileobj=stream))
+    return stream
+
+def _open(source, session, timeout):
+    """Open a sitemap URL or file as a decompressed binary stream"""
+    if source.startswith(('http://', 'https://')):
+        response = session.get(source, timeout=timeout, stream=True)
+        if response.status_code != 200:
+            response.close()
+            raise ValueError(f"Failed to fetch sitemap. Status code: {response.status_code}")
+        # Undo any Content-Encoding; .gz payloads are handled below
+        response.raw.decode_content = True
+        # Leave closing to the caller so peeking at a fully read body still works
+        response.raw.auto_close = False
+        return _decompressed(io.BufferedReader(response.raw))
+    return _decompressed(open(source, 'rb'))
+
+def _is_xml(stream):
+    head = stream.peek(512)[:512].lstrip(b'\xef\xbb\xbf \t\r\n')
+    return head.startswith(b'<')
+
+def _resolve(loc, parent):
+    """Resolve relative child sitemap paths of local index files"""
+    if loc.startswith(('http://', 'https://')) or parent.startswith(('http://', 'https://')):
+        return loc
+    return os.path.join(os.path.dirname(parent), loc)
+
+def _parse_xml(stream, emit_row, emit_child, source):
+    """Stream <url> rows and <sitemap> children out of a sitemap document"""
+    context = ET.iterparse(stream, events=('start', 'end'))
+    _, root = next(context)
+    namespace = root.tag.split('}')[0] + '}' if root.tag.startswith('{') else ''
+    url_tag, sitemap_tag, loc_tag = f'{namespace}url', f'{namespace}sitemap', f'{namespace}loc'
+    field_tags = {f'{namespace}{name}': column for name, column in URL_FIELDS.items()}
+
+    for event, elem in context:
+        if event != 'end':
+            continue
+        if elem.tag == url_tag:
+            row = dict.fromkeys(URL_FIELDS.values())
+            for child in elem:
+                column = field_tags.get(child.tag)
+                if column is not None and child.text:
+                    row[column] = child.text.strip()
+            if row['Address']:
+                emit_row(row.values())
+        elif elem.tag == sitemap_tag:
+            loc = elem.find(loc_tag)
+            if loc is not None and loc.text:
+                emit_child(_resolve(loc.text.strip(), source))
+        else:
+            continue
+        # Drop the parsed element and the root's reference to it
+        elem.clear()
+        root.clear()
+
+def _parse_text(stream, emit_row):
+    """Plain-text sitemaps: one URL per line"""
+    for line in io.TextIOWrapper(stream, encoding='utf-8', errors='replace'):
+        line = line.strip()
+        if line.startswith(('http://', 'https://')):
+            emit_row((line,))
+
+class _Cancelled(Exception):
+    pass
+
+def _frame(rows):
+    """Build a chunk from row tuples in URL_FIELDS order (Address only for text sitemaps)"""
+    columns = list(URL_FIELDS.values())[:len(rows[0])]
+    frame = pd.DataFrame(rows, columns=columns)
+    frame['Status Code'] = 200  # Assume valid URLs in sitemap
+    return frame
+
+def _iter_keyed_chunks(source, chunk_size, max_workers, timeout, headers, log):
+    """Yield (key, chunk) pairs in arrival order
+
+    Keys are tuples of sitemap and chunk positions, so sorting them restores
+    document order across an index regardless of which child finished first.
+    """
+    source = str(source)
+    if os.path.isdir(source):
+        roots = sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.lower().endswith(SITEMAP_EXTENSIONS)
+        )
+        if not roots:
+            raise ValueError(f"No sitemap files found in {source}")
+    else:
+        roots = [source]
+
+    # Imported here so loading the package does not pay for requests
+    import requests
+
+    session = requests.Session()
+    session.headers.update(headers or DEFAULT_HEADERS)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    # Bounded, so parsers wait for the consumer instead of buffering rows
+    messages = queue.Queue(maxsize=max_workers)
+    cancelled = threading.Event()
+
+    def put(message):
+        while not cancelled.is_set():
+            try:
+                messages.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _Cancelled()
+
+    def parse(sitemap, key):
+        rows = []
+        chunk_number = 0
+        child_number = 0
+
+        def emit_row(row):
+            nonlocal chunk_number
+            rows.append(tuple(row))
+            if len(rows) >= chunk_size:
+                put(('rows', key + (chunk_number,), _frame(rows)))
+                rows.clear()
+                chunk_number += 1
+
+        def emit_child(child):
+            nonlocal child_number
+            put(('child', key + (child_number,), child))
+            child_number += 1
+
+        error = None
+        try:
+            with _open(sitemap, session, timeout) as stream:
+                if _is_xml(stream):
+                    _parse_xml(stream, emit_row, emit_child, sitemap)
+                else:
+                    _parse_text(stream, emit_row)
+            if rows:
+                put(('rows', key + (chunk_number,), _frame(rows)))
+        except _Cancelled:
+            return
+        except ET.ParseError as e:
+            error = f"XML parsing error: {str(e)}"
+        except ValueError as e:
+            error = str(e)
+        except Exception as e:
+            error = f"Error parsing sitemap: {str(e)}"
+        try:
+            put(('done', sitemap, error))
+        except _Cancelled:
+            pass
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        seen = set(roots)
+        for number, root in enumerate(roots):
+            executor.submit(parse, root, (number,))
+        pending = len(roots)
+
+        while pending:
+            message = messages.get()
+            if message[0] == 'rows':
+                _, key, chunk = message
+                yield key, chunk
+            elif message[0] == 'child':
+                _, key, child = message
+                if child not in seen:
+                    seen.add(child)
+                    executor.submit(parse, child, key)
+                    pending += 1
+            else:
+                _, sitemap, error = message
+                pending -= 1
+                if error and sitemap in roots and len(roots) == 1:
+                    raise ValueError(error)
+                if error and log is not None:
+                    log(f"Skipped sitemap {sitemap}: {error}")
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        session.close()
+
+def iter_sitemap_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=8, timeout=30,
+                        headers=None, log=None):
+    """Yield DataFrame chunks of sitemap rows from a URL, file or directory
+
+    Columns are those of parse_xml_sitemap: Address, Last Modified, Priority,
+    Change Frequency and Status Code (plain-text sitemaps only have Address
+    and Status Code). Sitemap indexes are followed recursively with up to
+    `max_workers` child sitemaps parsed at once, and chunks are yielded as
+    soon as they are ready. Failure to read `source` itself raises
+    ValueError; failed child sitemaps are skipped and reported through `log`.
+    """
+    for _, chunk in _iter_keyed_chunks(source, chunk_size, max_workers, timeout, headers, log):
+        yield chunk
+
+def load_sitemap(source, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=8, timeout=30, headers=None,
+                 log=None):
+    """Read a sitemap URL, file or directory into one DataFrame in document order
+
+    See iter_sitemap_chunks. Raises ValueError when no URLs are found.
+    """
+    chunks = sorted(_iter_keyed_chunks(source, chunk_size, max_workers, timeout, headers, log),
+                    key=lambda keyed: keyed[0])
+    if not chunks:
+        raise ValueError("No URLs found in the sitemap.")
+    return pd.concat([chunk for _, chunk in chunks], ignore_index=True)
@@ -0,0 +1,303 @@
+"""Input sources for the cross-linker: CSV exports, XML sitemaps, page titles"""
+import csv
+import io
+import os
+import random
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # CSVs are read in pandas chunks instead; Parquet/Arrow need pyarrow
+    pa = None
+
+from .fetcher import DEFAULT_HEADERS, fetch_pages, fetch_titles
+from .sitemap import iter_sitemap_chunks
+
+# Shared so repeated single-page fetches reuse connections; see _requests_session
+_session = None
+
+def _requests_session():
+    # requests is imported on first use, not with the package
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+def fetch_page_title(url, timeout=5):
+    """Fetch the page title from a URL"""
+    try:
+        from bs4 import BeautifulSoup
+
+        response = _requests_session().get(url, headers=DEFAULT_HEADERS, timeout=timeout)
+        if response.status_code == 200:
+            soup = BeautifulSoup(response.text, 'html.parser')
+            title_tag = soup.find('title')
+            if title_tag:
+                return title_tag.text.strip()
+            h1_tag = soup.find('h1')
+            if h1_tag:
+                return h1_tag.text.strip()
+        return None
+    except Exception as e:
+        return None
+
+def parse_xml_sitemap(url):
+    """Parse XML sitemap and extract URLs and other metadata
+    
+    Follows sitemap indexes and accepts gzip, plain-text sitemaps, local files
+    and directories; see sitemap.iter_sitemap_chunks.
+    """
+    try:
+        urls = []
+        for chunk in iter_sitemap_chunks(url):
+            urls.extend(chunk.to_dict('records'))
+        return urls, None
+    except ValueError as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"Error parsing sitemap: {str(e)}"
+
+def fetch_page_metadata(url_data, max_workers=32, sample_size=None, progress=None,
+                        per_host=8, timeout=10, retries=2, cache=None, report=None):
+    """Fetch page titles and content types for a sample of URLs
+    
+    Titles are fetched asynchronously over pooled connections with at most
+    `max_workers` requests in flight, `per_host` of them to any one host.
+    With a PageMetadataCache, fresh entries and pages whose sitemap
+    'Last Modified' is unchanged are served from the cache and stale entries
+    are revalidated with conditional requests.
+    `progress`, if given, is called as progress(processed, total) after each URL.
+    A RunReport passed as `report` collects fetch latencies and cache hits.
+    """
+    urls = url_data['Address'].tolist()
+    
+    # Take a sample if specified
+    if sample_size and sample_size < len(urls):
+        sampled_urls = random.sample(urls, sample_size)
+    else:
+        sampled_urls = urls
+    
+    fetch_options = {
+        'concurrency': max_workers,
+        'per_host': per_host,
+        'timeout': timeout,
+        'retries': retries,
+        'progress': progress,
+        'report': report,
+    }
+    if cache is None:
+        titles_by_url = fetch_titles(sampled_urls, **fetch_options)
+    else:
+        sitemap_lastmods = {}
+        if 'Last Modified' in url_data.columns:
+            lastmods = url_data['Last Modified'].where(url_data['Last Modified'].notna(), None)
+            sitemap_lastmods = {url: str(lastmod) for url, lastmod in zip(urls, lastmods) if lastmod is not None}
+        
+        stats_before = dict(cache.stats)
+        titles_by_url, validators, to_fetch = cache.plan(sampled_urls, sitemap_lastmods)
+        pages = fetch_pages(to_fetch, validators=validators, **fetch_options)
+        titles_by_url.update(cache.update(pages, sitemap_lastmods))
+        cache.evict()
+        if report is not None:
+            report.count_many('cache', {key: value - stats_before[key] for key, value in cache.stats.items()})
+    
+    results = {url: {'title': title} for url, title in titles_by_url.items()}
+    
+    # Update the original DataFrame with the fetched metadata
+    titles = []
+    for url in url_data['Address']:
+        if url in results:
+            titles.append(results[url]['title'])
+        else:
+            titles.append(None)
+    
+    url_data['Title'] = titles
+    
+    return url_data
+
+# Columns of a crawler export the engine reads, with their pandas dtypes;
+# Screaming Frog calls the page title 'Title 1'
+INPUT_COLUMNS = {
+    'Address': 'str',
+    'Status Code': 'Int32',
+    'Content Type': 'category',
+    'Indexability': 'category',
+    'Title': 'str',
+    'Title 1': 'str',
+    'Last Modified': 'str',
+}
+
+# Rows per chunk when reading with pandas or from Parquet, bytes per block
+# when reading CSV with pyarrow
+CSV_CHUNK_ROWS = 200_000
+CSV_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Page table file extension -> input format; anything else is read as CSV
+INPUT_FORMATS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+}
+
+def infer_input_format(name):
+    """'parquet', 'arrow' or 'csv' for a page table file name"""
+    extension = os.path.splitext(str(name))[1].lower()
+    return INPUT_FORMATS.get(extension, 'csv')
+
+def _csv_header(path_or_buffer):
+    """Column names of a CSV file or seekable buffer, leaving buffers at the start"""
+    if isinstance(path_or_buffer, (str, bytes)) or hasattr(path_or_buffer, '__fspath__'):
+        with open(path_or_buffer, newline='', encoding='utf-8-sig', errors='replace') as f:
+            return next(csv.reader(f), [])
+    start = path_or_buffer.tell()
+    line = path_or_buffer.readline()
+    path_or_buffer.seek(start)
+    if isinstance(line, bytes):
+        line = line.decode('utf-8-sig', errors='replace')
+    return next(csv.reader(io.StringIO(line.lstrip('\ufeff'))), [])
+
+def _arrow_type(dtype):
+    return {'str': pa.string(), 'Int32': pa.int32(), 'category': pa.dictionary(pa.int32(), pa.string())}[dtype]
+
+def _filter_batch(batch, status_code, indexable_only):
+    """Rows of an arrow batch with `status_code` and, with `indexable_only`, indexable"""
+    keep = None
+    if status_code is not None and 'Status Code' in batch.schema.names:
+        keep = pc.equal(batch.column('Status Code'), status_code)
+    if indexable_only and 'Indexability' in batch.schema.names:
+        indexable = pc.equal(pc.cast(batch.column('Indexability'), pa.string()), 'Indexable')
+        keep = indexable if keep is None else pc.and_(keep, indexable)
+    return batch.filter(keep) if keep is not None else batch
+
+def _batches_to_pandas(batches, schema):
+    # Dictionaries differ between blocks; unify them for one categorical per column
+    table = pa.Table.from_batches(batches, schema=schema).unify_dictionaries()
+    return table.to_pandas(types_mapper={pa.int32(): pd.Int32Dtype()}.get)
+
+def _title_column(df):
+    """The engine reads page titles from 'Title'"""
+    if 'Title 1' in df.columns:
+        if 'Title' in df.columns:
+            return df.drop(columns='Title 1')
+        return df.rename(columns={'Title 1': 'Title'})
+    return df
+
+def _read_csv_arrow(path_or_buffer, columns, status_code, indexable_only):
+    """Stream the CSV through pyarrow, filtering each block before keeping it"""
+    reader = pa_csv.open_csv(
+        path_or_buffer,
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=list(columns),
+            column_types={column: _arrow_type(dtype) for column, dtype in columns.items()},
+            strings_can_be_null=True,
+        ),
+    )
+    batches = [_filter_batch(batch, status_code, indexable_only) for batch in reader]
+    return _batches_to_pandas(batches, reader.schema)
+
+def _read_csv_chunks(path_or_buffer, columns, status_code, indexable_only):
+    """Read the CSV in pandas chunks, filtering each chunk before keeping it"""
+    reader = pd.read_csv(
+        path_or_buffer,
+        usecols=list(columns),
+        dtype={column: 'str' if dtype == 'category' else dtype for column, dtype in columns.items()},
+        chunksize=CSV_CHUNK_ROWS,
+    )
+    chunks = []
+    with reader:
+        for chunk in reader:
+            if status_code is not None and 'Status Code' in columns:
+                chunk = chunk[(chunk['Status Code'] == status_code).fillna(False)]
+            if indexable_only and 'Indexability' in columns:
+                chunk = chunk[(chunk['Indexability'] == 'Indexable').fillna(False)]
+            chunks.append(chunk)
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=list(columns))
+    for column, dtype in columns.items():
+        if dtype == 'category':
+            df[column] = df[column].astype('category')
+    return df
+
+def load_csv(path_or_buffer, columns=INPUT_COLUMNS, status_code=200, indexable_only=False):
+    """Load a crawler/sitemap CSV export and validate the required columns
+    
+    Only the `columns` present in the file are read, with their dtypes, and
+    a 'Title 1' column (Screaming Frog) becomes 'Title'. Rows are read in
+    chunks and, where the file has the columns, filtered to `status_code`
+    (None keeps every status) and with `indexable_only` to indexable pages,
+    so memory grows with the rows kept rather than the size of the file.
+    Uses pyarrow when it is installed, except for text buffers such as
+    io.StringIO, which pyarrow cannot read. columns=None reads the whole
+    file as pandas infers it, unfiltered.
+    """
+    if columns is None:
+        df = pd.read_csv(path_or_buffer)
+        header = df.columns
+    else:
+        header = _csv_header(path_or_buffer)
+    
+    required_column = 'Address'
+    if required_column not in header:
+        raise ValueError(f"CSV is missing required column: {required_column}")
+    if columns is None:
+        return df
+    
+    # In the file's order, as pandas reads them
+    columns = {column: columns[column] for column in header if column in columns}
+    if pa is not None and not isinstance(path_or_buffer, io.TextIOBase):
+        df = _read_csv_arrow(path_or_buffer, columns, status_code, indexable_only)
+    else:
+        df = _read_csv_chunks(path_or_buffer, columns, status_code, indexable_only)
+    return _title_column(df)
+
+def load_columnar(path_or_buffer, file_format=None, columns=INPUT_COLUMNS, status_code=200, indexable_only=False):
+    """Load a page table from a Parquet or Arrow IPC (Feather) file
+    
+    Takes the options of load_csv. The format is inferred from the file
+    name unless given. Batches are cast to the dtypes of `columns` and
+    filtered as they are read.
+    """
+    if pa is None:
+        raise ImportError("Parquet and Arrow input require pyarrow (pip install pyarrow)")
+    file_format = file_format or infer_input_format(getattr(path_or_buffer, 'name', path_or_buffer))
+    if file_format == 'parquet':
+        source = pq.ParquetFile(path_or_buffer)
+        schema = source.schema_arrow
+    elif file_format == 'arrow':
+        source = pa.ipc.open_file(path_or_buffer)
+        schema = source.schema
+    else:
+        raise ValueError(f"Unsupported page table format: {file_format}")
+    
+    required_column = 'Address'
+    if required_column not in schema.names:
+        raise ValueError(f"{file_format.title()} file is missing required column: {required_column}")
+    
+    if columns is None:
+        return (source.read() if file_format == 'parquet' else source.read_all()).to_pandas()
+    
+    target = pa.schema([(column, _arrow_type(columns[column])) for column in schema.names if column in columns])
+    if file_format == 'parquet':
+        batches = source.iter_batches(batch_size=CSV_CHUNK_ROWS, columns=target.names)
+    else:
+        batches = (source.get_batch(i).select(target.names) for i in range(source.num_record_batches))
+    
+    batches = [_filter_batch(batch.cast(target), status_code, indexable_only) for batch in batches]
+    return _title_column(_batches_to_pandas(batches, target))
+
+def urls_from_text(text):
+    """Build a page table from URLs entered one per line"""
+    urls = [url.strip() for url in text.strip().split('\n') if url.strip().startswith(('http://', 'https://'))]
+    
+    return pd.DataFrame({
+        'Address': urls,
+        'Status Code': 200  # Assume valid URLs
+    })
@@ -1,32 +1,47 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import re
-from urllib.parse import urlparse
-import csv
-import random
 import os
-import io
+import shutil
+import tempfile
 import traceback
-import requests
-import xml.etree.ElementTree as ET
-from bs4 import BeautifulSoup
-import concurrent.futures
-import time
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-import string
 
-# Download NLTK resources
-try:
-    nltk.data.find('tokenizers/punkt')
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
+from crosslinker import (
+    BALANCE_MIN_OUTGOING,
+    BALANCE_RATIO,
+    LINK_ALLOCATIONS,
+    SITE_TYPE_PATTERNS,
+    PageMetadataCache,
+    RunReport,
+    SegmentPrefixIndex,
+    StageCache,
+    balance_plan,
+    content_key,
+    convert_plan,
+    default_plan_extension,
+    extract_url_components,
+    fetch_page_metadata,
+    graph_metrics,
+    graph_summary,
+    infer_input_format,
+    infer_sink_format,
+    iter_inlink_chunks,
+    iter_link_chunks,
+    iter_plan,
+    load_columnar,
+    load_csv,
+    load_existing_links,
+    load_sitemap,
+    plan_statistics,
+    prepare_pages,
+    read_plan,
+    read_plan_head,
+    report_tables,
+    test_patterns,
+    urls_from_text,
+    write_excel,
+    write_html_report,
+    write_link_chunks,
+)
 
 # Set page configuration
 st.set_page_config(
@@ -58,531 +73,40 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Helper functions
-def extract_url_components(url):
-    """Extract components from a URL"""
-    try:
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc
-        path = parsed_url.path.strip('/')
-        path_segments = path.split('/')
-        
-        return {
-            'domain': domain,
-            'path': path,
-            'segments': path_segments,
-            'depth': len(path_segments),
-            'full_url': url
-        }
-    except:
-        return {
-            'domain': '',
-            'path': '',
-            'segments': [],
-            'depth': 0,
-            'full_url': url
-        }
-
-def categorize_page(url_components, patterns):
-    """Categorize a page based on its URL pattern"""
-    path = url_components['path']
-    
-    # Check each pattern to see if it matches
-    for category, pattern in patterns.items():
-        if isinstance(pattern, str) and re.search(pattern, path):
-            return category
+# Streamlit adapters for the engine's log/progress callbacks
+class StreamlitProgress:
+    """Show engine progress as one Streamlit progress bar per label"""
     
-    # Default category
-    return 'other'
-
-def fetch_page_title(url, timeout=5):
-    """Fetch the page title from a URL"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=timeout)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            title_tag = soup.find('title')
-            if title_tag:
-                return title_tag.text.strip()
-            h1_tag = soup.find('h1')
-            if h1_tag:
-                return h1_tag.text.strip()
-        return None
-    except Exception as e:
-        return None
-
-def generate_varied_anchor_text(url, category, title=None, content_type=None):
-    """Generate varied anchor text based on URL, category, and additional info"""
-    components = extract_url_components(url)
-    segments = components['segments']
-    
-    # If we have a title, use it as a base
-    if title:
-        # Clean up the title
-        clean_title = re.sub(r'\s*\|\s*.*$', '', title)  # Remove site name after pipe
-        clean_title = re.sub(r'\s*-\s*.*$', '', clean_title)  # Remove site name after dash
-        
-        # Limit title length
-        if len(clean_title) > 50:
-            clean_title = clean_title[:47] + "..."
-            
-        if category == 'pdp':
-            variations = [
-                clean_title,
-                f"View {clean_title}",
-                f"Explore {clean_title}"
-            ]
-        elif category == 'city_plp':
-            variations = [
-                clean_title,
-                f"Browse {clean_title}",
-                f"Explore {clean_title}"
-            ]
-        elif category == 'state_plp':
-            variations = [
-                clean_title,
-                f"Discover {clean_title}",
-                f"Browse {clean_title}"
-            ]
-        elif category == 'category_plp':
-            variations = [
-                clean_title,
-                f"Shop {clean_title}",
-                f"View all {clean_title}"
-            ]
-        else:
-            variations = [clean_title]
-            
-        return random.choice(variations)
-    
-    # Fall back to URL-based anchor text generation
-    if category == 'pdp':
-        # For property detail pages
-        if len(segments) >= 3:
-            property_id = segments[2]
-            # Extract address from property ID (e.g., "123456-main-st" -> "main st")
-            address_parts = property_id.split('-')
-            if len(address_parts) > 1:
-                address = ' '.join(address_parts[1:])
-                return address.title()
-        return "Property Details"
-    
-    elif category == 'city_plp':
-        # For city listing pages
-        if len(segments) >= 2:
-            city = segments[1].replace('-', ' ').title()
-            return f"{city} Listings"
-        return "City Listings"
-    
-    elif category == 'state_plp':
-        # For state listing pages
-        if len(segments) >= 1:
-            state = segments[0].upper()
-            return f"{state} Listings"
-        return "State Listings"
-    
-    elif category == 'category_plp':
-        # For category listing pages
-        if len(segments) >= 1:
-            category_name = segments[0].replace('-', ' ').title()
-            return f"{category_name} Listings"
-        return "Category Listings"
-    
-    # Default
-    return "View Listings"
-
-def get_appropriate_placements(source_category, target_category):
-    """Determine appropriate placements based on page categories"""
-    if source_category == 'pdp':
-        if target_category == 'city_plp' or target_category == 'state_plp':
-            return ['breadcrumb', 'footer_navigation']
-        elif target_category == 'category_plp':
-            return ['sidebar', 'related_categories']
-        else:
-            return ['related_properties', 'similar_properties']
-    
-    elif source_category in ['city_plp', 'state_plp', 'category_plp']:
-        if target_category == 'pdp':
-            return ['featured_properties', 'property_grid']
-        else:
-            return ['related_categories', 'subcategory_links']
-    
-    return ['content_body', 'sidebar']
-
-def calculate_content_similarity(source_content, target_content):
-    """Calculate similarity between source and target content using TF-IDF and cosine similarity"""
-    if not source_content or not target_content:
-        return 0.0
-    
-    # Preprocess text
-    def preprocess(text):
-        # Convert to lowercase
-        text = text.lower()
-        # Remove punctuation
-        text = text.translate(str.maketrans('', '', string.punctuation))
-        # Tokenize
-        tokens = word_tokenize(text)
-        # Remove stopwords
-        stop_words = set(stopwords.words('english'))
-        tokens = [word for word in tokens if word not in stop_words]
-        return ' '.join(tokens)
-    
-    try:
-        source_processed = preprocess(source_content)
-        target_processed = preprocess(target_content)
-        
-        # Calculate TF-IDF
-        vectorizer = TfidfVectorizer()
-        tfidf_matrix = vectorizer.fit_transform([source_processed, target_processed])
-        
-        # Calculate cosine similarity
-        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-        return similarity
-    except Exception as e:
-        return 0.0
-
-def parse_xml_sitemap(url):
-    """Parse XML sitemap and extract URLs and other metadata"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code != 200:
-            return None, f"Failed to fetch sitemap. Status code: {response.status_code}"
-        
-        content_type = response.headers.get('Content-Type', '').lower()
-        
-        # Handle different sitemap formats
-        if 'text/xml' in content_type or 'application/xml' in content_type:
-            # Regular XML sitemap
-            root = ET.fromstring(response.content)
-            
-            # Determine namespace
-            namespace = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
-            if root.tag.startswith('{'):
-                namespace = root.tag.split('}')[0] + '}'
-            
-            # Extract URLs
-            urls = []
-            for url_elem in root.findall(f'.//{namespace}url'):
-                loc_elem = url_elem.find(f'{namespace}loc')
-                if loc_elem is not None and loc_elem.text:
-                    lastmod_elem = url_elem.find(f'{namespace}lastmod')
-                    lastmod = lastmod_elem.text if lastmod_elem is not None else None
-                    
-                    priority_elem = url_elem.find(f'{namespace}priority')
-                    priority = priority_elem.text if priority_elem is not None else None
-                    
-                    changefreq_elem = url_elem.find(f'{namespace}changefreq')
-                    changefreq = changefreq_elem.text if changefreq_elem is not None else None
-                    
-                    urls.append({
-                        'Address': loc_elem.text.strip(),
-                        'Last Modified': lastmod,
-                        'Priority': priority,
-                        'Change Frequency': changefreq,
-                        'Status Code': 200  # Assume valid URLs in sitemap
-                    })
-            
-            return urls, None
-        elif 'text/plain' in content_type:
-            # Simple text sitemap
-            urls = []
-            for line in response.text.splitlines():
-                line = line.strip()
-                if line and line.startswith(('http://', 'https://')):
-                    urls.append({
-                        'Address': line,
-                        'Status Code': 200  # Assume valid URLs in sitemap
-                    })
-            return urls, None
-        else:
-            return None, f"Unsupported sitemap format: {content_type}"
+    def __init__(self):
+        self.label = None
+        self.progress_bar = None
     
-    except ET.ParseError as e:
-        return None, f"XML parsing error: {str(e)}"
-    except Exception as e:
-        return None, f"Error parsing sitemap: {str(e)}"
+    def __call__(self, label, fraction):
+        if label != self.label:
+            self.label = label
+            self.progress_bar = st.progress(0)
+        self.progress_bar.progress(fraction)
 
-def fetch_page_metadata(url_data, max_workers=5, sample_size=None):
-    """Fetch page titles and content types for a sample of URLs"""
-    urls = url_data['Address'].tolist()
-    
-    # Take a sample if specified
-    if sample_size and sample_size < len(urls):
-        sampled_urls = random.sample(urls, sample_size)
-    else:
-        sampled_urls = urls
-    
-    results = {}
-    processed = 0
-    total = len(sampled_urls)
-    
+def streamlit_metadata_progress():
+    """Progress callback for fetch_page_metadata"""
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    def fetch_url_data(url):
-        title = fetch_page_title(url)
-        return url, title
-    
-    # Use ThreadPoolExecutor for parallel processing
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_url = {executor.submit(fetch_url_data, url): url for url in sampled_urls}
-        
-        for future in concurrent.futures.as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                url, title = future.result()
-                results[url] = {'title': title}
-            except Exception as e:
-                results[url] = {'title': None}
-            
-            processed += 1
-            progress = processed / total
-            progress_bar.progress(progress)
-            status_text.text(f"Processed {processed}/{total} URLs")
-    
-    # Update the original DataFrame with the fetched metadata
-    titles = []
-    for url in url_data['Address']:
-        if url in results:
-            titles.append(results[url]['title'])
-        else:
-            titles.append(None)
-    
-    url_data['Title'] = titles
+    def update(processed, total):
+        progress_bar.progress(processed / total)
+        status_text.text(f"Processed {processed}/{total} URLs")
     
-    return url_data
+    return update
 
-def generate_cross_links(df, url_patterns, max_links=1000, use_content_similarity=False, fetch_titles=False):
-    """Generate cross-linking recommendations with enhanced features"""
-    # Ensure 'Address' column exists
-    if 'Address' not in df.columns:
-        raise ValueError("DataFrame must contain an 'Address' column with URLs")
-    
-    # Filter for 200 status code pages if the column exists
-    if 'Status Code' in df.columns:
-        df = df[df['Status Code'] == 200]
-        st.info(f"Processing {len(df)} pages with 200 status code")
-    else:
-        st.info(f"Processing {len(df)} pages (no status code filtering)")
-    
-    # Fetch page titles if requested and not already present
-    if fetch_titles and 'Title' not in df.columns:
-        with st.spinner("Fetching page titles (sample)..."):
-            df = fetch_page_metadata(df, sample_size=min(50, len(df)))
-    
-    # Categorize all pages
-    categorized_pages = {
-        'pdp': [],
-        'city_plp': [],
-        'state_plp': [],
-        'category_plp': [],
-        'other': []  # Added 'other' category to capture uncategorized pages
-    }
-    
-    with st.spinner("Categorizing pages..."):
-        for idx, row in df.iterrows():
-            url = row['Address']
-            components = extract_url_components(url)
-            category = categorize_page(components, url_patterns)
-            
-            page_info = {
-                'url': url,
-                'components': components
-            }
-            
-            # Add title if available
-            if 'Title' in df.columns:
-                page_info['title'] = row['Title']
-            
-            # Add content type if available
-            if 'Content Type' in df.columns:
-                page_info['content_type'] = row['Content Type']
-            
-            categorized_pages[category].append(page_info)
-    
-    # Print category counts
-    st.write("Pages by category:")
-    for category, pages in categorized_pages.items():
-        st.write(f"- {category}: {len(pages)} pages")
-    
-    # Define linking rules
-    linking_rules = [
-        # PDP to PLP links
-        {'source': 'pdp', 'target': 'city_plp', 'max_targets': 1, 'priority': 'high', 'placement': 'breadcrumb'},
-        {'source': 'pdp', 'target': 'state_plp', 'max_targets': 1, 'priority': 'medium', 'placement': 'breadcrumb'},
-        {'source': 'pdp', 'target': 'category_plp', 'max_targets': 2, 'priority': 'medium', 'placement': 'sidebar'},
-        {'source': 'pdp', 'target': 'pdp', 'max_targets': 3, 'priority': 'medium', 'placement': 'related_properties'},
-        
-        # PLP to PDP links
-        {'source': 'city_plp', 'target': 'pdp', 'max_targets': 5, 'priority': 'high', 'placement': 'featured_section'},
-        {'source': 'state_plp', 'target': 'city_plp', 'max_targets': 10, 'priority': 'high', 'placement': 'main_content'},
-        {'source': 'category_plp', 'target': 'pdp', 'max_targets': 5, 'priority': 'medium', 'placement': 'featured_section'},
-        
-        # Added more comprehensive rules
-        {'source': 'category_plp', 'target': 'category_plp', 'max_targets': 5, 'priority': 'medium', 'placement': 'related_categories'},
-        {'source': 'city_plp', 'target': 'city_plp', 'max_targets': 3, 'priority': 'low', 'placement': 'nearby_cities'},
-        {'source': 'other', 'target': 'pdp', 'max_targets': 2, 'priority': 'low', 'placement': 'content_body'},
-        {'source': 'other', 'target': 'category_plp', 'max_targets': 2, 'priority': 'low', 'placement': 'sidebar'}
-    ]
-    
-    # Generate cross-links
-    all_links = []
-    link_count = 0
-    
-    with st.spinner("Generating cross-links..."):
-        for rule in linking_rules:
-            source_category = rule['source']
-            target_category = rule['target']
-            max_targets = rule['max_targets']
-            priority = rule['priority']
-            placement = rule['placement']
-            link_type = f"{source_category}_to_{target_category}"
-            
-            # Skip if we don't have pages in either category
-            if not categorized_pages[source_category] or not categorized_pages[target_category]:
-                continue
-            
-            st.write(f"Generating {link_type} links...")
-            progress_bar = st.progress(0)
-            
-            # For each source page, find appropriate target pages
-            for i, source_page in enumerate(categorized_pages[source_category]):
-                # Update progress
-                if len(categorized_pages[source_category]) > 0:
-                    progress_bar.progress(min(1.0, (i+1) / len(categorized_pages[source_category])))
-                
-                source_url = source_page['url']
-                source_components = source_page['components']
-                
-                # Find relevant target pages
-                relevant_targets = []
-                
-                # Enhanced matching strategy
-                if source_category == 'pdp' and target_category == 'city_plp':
-                    # Find the parent city page
-                    for target_page in categorized_pages[target_category]:
-                        target_components = target_page['components']
-                        if (len(source_components['segments']) >= 2 and 
-                            len(target_components['segments']) >= 2 and
-                            source_components['segments'][0] == target_components['segments'][0] and
-                            source_components['segments'][1] == target_components['segments'][1]):
-                            relevant_targets.append(target_page)
-                
-                elif source_category == 'pdp' and target_category == 'state_plp':
-                    # Find the parent state page
-                    for target_page in categorized_pages[target_category]:
-                        target_components = target_page['components']
-                        if (len(source_components['segments']) >= 1 and 
-                            len(target_components['segments']) >= 1 and
-                            source_components['segments'][0] == target_components['segments'][0]):
-                            relevant_targets.append(target_page)
-                
-                elif source_category == 'city_plp' and target_category == 'pdp':
-                    # Find property pages in this city
-                    for target_page in categorized_pages[target_category]:
-                        target_components = target_page['components']
-                        if (len(source_components['segments']) >= 2 and 
-                            len(target_components['segments']) >= 2 and
-                            source_components['segments'][0] == target_components['segments'][0] and
-                            source_components['segments'][1] == target_components['segments'][1]):
-                            relevant_targets.append(target_page)
-                
-                elif source_category == 'pdp' and target_category == 'pdp':
-                    # Find similar property pages (same city, different property)
-                    for target_page in categorized_pages[target_category]:
-                        target_components = target_page['components']
-                        if (len(source_components['segments']) >= 2 and 
-                            len(target_components['segments']) >= 2 and
-                            source_components['segments'][0] == target_components['segments'][0] and
-                            source_components['segments'][1] == target_components['segments'][1] and
-                            source_url != target_page['url']):  # Exclude self
-                            relevant_targets.append(target_page)
-                
-                elif source_category == 'state_plp' and target_category == 'city_plp':
-                    # Find city pages in this state
-                    for target_page in categorized_pages[target_category]:
-                        target_components = target_page['components']
-                        if (len(source_components['segments']) >= 1 and 
-                            len(target_components['segments']) >= 2 and
-                            source_components['segments'][0] == target_components['segments'][0]):
-                            relevant_targets.append(target_page)
-                
-                elif source_category == 'category_plp' and target_category == 'category_plp':
-                    # Find related category pages (sharing common parent category)
-                    for target_page in categorized_pages[target_category]:
-                        target_components = target_page['components']
-                        # Avoid self-links
-                        if source_url != target_page['url']:
-                            # Check if they share a common parent category
-                            if len(source_components['segments']) >= 1 and len(target_components['segments']) >= 1:
-                                if source_components['segments'][0] == target_components['segments'][0]:
-                                    relevant_targets.append(target_page)
-                
-                else:
-                    # For other combinations, use a sample of target pages
-                    temp_targets = [p for p in categorized_pages[target_category] if p['url'] != source_url]
-                    relevant_targets = random.sample(
-                        temp_targets, 
-                        min(max_targets, len(temp_targets))
-                    ) if temp_targets else []
-                
-                # Limit number of targets
-                if len(relevant_targets) > max_targets:
-                    relevant_targets = relevant_targets[:max_targets]
-                
-                # Generate links
-                for position, target_page in enumerate(relevant_targets, 1):
-                    target_url = target_page['url']
-                    
-                    # Generate anchor text using the title if available
-                    title = target_page.get('title')
-                    content_type = target_page.get('content_type')
-                    
-                    anchor_text = generate_varied_anchor_text(
-                        target_url, 
-                        target_category,
-                        title,
-                        content_type
-                    )
-                    
-                    # Calculate relevance score (if enabled)
-                    relevance_score = 0.5  # Default medium relevance
-                    
-                    # Create link
-                    link = {
-                        'source_page': source_url,
-                        'target_page': target_url,
-                        'link_type': link_type,
-                        'anchor_text': anchor_text,
-                        'placement': placement,
-                        'priority': priority,
-                        'position': position if placement == 'featured_section' else '',
-                        'relevance_score': relevance_score
-                    }
-                    
-                    all_links.append(link)
-                    link_count += 1
-                    
-                    if link_count >= max_links:
-                        break
-                
-                if link_count >= max_links:
-                    break
-    
-    return all_links
+def discard_plan(entry):
+    """Delete the files of a plan dropped from the stage cache
 
-def test_patterns(test_url, url_patterns):
-    """Test a URL against the patterns and show which category it matches"""
-    components = extract_url_components(test_url)
-    category = categorize_page(components, url_patterns)
-    return category
+    The plan on screen keeps its files until another plan replaces it.
+    """
+    if isinstance(entry, dict) and 'plan_dir' in entry:
+        if entry['plan_dir'] == st.session_state.get('plan_dir'):
+            return
+        shutil.rmtree(entry['plan_dir'], ignore_errors=True)
 
 def main():
     try:
@@ -590,6 +114,11 @@ def main():
         if 'page' not in st.session_state:
             st.session_state.page = 'main'
         
+        # Stage results survive reruns, keyed on input contents and parameters
+        if 'stage_cache' not in st.session_state:
+            st.session_state.stage_cache = StageCache(on_evict=discard_plan)
+        stage_cache = st.session_state.stage_cache
+        
         st.title("🔗 MV Octopus Cross-linker")
         
         st.markdown("""
@@ -607,7 +136,10 @@ def main():
             )
             
             if data_source == "Upload CSV":
-                uploaded_file = st.file_uploader("Upload your sitemap CSV", type=["csv"])
+                uploaded_file = st.file_uploader("Upload your sitemap CSV (or a Parquet/Arrow page table)",
+                                                 type=["csv", "parquet", "pq", "arrow", "feather"])
+                indexable_only = st.checkbox("Only indexable pages", value=False,
+                                             help="Skip rows whose Indexability column is not 'Indexable'")
             elif data_source == "XML Sitemap URL":
                 sitemap_url = st.text_input("Enter XML sitemap URL", placeholder="https://example.com/sitemap.xml")
                 fetch_titles = st.checkbox("Fetch page titles (may slow down processing)", value=False)
@@ -624,52 +156,53 @@ def main():
             )
             
             # Default patterns based on website type
-            if site_type == "Real Estate":
-                default_pdp_pattern = r'[a-z]{2}/[a-z-]+/\d+'  # e.g., ca/los-angeles/123456-address
-                default_city_pattern = r'[a-z]{2}/[a-z-]+'  # e.g., ca/los-angeles
-                default_state_pattern = r'^[a-z]{2}$'  # e.g., ca
-                default_category_pattern = r'(coworking|metro-area)/'  # e.g., coworking/
-            elif site_type == "E-commerce":
-                default_pdp_pattern = r'product/[a-z0-9-]+'  # e.g., product/blue-t-shirt
-                default_city_pattern = r'shop/[a-z-]+'  # e.g., shop/mens-clothing
-                default_state_pattern = r'^shop$'  # e.g., shop
-                default_category_pattern = r'category/[a-z-]+'  # e.g., category/shirts
-            elif site_type == "Blog/Content":
-                default_pdp_pattern = r'blog/\d{4}/\d{2}/[a-z0-9-]+'  # e.g., blog/2023/01/article-title
-                default_city_pattern = r'blog/\d{4}/\d{2}'  # e.g., blog/2023/01
-                default_state_pattern = r'^blog$'  # e.g., blog
-                default_category_pattern = r'category/[a-z-]+'  # e.g., category/marketing
-            elif site_type == "Local Business":
-                default_pdp_pattern = r'services/[a-z0-9-]+'  # e.g., services/roof-repair
-                default_city_pattern = r'locations/[a-z-]+'  # e.g., locations/new-york
-                default_state_pattern = r'^locations$'  # e.g., locations
-                default_category_pattern = r'services$'  # e.g., services
-            else:  # Custom
-                default_pdp_pattern = r'products?/[a-z0-9-]+'
-                default_city_pattern = r'categor(y|ies)/[a-z-]+'
-                default_state_pattern = r'^(home|main|index)$'
-                default_category_pattern = r'collections?/[a-z-]+'
+            default_patterns = SITE_TYPE_PATTERNS[site_type]
             
             # Allow customization of patterns
-            pdp_pattern = st.text_input("Product/Detail Page Pattern (regex)", default_pdp_pattern)
-            city_plp_pattern = st.text_input("City/Primary Listing Page Pattern (regex)", default_city_pattern)
-            state_plp_pattern = st.text_input("State/Root Listing Page Pattern (regex)", default_state_pattern)
-            category_plp_pattern = st.text_input("Category Listing Page Pattern (regex)", default_category_pattern)
+            pdp_pattern = st.text_input("Product/Detail Page Pattern (regex)", default_patterns['pdp'])
+            city_plp_pattern = st.text_input("City/Primary Listing Page Pattern (regex)", default_patterns['city_plp'])
+            state_plp_pattern = st.text_input("State/Root Listing Page Pattern (regex)", default_patterns['state_plp'])
+            category_plp_pattern = st.text_input("Category Listing Page Pattern (regex)", default_patterns['category_plp'])
             
             # Advanced options
             with st.expander("Advanced Options"):
-                max_links = st.number_input("Maximum number of links to generate", min_value=10, max_value=10000, value=500)
+                max_links = st.number_input("Maximum number of links to generate", min_value=10, max_value=10000000, value=500)
+                allocation = st.selectbox("Link budget allocation", LINK_ALLOCATIONS,
+                                          help="'sequential' fills rules in order until the maximum is reached; "
+                                               "'weighted' splits it up front by rule priority")
+                per_source = st.checkbox("Spread each rule's budget evenly over its source pages", value=False)
+                inlinks_file = st.file_uploader("Existing internal links (optional)",
+                                                type=['csv', 'parquet', 'arrow', 'feather'],
+                                                help="A crawler 'All Inlinks' export; links the site already has "
+                                                     "are not recommended again")
                 use_content_similarity = st.checkbox("Enable content similarity analysis (experimental)", value=False)
+                workers = st.number_input("Worker processes", min_value=1, max_value=os.cpu_count() or 1, value=1,
+                                          help="Generate hierarchical links in parallel, one shard per first path segment")
                 balance_links = st.checkbox("Balance bidirectional links", value=True)
+                if balance_links:
+                    balance_ratio = st.number_input("Imbalanced above outgoing/incoming ratio", min_value=1.0, value=float(BALANCE_RATIO))
+                    balance_min_outgoing = st.number_input("...and more outgoing links than", min_value=0, value=BALANCE_MIN_OUTGOING)
                 
                 # If XML sitemap is selected and fetch titles is enable
 # If XML sitemap is selected and fetch titles is enabled
                 if data_source == "XML Sitemap URL" and fetch_titles:
-                    max_title_fetches = st.slider("Maximum pages to fetch titles for", 10, 200, 50)
+                    max_title_fetches = st.number_input("Maximum pages to fetch titles for", min_value=10, max_value=1000000, value=50)
+                    title_fetch_concurrency = st.slider("Concurrent title requests", 1, 128, 32)
+                    cache_titles = st.checkbox("Reuse titles cached by previous runs", value=True)
+                
+                # Inputs are reused until they change; this forces a fresh load and plan
+                if st.button("Clear cached results"):
+                    # Forgotten first, so the plan on screen is deleted with the rest
+                    st.session_state.pop('plan_path', None)
+                    st.session_state.pop('plan_dir', None)
+                    stage_cache.clear()
         
         # Main content area
         df = None
         
+        # Timings and counters of this run, kept with the plan it generates
+        run_report = RunReport()
+        
         # Create tabs for workflow stages
         tab1, tab2, tab3 = st.tabs(["1️⃣ Data Preparation", "2️⃣ Link Generation", "3️⃣ Analysis & Export"])
         
@@ -678,43 +211,69 @@ def main():
             if data_source == "Upload CSV" and uploaded_file is not None:
                 # Read CSV data
                 try:
-                    # Try to parse CSV
-                    df = pd.read_csv(uploaded_file)
+                    # Try to parse CSV, unless this file was read before
+                    input_format = infer_input_format(uploaded_file.name)
+                    input_key = content_key(input_format, uploaded_file.getvalue(), indexable_only)
+                    def load_upload():
+                        with run_report.span('load'):
+                            if input_format == 'csv':
+                                return load_csv(uploaded_file, indexable_only=indexable_only)
+                            return load_columnar(uploaded_file, input_format, indexable_only=indexable_only)
+                    df = stage_cache.get_or_compute('input', input_key, load_upload)
                     
                     # Show data preview
                     st.subheader("Data Preview")
                     st.dataframe(df.head())
-                    
-                    # Validate required columns
-                    required_column = 'Address'
-                    if required_column not in df.columns:
-                        st.error(f"CSV is missing required column: {required_column}")
-                        st.stop()
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
                 except Exception as e:
-                    st.error(f"Error processing CSV file: {e}")
+                    st.error(f"Error processing uploaded file: {e}")
                     st.code(traceback.format_exc())
                     st.stop()
                     
             elif data_source == "XML Sitemap URL" and sitemap_url:
                 try:
                     with st.spinner("Fetching XML sitemap..."):
-                        urls, error = parse_xml_sitemap(sitemap_url)
-                        
-                        if error:
-                            st.error(error)
+                        try:
+                            # Sitemap indexes are followed and .gz files decompressed as they stream
+                            input_key = content_key('sitemap', sitemap_url)
+                            def load_url():
+                                with run_report.span('load'):
+                                    return load_sitemap(sitemap_url, log=st.warning)
+                            df = stage_cache.get_or_compute('input', input_key, load_url)
+                        except ValueError as e:
+                            st.error(str(e))
                             st.stop()
                         
-                        if not urls:
-                            st.warning("No URLs found in the sitemap.")
-                            st.stop()
-                        
-                        # Convert to DataFrame
-                        df = pd.DataFrame(urls)
-                        
                         # Fetch page titles if requested
                         if fetch_titles:
-                            with st.spinner(f"Fetching page titles (max {max_title_fetches})..."):
-                                df = fetch_page_metadata(df, sample_size=max_title_fetches)
+                            input_key = content_key(input_key, 'titles', max_title_fetches, title_fetch_concurrency,
+                                                    cache_titles)
+                            def load_titles():
+                                with st.spinner(f"Fetching page titles (max {max_title_fetches})..."):
+                                    cache = PageMetadataCache() if cache_titles else None
+                                    try:
+                                        with run_report.span('fetch_titles'):
+                                            # A copy: the cached sitemap must not gain the titles
+                                            titled = fetch_page_metadata(
+                                                df.copy(),
+                                                max_workers=title_fetch_concurrency,
+                                                sample_size=max_title_fetches,
+                                                progress=streamlit_metadata_progress(),
+                                                cache=cache,
+                                                report=run_report
+                                            )
+                                    finally:
+                                        if cache is not None:
+                                            cache.close()
+                                    if cache is not None:
+                                        st.caption(
+                                            f"Title cache: {cache.stats['fresh'] + cache.stats['lastmod_unchanged']} reused, "
+                                            f"{cache.stats['revalidated']} revalidated, {cache.stats['fetched']} fetched"
+                                        )
+                                    return titled
+                            df = stage_cache.get_or_compute('input', input_key, load_titles)
                         
                         # Show data preview
                         st.subheader("Sitemap Data Preview")
@@ -729,18 +288,13 @@ def main():
             elif data_source == "Manual URL Entry" and url_input:
                 try:
                     # Process manually entered URLs
-                    urls = [url.strip() for url in url_input.strip().split('\n') if url.strip().startswith(('http://', 'https://'))]
+                    input_key = content_key('manual', url_input)
+                    df = stage_cache.get_or_compute('input', input_key, lambda: urls_from_text(url_input))
                     
-                    if not urls:
+                    if df.empty:
                         st.warning("No valid URLs found. Please enter URLs starting with http:// or https://")
                         st.stop()
                     
-                    # Convert to DataFrame
-                    df = pd.DataFrame({
-                        'Address': urls,
-                        'Status Code': 200  # Assume valid URLs
-                    })
-                    
                     # Show data preview
                     st.subheader("URL Data Preview")
                     st.dataframe(df.head())
@@ -766,58 +320,129 @@ def main():
                 
                 if st.button("Generate Cross-linking Plan"):
                     try:
-                        # Generate links
-                        links = generate_cross_links(
-                            df, 
-                            url_patterns, 
-                            max_links=max_links, 
-                            use_content_similarity=use_content_similarity,
-                            fetch_titles=(data_source != "XML Sitemap URL" or not fetch_titles)
-                        )
-                        
-                        if not links:
-                            st.warning("No links were generated. Check your URL patterns and make sure they match your data.")
-                            st.stop()
-                        
-                        # Convert links to DataFrame
-                        links_df = pd.DataFrame(links)
-                        
-                        # Apply link balancing if enabled
-                        if balance_links:
-                            with st.spinner("Balancing bidirectional links..."):
-                                # Identify pages with too many outgoing links
-                                outgoing_counts = links_df['source_page'].value_counts()
-                                incoming_counts = links_df['target_page'].value_counts()
+                        # Each stage is keyed on the key of its input plus its own settings
+                        fetch_sample_titles = (data_source != "XML Sitemap URL" or not fetch_titles)
+                        pages_key = content_key(input_key, url_patterns, fetch_sample_titles)
+                        inlinks_key = None
+                        if inlinks_file is not None:
+                            inlinks_key = content_key(inlinks_file.name, inlinks_file.getvalue())
+                        plan_key = content_key(pages_key, {
+                            'max_links': max_links,
+                            'allocation': allocation,
+                            'per_source': per_source,
+                            'existing_links': inlinks_key,
+                            'use_content_similarity': use_content_similarity,
+                            'workers': workers,
+                            'balance': [balance_ratio, balance_min_outgoing] if balance_links else None,
+                        })
+                        plan = stage_cache.get('plan', plan_key)
+                        
+                        if plan is not None:
+                            st.info("Nothing changed since this plan was generated; showing it again. "
+                                    "Use 'Clear cached results' for a fresh plan.")
+                        else:
+                            # Plans are written to disk chunk by chunk; the stage cache deletes them on eviction
+                            plan_dir = tempfile.mkdtemp(prefix='crosslinker-')
+                            extension = default_plan_extension()
+                            
+                            try:
+                                # Categorize and index the pages, unless the patterns and input are unchanged
+                                with st.spinner("Categorizing pages..."):
+                                    # A copy: fetching sample titles adds a column to the frame
+                                    pages = stage_cache.get_or_compute('pages', pages_key, lambda: prepare_pages(
+                                        df.copy(),
+                                        url_patterns,
+                                        fetch_titles=fetch_sample_titles,
+                                        log=st.write,
+                                        progress=StreamlitProgress(),
+                                        report=run_report
+                                    ))
+                                    def build_index():
+                                        with run_report.span('page_index'):
+                                            return SegmentPrefixIndex(pages)
+                                    page_index = stage_cache.get_or_compute('page_index', pages_key, build_index)
                                 
-                                # Find pages with imbalanced links (many outgoing, few incoming)
-                                imbalanced_pages = []
-                                for page, outgoing in outgoing_counts.items():
-                                    incoming = incoming_counts.get(page, 0)
-                                    if outgoing > incoming * 3 and outgoing > 5:  # Arbitrary threshold
-                                        imbalanced_pages.append(page)
+                                # Hashes of the site's current links, kept until another export is uploaded
+                                existing_links = None
+                                if inlinks_file is not None:
+                                    with st.spinner("Loading existing links..."):
+                                        def load_inlinks():
+                                            with run_report.span('existing_links'):
+                                                inlinks_file.seek(0)
+                                                return load_existing_links(inlinks_file, log=st.write)
+                                        existing_links = stage_cache.get_or_compute('existing_links', inlinks_key,
+                                                                                    load_inlinks)
                                 
-                                if imbalanced_pages:
-                                    st.info(f"Found {len(imbalanced_pages)} pages with imbalanced links. Adjusting link distribution...")
-                                    
-                                    # Reduce outgoing links from imbalanced pages
-                                    for page in imbalanced_pages:
-                                        # Keep high priority links, reduce lower priority ones
-                                        page_links = links_df[links_df['source_page'] == page]
-                                        low_priority_links = page_links[page_links['priority'] == 'low']
-                                        
-                                        if len(low_priority_links) > 0:
-                                            # Remove some low priority links
-                                            links_to_remove = low_priority_links.sample(min(len(low_priority_links), int(outgoing_counts[page] * 0.3)))
-                                            links_df = links_df.drop(links_to_remove.index)
-                        
-                        # Store links in session state for access in the next tab
-                        st.session_state['links_df'] = links_df
+                                # Generate links
+                                with st.spinner("Generating cross-links..."):
+                                    generated_path = os.path.join(plan_dir, 'generated' + extension)
+                                    link_count = write_link_chunks(iter_link_chunks(
+                                        df, 
+                                        url_patterns, 
+                                        max_links=max_links, 
+                                        use_content_similarity=use_content_similarity,
+                                        log=st.write,
+                                        progress=StreamlitProgress(),
+                                        pages=pages,
+                                        page_index=page_index,
+                                        workers=workers,
+                                        report=run_report,
+                                        allocation=allocation,
+                                        per_source=per_source,
+                                        existing_links=existing_links
+                                    ), generated_path, report=run_report)
+                                
+                                if not link_count:
+                                    st.warning("No links were generated. Check your URL patterns and make sure they match your data.")
+                                    st.stop()
+                                
+                                # Apply link balancing if enabled
+                                plan_path = generated_path
+                                if balance_links:
+                                    with st.spinner("Balancing bidirectional links..."):
+                                        plan_path = os.path.join(plan_dir, 'balanced' + extension)
+                                        balance_plan(generated_path, plan_path, log=st.info, ratio=balance_ratio,
+                                                     min_outgoing=balance_min_outgoing, report=run_report)
+                                
+                                with run_report.span('statistics'):
+                                    plan_stats = plan_statistics(plan_path)
+                                # Over every page, including those the plan never links, and from the
+                                # site's current links when they were uploaded
+                                with st.spinner("Analysing the link graph..."), run_report.span('graph'):
+                                    site_links = None
+                                    if inlinks_file is not None:
+                                        inlinks_file.seek(0)
+                                        site_links = iter_inlink_chunks(inlinks_file)
+                                    plan_graph = graph_metrics(pages['url'], iter_plan(plan_path, columns=['source_page', 'target_page']),
+                                                               existing_links=site_links)
+                                plan = {
+                                    'plan_key': plan_key,
+                                    'plan_dir': plan_dir,
+                                    'plan_path': plan_path,
+                                    'plan_stats': plan_stats,
+                                    'plan_graph': plan_graph,
+                                    'run_report': run_report,
+                                }
+                                stage_cache.put('plan', plan_key, plan)
+                            except BaseException:
+                                # Including Streamlit's stop and rerun, which interrupt the script
+                                shutil.rmtree(plan_dir, ignore_errors=True)
+                                raise
+                        
+                        # A plan evicted while on screen kept its files until now
+                        previous_dir = st.session_state.get('plan_dir')
+                        if (previous_dir not in (None, plan['plan_dir'])
+                                and ('plan', st.session_state.get('plan_key')) not in stage_cache):
+                            shutil.rmtree(previous_dir, ignore_errors=True)
+                        
+                        # Keep the plan's location and statistics, not the links, in the session
+                        st.session_state.update(plan)
                         
                         # Display results
-                        st.success(f"Successfully generated {len(links_df)} cross-linking recommendations")
+                        st.success(f"Successfully generated {st.session_state['plan_stats']['total']} cross-linking recommendations")
                         
                         # Show sample of links
-                        st.dataframe(links_df.head(10))
+                        st.dataframe(read_plan_head(st.session_state['plan_path'], 10))
                         
                         # Prompt to continue to analysis tab
                         st.info("Continue to the 'Analysis & Export' tab to explore the results and download your cross-linking plan.")
@@ -830,8 +455,16 @@ def main():
                 st.subheader("Analysis & Export")
                 
                 # Check if links have been generated
-                if 'links_df' in st.session_state:
-                    links_df = st.session_state['links_df']
+                if 'plan_path' in st.session_state and not os.path.exists(st.session_state['plan_path']):
+                    st.warning("The files of this plan are no longer available. Generate it again in the "
+                               "'Link Generation' tab.")
+                elif 'plan_path' in st.session_state:
+                    plan_path = st.session_state['plan_path']
+                    plan_dir = st.session_state['plan_dir']
+                    plan_stats = st.session_state['plan_stats']
+                    plan_graph = st.session_state['plan_graph']
+                    plan_report = st.session_state['run_report']
+                    plan_key = st.session_state['plan_key']
                     
                     # Summary statistics
                     st.write("### Summary Statistics")
@@ -839,40 +472,34 @@ def main():
                     col1, col2 = st.columns(2)
                     
                     with col1:
-                        st.write(f"**Total Links:** {len(links_df)}")
+                        st.write(f"**Total Links:** {plan_stats['total']}")
                         
                         # Source pages count
-                        source_pages_count = links_df['source_page'].nunique()
+                        source_pages_count = len(plan_stats['source_page'])
                         st.write(f"**Unique Source Pages:** {source_pages_count}")
                         
                         # Target pages count
-                        target_pages_count = links_df['target_page'].nunique()
+                        target_pages_count = len(plan_stats['target_page'])
                         st.write(f"**Unique Target Pages:** {target_pages_count}")
                     
                     with col2:
                         # Most linked-to pages
-                        top_targets = links_df['target_page'].value_counts().head(5)
+                        top_targets = plan_stats['target_page'].head(5)
                         st.write("**Top Target Pages:**")
                         for page, count in top_targets.items():
                             st.write(f"- {os.path.basename(page)}: {count} links")
                     
                     # Link types breakdown
-                    if 'link_type' in links_df.columns:
-                        st.write("### Links by Type")
-                        link_types = links_df['link_type'].value_counts()
-                        st.bar_chart(link_types)
+                    st.write("### Links by Type")
+                    st.bar_chart(plan_stats['link_type'])
                     
                     # Priority breakdown
-                    if 'priority' in links_df.columns:
-                        st.write("### Links by Priority")
-                        priority_counts = links_df['priority'].value_counts()
-                        st.bar_chart(priority_counts)
+                    st.write("### Links by Priority")
+                    st.bar_chart(plan_stats['priority'])
                     
                     # Placement breakdown
-                    if 'placement' in links_df.columns:
-                        st.write("### Links by Placement")
-                        placement_counts = links_df['placement'].value_counts()
-                        st.bar_chart(placement_counts)
+                    st.write("### Links by Placement")
+                    st.bar_chart(plan_stats['placement'])
                     
                     # Export options
                     st.write("### Export Options")
@@ -880,118 +507,103 @@ def main():
                     # Format selection
                     export_format = st.radio(
                         "Select export format",
-                        ["CSV", "Excel", "HTML Report"]
+                        ["CSV", "Excel", "HTML Report", "Parquet", "Arrow"]
                     )
                     
                     if export_format == "CSV":
-                        csv = links_df.to_csv(index=False)
-                        st.download_button(
-                            "Download Complete Cross-linking Plan (CSV)",
-                            csv,
-                            "cross_linking_plan.csv",
-                            "text/csv",
-                            key='download-csv'
-                        )
+                        # Serve the plan file itself rather than rendering it in memory
+                        csv_path = plan_path
+                        if infer_sink_format(plan_path) != 'csv':
+                            csv_path = os.path.join(plan_dir, 'cross_linking_plan.csv')
+                            if not os.path.exists(csv_path):
+                                with plan_report.span('export_csv'):
+                                    convert_plan(plan_path, csv_path)
+                        with open(csv_path, 'rb') as csv_file:
+                            st.download_button(
+                                "Download Complete Cross-linking Plan (CSV)",
+                                csv_file,
+                                "cross_linking_plan.csv",
+                                "text/csv",
+                                key='download-csv'
+                            )
                     elif export_format == "Excel":
-                        # Create Excel file in memory
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                            links_df.to_excel(writer, sheet_name='Cross-linking Plan', index=False)
-                            
-                            # Get workbook and worksheet objects
-                            workbook = writer.book
-                            worksheet = writer.sheets['Cross-linking Plan']
-                            
-                            # Add formats
-                            header_format = workbook.add_format({
-                                'bold': True,
-                                'bg_color': '#4CAF50',
-                                'color': 'white',
-                                'border': 1
-                            })
-                            
-                            # Format headers
-                            for col_num, value in enumerate(links_df.columns.values):
-                                worksheet.write(0, col_num, value, header_format)
-                                
-                            # Auto-adjust column widths
-                            for i, col in enumerate(links_df.columns):
-                                max_len = max(links_df[col].astype(str).apply(len).max(), len(col)) + 2
-                                worksheet.set_column(i, i, min(max_len, 50))
+                        # Streamed from the plan file into a workbook next to it, once per plan
+                        excel_path = os.path.join(plan_dir, 'cross_linking_plan.xlsx')
+                        if not os.path.exists(excel_path):
+                            with plan_report.span('export_excel'):
+                                write_excel(iter_plan(plan_path), excel_path)
+                        with open(excel_path, 'rb') as excel_file:
+                            st.download_button(
+                                "Download Complete Cross-linking Plan (Excel)",
+                                excel_file,
+                                "cross_linking_plan.xlsx",
+                                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                key='download-excel'
+                            )
+                    elif export_format == "HTML Report":
+                        # Every link, paginated into static pages and zipped, once per plan
+                        report_path = os.path.join(plan_dir, 'cross_linking_report.zip')
+                        if not os.path.exists(report_path):
+                            with plan_report.span('export_html'):
+                                write_html_report(iter_plan(plan_path), report_path, statistics=plan_stats)
+                        with open(report_path, 'rb') as report_file:
+                            st.download_button(
+                                "Download HTML Report (zip)",
+                                report_file,
+                                "cross_linking_report.zip",
+                                "application/zip",
+                                key='download-html'
+                            )
+                    else:  # Parquet or Arrow, with categorical URL and label columns
+                        sink_format = export_format.lower()
+                        export_path = os.path.join(plan_dir, f'cross_linking_plan.{sink_format}')
+                        try:
+                            if not os.path.exists(export_path):
+                                with plan_report.span(f'export_{sink_format}'):
+                                    convert_plan(plan_path, export_path, sink_format, categorical=True)
+                        except ImportError as e:
+                            st.error(str(e))
+                        else:
+                            with open(export_path, 'rb') as export_file:
+                                st.download_button(
+                                    f"Download Complete Cross-linking Plan ({export_format})",
+                                    export_file,
+                                    os.path.basename(export_path),
+                                    "application/vnd.apache.parquet" if sink_format == 'parquet'
+                                    else "application/vnd.apache.arrow.file",
+                                    key=f'download-{sink_format}'
+                                )
+                    
+                    # Where the run spent its time, exports included
+                    with st.expander("Run Report"):
+                        tables = report_tables(plan_report)
                         
-                        excel_data = output.getvalue()
-                        st.download_button(
-                            "Download Complete Cross-linking Plan (Excel)",
-                            excel_data,
-                            "cross_linking_plan.xlsx",
-                            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            key='download-excel'
-                        )
-                    else:  # HTML Report
-                        # Create HTML report
-                        html_buffer = io.StringIO()
-                        html_buffer.write(f"""
-                        <!DOCTYPE html>
-                        <html>
-                        <head>
-                            <title>Cross-linking Plan</title>
-                            <style>
-                                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                                h1, h2 {{ color: #2C3E50; }}
-                                table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
-                                th {{ background-color: #4CAF50; color: white; text-align: left; padding: 8px; }}
-                                td {{ border: 1px solid #ddd; padding: 8px; }}
-                                tr:nth-child(even) {{ background-color: #f2f2f2; }}
-                                .summary {{ background-color: #f9f9f9; padding: 15px; border-radius: 5px; margin-bottom: 20px; }}
-                                .footer {{ margin-top: 30px; font-size: 12px; color: #777; }}
-                            </style>
-                        </head>
-                        <body>
-                            <h1>Cross-linking Plan</h1>
-                            <div class="summary">
-                                <h2>Summary</h2>
-                                <p>Total Links: {len(links_df)}</p>
-                                <p>Unique Source Pages: {links_df['source_page'].nunique()}</p>
-                                <p>Unique Target Pages: {links_df['target_page'].nunique()}</p>
-                                <p>Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}</p>
-                            </div>
-                            
-                            <h2>Cross-linking Plan</h2>
-                            <table>
-                                <tr>
-                        """)
+                        st.write("#### Stage Timings (seconds)")
+                        st.dataframe(tables['spans'])
                         
-                        # Add table headers
-                        for col in links_df.columns:
-                            html_buffer.write(f"<th>{col}</th>")
-                        html_buffer.write("</tr>")
+                        if not tables['rules'].empty:
+                            st.write("#### Linking Rules")
+                            st.dataframe(tables['rules'])
                         
-                        # Add table rows (limit to 1000 rows for browser performance)
-                        for _, row in links_df.head(1000).iterrows():
-                            html_buffer.write("<tr>")
-                            for col in links_df.columns:
-                                html_buffer.write(f"<td>{row[col]}</td>")
-                            html_buffer.write("</tr>")
+                        if not tables['categories'].empty:
+                            st.write("#### Pages by Category")
+                            st.bar_chart(tables['categories'])
                         
-                        # Close table and add footer
-                        html_buffer.write("""
-                            </table>
-                            
-                            <div class="footer">
-                                <p>Generated by MV Cross-linking Generator</p>
-                            </div>
-                        </body>
-                        </html>
-                        """)
+                        for name, counts in tables['histograms'].items():
+                            st.write(f"#### {name} (seconds)")
+                            st.bar_chart(counts)
+                        
+                        st.write("#### Counters")
+                        st.dataframe(tables['counters'])
                         
-                        html_report = html_buffer.getvalue()
                         st.download_button(
-                            "Download HTML Report",
-                            html_report,
-                            "cross_linking_report.html",
-                            "text/html",
-                            key='download-html'
+                            "Download Run Report (JSON)",
+                            plan_report.to_json(),
+                            "run_report.json",
+                            "application/json",
+                            key='download-report'
                         )
+                    
 # Implementation guide
                     with st.expander("Implementation Guide"):
                         st.markdown("""
@@ -1023,8 +635,8 @@ def main():
                         st.markdown("### Link Distribution Analysis")
                         
                         # Calculate link distribution metrics
-                        out_degree = links_df['source_page'].value_counts()
-                        in_degree = links_df['target_page'].value_counts()
+                        out_degree = plan_stats['source_page']
+                        in_degree = plan_stats['target_page']
                         
                         # Pages with most outgoing links
                         st.write("#### Pages with Most Outgoing Links")
@@ -1036,17 +648,30 @@ def main():
                         st.dataframe(in_degree.head(10).reset_index().rename(
                             columns={'index': 'Page', 'target_page': 'Incoming Links'}))
                         
-                        # Pages with no incoming links
-                        pages_with_no_incoming = set(links_df['source_page'].unique()) - set(links_df['target_page'].unique())
-                        if pages_with_no_incoming:
-                            st.write(f"#### {len(pages_with_no_incoming)} Pages with No Incoming Links (sample):")
-                            st.write(", ".join(list(pages_with_no_incoming)[:5]))
+                        # Site-wide link graph of all pages with the plan's links, and without
+                        # them when the site's current links were uploaded
+                        st.markdown("### Link Graph")
+                        summary = graph_summary(plan_graph).rename(columns={'before': 'Current site',
+                                                                             'after': 'With the plan'})
+                        if not plan_graph['out_links_before'].any():
+                            summary = summary[['With the plan']]
+                        st.dataframe(summary)
+                        
+                        # Highest PageRank once the plan is in place
+                        st.write("#### Pages with the Highest PageRank")
+                        st.dataframe(plan_graph.nlargest(10, 'pagerank')[['pagerank', 'in_links', 'click_depth']])
+                        
+                        # Pages with no incoming links, including pages the plan never mentions
+                        orphans = plan_graph.index[plan_graph['orphan'].to_numpy()]
+                        if len(orphans):
+                            st.write(f"#### {len(orphans)} Pages with No Incoming Links (sample):")
+                            st.write(", ".join(orphans[:5]))
                         
                         # Pages with no outgoing links
-                        pages_with_no_outgoing = set(links_df['target_page'].unique()) - set(links_df['source_page'].unique())
-                        if pages_with_no_outgoing:
-                            st.write(f"#### {len(pages_with_no_outgoing)} Pages with No Outgoing Links (sample):")
-                            st.write(", ".join(list(pages_with_no_outgoing)[:5]))
+                        dead_ends = plan_graph.index[(plan_graph['out_links'] == 0).to_numpy()]
+                        if len(dead_ends):
+                            st.write(f"#### {len(dead_ends)} Pages with No Outgoing Links (sample):")
+                            st.write(", ".join(dead_ends[:5]))
                 
                 else:
                     st.info("Please generate a cross-linking plan first in the 'Link Generation' tab.")